@@ -2,10 +2,13 @@ from datetime import datetime
 from datetime import timedelta
 import logging
 from copy import copy
-from typing import Optional
+from functools import wraps
+from typing import Callable, Optional
 import json
+import sys
+from lxml import etree as et
 
-from pam.location import Location
+from pam.location import Location, _set_slots_state
 from pam.plot import plans as plot
 import pam.utils as utils
 import pam.variables
@@ -13,7 +16,20 @@ from pam import PAMInvalidStartTimeError, PAMInvalidTimeSequenceError, PAMSequen
 from pam.variables import END_OF_DAY
 
 
+def _modifies_plan(method):
+    """
+    Decorate Plan methods that modify the plan, marking it as dirty.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.dirty = True
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
 class Plan:
+    # set by methods modifying the plan, see pam.core.Person.dirty
+    dirty = False
 
     def __init__(
         self,
@@ -35,6 +51,13 @@ class Plan:
         self.plan_freq = freq
         self.score = None
 
+    def matsim_state(self) -> tuple:
+        """
+        Snapshot of the plan as written to MATSim xml, compared to detect modifications (including
+        direct changes to plan components), see pam.core.Person.dirty.
+        """
+        return self.score, [component.matsim_state() for component in self.day]
+
     @property
     def home(self):
         if self.home_location.exists:
@@ -195,6 +218,7 @@ class Plan:
                 return True
         return False
 
+    @_modifies_plan
     def add(self, p):
         """
         Safely add a new component to the plan.
@@ -352,6 +376,7 @@ class Plan:
 
     # fixing methods
 
+    @_modifies_plan
     def fix(self, crop=True, times=True, locations=True):
         if crop:
             self.crop()
@@ -360,6 +385,7 @@ class Plan:
         if locations:
             self.fix_location_consistency()
 
+    @_modifies_plan
     def crop(self):
         """
         Crop a plan to end of day (END_OF_DAY). Plan components that start after this
@@ -392,6 +418,7 @@ class Plan:
             self.day.pop(-1)
             self.day[-1].end_time = pam.variables.END_OF_DAY
 
+    @_modifies_plan
     def fix_time_consistency(self):
         """
         Force plan component time consistency.
@@ -399,6 +426,7 @@ class Plan:
         for i in range(self.length - 1):
             self.day[i+1].start_time = self.day[i].end_time
 
+    @_modifies_plan
     def fix_location_consistency(self):
         """
         Force plan locations consistency by adjusting leg locations.
@@ -449,92 +477,41 @@ class Plan:
 
         return candidates
 
+    @_modifies_plan
     def infer_activities_from_tour_purpose(self):
         """
         Infer and set activity types based on trip purpose. Algorithm works like breadth first search,
         initiated from inferred home locations. Search takes place in two stages, first pass forward,
         the backward. The next activity type is set based on the trip purpose. Pass forward is exhausted
         first, because it's assumed that this is how the diary is originally filled in.
-        """
-        #find home activities
-        home_idxs = self.infer_activity_idxs(target=self.home)
-        for idx in home_idxs:
-            self.day[idx].act = 'home'
-
-        area_map = {}
-        remaining = set(range(0, self.length, 2)) - set(home_idxs)
-
-        # forward traverse
-        queue = [idx+2 for idx in home_idxs if idx+2 < self.length]  # add next act idxs to queue\
-        last_act = None
-
-        while queue:  # traverse from home
-            idx = queue.pop()
-
-            if self.day[idx].act is None:
-                act = self.day[idx-1].purp.lower()
-                location = str(self.day[idx].location.min)
-
-                if act == last_act and location in area_map:
-                    act = area_map[location]
-
-                self.day[idx].act = act
-                remaining -= {idx}
-                last_act = act
-                area_map[location] = act
-
-                if idx+2 in remaining:
-                    queue.append(idx+2)
-
-        queue = []
-        for location, activity in area_map.items():
-            candidates = self.infer_activity_idxs(target=Location(area=location), default=False)
-            for idx in candidates:
-                if idx in remaining:
-                    self.day[idx].act = activity
-                    remaining -= {idx}
-                    if idx+2 in remaining:
-                        queue.append(idx+2)
-
-        while queue:
-            idx = queue.pop()
-
-            if self.day[idx].act is None:
-                act = self.day[idx-1].purp.lower()
-                location = self.day[idx].location.min
-
-                if act == last_act and location in area_map:
-                    act = area_map[location]
-
-                self.day[idx].act = act
-                remaining -= {idx}
-                last_act = act
-                area_map[location] = act
-
-                if idx+2 < self.length:
-                    queue.append(idx+2)
-
-        # backward traverse
-        queue = list(remaining)  # add next act idxs to queue
-
-        while queue:  # traverse from home
-            idx = queue.pop()
-
-            if self.day[idx].act is None:
-                act = self.day[idx+1].purp.lower()
-                location = self.day[idx].location.min
-
-                if act == last_act and location in area_map:
-                    act = area_map[location]
-
-                self.day[idx].act = act
-                remaining -= {idx}
-                last_act = act
-                area_map[location] = act
+        See infer_tour_activities.
+        """
+        activities = self.day[0::2]
+        legs = self.day[1::2]
+        acts = [activity.act for activity in activities]
+        try:
+            infer_tour_activities(
+                acts=acts,
+                purposes=[leg.purp for leg in legs],
+                locations=[activity.location for activity in activities],
+                leg_locations=[(leg.start_location, leg.end_location) for leg in legs],
+                duration=lambda i: activities[i].duration,
+                home=self.home,
+            )
+        finally:
+            for activity, act in zip(activities, acts):
+                activity.act = act
 
-                if idx-2 >= 0:
-                    queue.append(idx-2)
+    def set_int_times(self, int_times: bool = True):
+        """
+        Set the time representation of all plan components, see PlanComponent.set_int_times.
+        :param int_times: bool, store times as integer seconds since START_OF_DAY, default True
+        """
+        for component in self.day:
+            if component.int_times != int_times:
+                component.set_int_times(int_times)
 
+    @_modifies_plan
     def finalise_activity_end_times(self):
         """
         Add activity end times based on start time of next activity.
@@ -544,6 +521,7 @@ class Plan:
                 self.day[seq].end_time = self.day[seq+1].start_time
         self.day[-1].end_time = pam.variables.END_OF_DAY
 
+    @_modifies_plan
     def set_leg_purposes(self):
         """
         Set leg purposes to destination activity.
@@ -557,6 +535,7 @@ class Plan:
                         self.day[seq].purp = act
                         break
 
+    @_modifies_plan
     def autocomplete_matsim(self):
         """
         complete leg start and end locations
@@ -566,6 +545,7 @@ class Plan:
                 self.day[seq].start_location = self.day[seq-1].location
                 self.day[seq].end_location = self.day[seq+1].location
 
+    @_modifies_plan
     def clear(self):
         self.day = []
 
@@ -573,6 +553,7 @@ class Plan:
         for seq, component in enumerate(self):
             print(f"{seq}:\t{component}")
 
+    @_modifies_plan
     def remove_activity(self, seq):
         """
         Remove an activity from plan at given seq. Does not remove adjacent legs
@@ -614,6 +595,7 @@ class Plan:
             self.day.pop(seq)
             return seq-2, seq+1
 
+    @_modifies_plan
     def move_activity(self, seq, default='home', new_mode='walk'):
         """
         Changes Activity location and associated journeys
@@ -644,6 +626,7 @@ class Plan:
             self.day[seq + 1].start_location = new_location
             self.mode_shift(seq + 1, new_mode)
 
+    @_modifies_plan
     def fill_plan(self, idx_start, idx_end, default='home'):
         """
         Fill a plan after Activity has been removed. Plan is filled between given remaining
@@ -720,6 +703,7 @@ class Plan:
         self.join_activities(idx_start, idx_end)
         return True
 
+    @_modifies_plan
     def expand(self, pivot_idx):
         """
         Fill plan by expanding a pivot activity.
@@ -738,6 +722,7 @@ class Plan:
 
         self.day[pivot_idx].end_time = new_time  # expand pivot
 
+    @_modifies_plan
     def join_activities(self, idx_start, idx_end):
         """
         Join together two Activities with new Leg, expand last home activity.
@@ -760,6 +745,7 @@ class Plan:
 
         self.expand(pivot_idx)
 
+    @_modifies_plan
     def combine_matching_activities(self, idx_start, idx_end):
         """
         Combine two given activities into same activity, remove surplus Legs
@@ -772,6 +758,7 @@ class Plan:
         self.day.pop(idx_end - 1)  # remove subsequent leg
         self.day.pop(idx_start + 1)  # remove proceeding leg
 
+    @_modifies_plan
     def combine_wrapped_activities(self, idx_start, idx_end):
         """
         Combine two given activities that will wrap around day, remove surplus Legs
@@ -786,6 +773,7 @@ class Plan:
         self.day.pop(idx_start + 1)  # remove proceeding leg
         self.day.pop(idx_end - 1)  # remove subsequent leg
 
+    @_modifies_plan
     def stay_at_home(self):
         self.logger.debug(f" stay_at_home, location:{self.home}")
         self.day = [
@@ -798,6 +786,7 @@ class Plan:
             )
         ]
 
+    @_modifies_plan
     def simplify_pt_trips(self):
         """
         Remove pt interaction events (resulting from complex matsim plans), simplify legs
@@ -832,6 +821,7 @@ class Plan:
 
         return home_duration
 
+    @_modifies_plan
     def mode_shift(self, seq, new_mode='walk', mode_speed = {'car':37, 'bus':10, 'walk':4, 'cycle': 14, 'pt':23, 'rail':37}, update_duration = False):
         """
         Changes mode for a leg, along with any legs in the same tour.
@@ -877,6 +867,7 @@ class Plan:
                 self.day[-1].end_time = END_OF_DAY
 
 
+    @_modifies_plan
     def change_duration(self, seq, shift_duration):
         """
         Change the duration of a leg and shift subsequent activities/legs forward
@@ -913,15 +904,304 @@ class Plan:
                     return tour
 
 
+def infer_tour_activities(
+    acts: list,
+    purposes: list,
+    locations: list,
+    leg_locations: list,
+    duration: Callable,
+    home: Location,
+) -> list:
+    """
+    Infer activity types of a plan from tour purposes, as per Plan.infer_activities_from_tour_purpose,
+    given as lists of activity and leg values, so that plans (or population arrays, see
+    pam.frame.PopulationFrame.infer_activities_from_tour_purpose) can be inferred without building
+    plans. Activities at each location are found using an index of activity (and same location leg)
+    positions by area, built once per plan, so that inference is linear in plan length.
+    :param acts: list, activity types, None where unknown, updated in place
+    :param purposes: list, leg purposes
+    :param locations: list, activity Locations
+    :param leg_locations: list, leg (start, end) Locations
+    :param duration: function returning the duration of activity i (only called when required)
+    :param home: Location, home location
+    :return: list, activity types
+    """
+    return _TourActivities(acts, purposes, locations, leg_locations, duration).infer(home)
+
+
+class _TourActivities:
+    """
+    Tour purpose activity inference (see infer_tour_activities). Positions (idx) are plan
+    positions, so that activity i is at 2 * i and leg i at 2 * i + 1.
+    """
+
+    def __init__(self, acts, purposes, locations, leg_locations, duration) -> None:
+        self.acts = acts
+        self.purposes = purposes
+        self.locations = locations
+        self.leg_locations = leg_locations
+        self.duration = duration
+        self.length = 2 * len(acts) - 1
+        self.same_location_legs = None  # indices of legs starting and ending at the same location
+        self.area_legs = None
+        self.area_acts = None
+
+    def closed(self) -> bool:
+        return self.locations[0] == self.locations[-1] and self.acts[0] == self.acts[-1]
+
+    def closed_duration(self, idx: int):
+        if self.closed() and (idx == 0 or idx == self.length - 1):
+            return self.duration(0) + self.duration(len(self.acts) - 1)
+        return self.duration(idx // 2)
+
+    def exclude(self, exclude: set, i: int) -> None:
+        """
+        Exclude the shorter activity either side of leg i, which starts and ends at a target location.
+        """
+        prev_act_idx = 2 * i
+        next_act_idx = prev_act_idx + 2
+        if self.closed_duration(prev_act_idx) > self.closed_duration(next_act_idx):
+            exclude.add(next_act_idx)
+        else:
+            exclude.add(prev_act_idx)
+
+    def infer_idxs(self, target: Location) -> set:
+        """
+        Infer idxs of activities at target location, as per Plan.infer_activity_idxs.
+        """
+        exclude = set()
+        self.same_location_legs = []
+        for i, (start, end) in enumerate(self.leg_locations):
+            if start == end:
+                self.same_location_legs.append(i)
+                if end == target:
+                    self.exclude(exclude, i)
+
+        candidates = set()
+        for i, location in enumerate(self.locations):
+            if location == target and (i * 2) not in exclude:
+                candidates.add(i * 2)
+
+        if not candidates:  # assume first activity (and last if closed)
+            if self.closed():
+                return set([0, self.length - 1])
+            return set([0])
+        return candidates
+
+    def area_idxs(self, area) -> set:
+        """
+        Infer idxs of activities in area, as per Plan.infer_activity_idxs(target=Location(area=area),
+        default=False), using an index of activities and same location legs by area (built after
+        infer_idxs has found same location legs).
+        """
+        if self.area_acts is None:
+            self.area_legs = _index_areas(
+                self.leg_locations[i][1] for i in self.same_location_legs
+            )
+            self.area_acts = _index_areas(self.locations)
+
+        exclude = set()
+        for i in self.area_legs.get(area, []):
+            self.exclude(exclude, self.same_location_legs[i])
+
+        candidates = set()
+        for i in self.area_acts.get(area, []):
+            if (i * 2) not in exclude:
+                candidates.add(i * 2)
+        return candidates
+
+    def infer(self, home: Location) -> list:
+        acts = self.acts
+        purposes = self.purposes
+
+        #find home activities
+        home_idxs = self.infer_idxs(target=home)
+        for idx in home_idxs:
+            acts[idx // 2] = 'home'
+
+        area_map = {}
+        remaining = set(range(0, self.length, 2)) - set(home_idxs)
+
+        # forward traverse
+        queue = [idx+2 for idx in home_idxs if idx+2 < self.length]  # add next act idxs to queue
+        last_act = None
+
+        while queue:  # traverse from home
+            idx = queue.pop()
+
+            if acts[idx // 2] is None:
+                act = purposes[idx // 2 - 1].lower()
+                location = str(self.locations[idx // 2].min)
+
+                if act == last_act and location in area_map:
+                    act = area_map[location]
+
+                acts[idx // 2] = act
+                remaining -= {idx}
+                last_act = act
+                area_map[location] = act
+
+                if idx+2 in remaining:
+                    queue.append(idx+2)
+
+        queue = []
+        for location, activity in area_map.items():
+            for idx in self.area_idxs(location):
+                if idx in remaining:
+                    acts[idx // 2] = activity
+                    remaining -= {idx}
+                    if idx+2 in remaining:
+                        queue.append(idx+2)
+
+        while queue:
+            idx = queue.pop()
+
+            if acts[idx // 2] is None:
+                act = purposes[idx // 2 - 1].lower()
+                location = self.locations[idx // 2].min
+
+                if act == last_act and location in area_map:
+                    act = area_map[location]
+
+                acts[idx // 2] = act
+                remaining -= {idx}
+                last_act = act
+                area_map[location] = act
+
+                if idx+2 < self.length:
+                    queue.append(idx+2)
+
+        # backward traverse
+        queue = list(remaining)  # add next act idxs to queue
+
+        while queue:  # traverse from home
+            idx = queue.pop()
+
+            if acts[idx // 2] is None:
+                act = purposes[idx // 2].lower()
+                location = self.locations[idx // 2].min
+
+                if act == last_act and location in area_map:
+                    act = area_map[location]
+
+                acts[idx // 2] = act
+                remaining -= {idx}
+                last_act = act
+                area_map[location] = act
+
+                if idx-2 >= 0:
+                    queue.append(idx-2)
+
+        return acts
+
+
+def _index_areas(locations) -> dict:
+    """
+    Positions of locations by area. Locations without an area cannot be compared to an area.
+    """
+    index = {}
+    for i, location in enumerate(locations):
+        if location.area is None:
+            raise UserWarning(
+                "Cannot check for location equality without same loc types (areas/locs/links)."
+            )
+        index.setdefault(location.area, []).append(i)
+    return index
+
+
 class PlanComponent:
+    """
+    Base for plan activities and legs. Times are stored as datetimes, or optionally as integer
+    seconds since START_OF_DAY (see set_int_times). Either way start_time, end_time and duration
+    return datetimes and timedeltas, whereas start_s, end_s and duration_s return integer seconds.
+    """
+    # next and previous are only set when linking plan components, see pam.operations.cropping.link_plan
+    __slots__ = ('seq', '_start_time', '_end_time', '_int_times', 'freq', 'next', 'previous')
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):  # pickled before __slots__, with public datetime times
+            state = dict(state)
+            state['_start_time'] = state.pop('start_time', None)
+            state['_end_time'] = state.pop('end_time', None)
+            state.setdefault('_int_times', False)
+        _set_slots_state(self, state)
+
+    @property
+    def int_times(self) -> bool:
+        return self._int_times
+
+    def set_int_times(self, int_times: bool = True) -> None:
+        """
+        Set the time representation, converting existing times.
+        :param int_times: bool, store times as integer seconds since START_OF_DAY, default True
+        """
+        start_time, end_time = self.start_time, self.end_time
+        self._int_times = int_times
+        self.start_time = start_time
+        self.end_time = end_time
+
+    def _to_internal_time(self, time):
+        if time is None:
+            return None
+        if self._int_times:
+            if type(time) is int:
+                return time
+            if isinstance(time, datetime):
+                return utils.datetime_to_seconds(time)
+            return int(time)
+        if isinstance(time, datetime):
+            return time
+        return utils.seconds_to_datetime(time)
+
+    @property
+    def start_time(self):
+        if self._int_times and self._start_time is not None:
+            return utils.seconds_to_datetime(self._start_time)
+        return self._start_time
+
+    @start_time.setter
+    def start_time(self, time):
+        self._start_time = self._to_internal_time(time)
+
+    @property
+    def end_time(self):
+        if self._int_times and self._end_time is not None:
+            return utils.seconds_to_datetime(self._end_time)
+        return self._end_time
+
+    @end_time.setter
+    def end_time(self, time):
+        self._end_time = self._to_internal_time(time)
+
+    @property
+    def start_s(self):
+        if self._int_times or self._start_time is None:
+            return self._start_time
+        return utils.datetime_to_seconds(self._start_time)
+
+    @property
+    def end_s(self):
+        if self._int_times or self._end_time is None:
+            return self._end_time
+        return utils.datetime_to_seconds(self._end_time)
 
     @property
     def duration(self):
-        return self.end_time - self.start_time
+        if self._int_times:
+            return timedelta(seconds=self._end_time - self._start_time)
+        return self._end_time - self._start_time
+
+    @property
+    def duration_s(self):
+        if self._int_times:
+            return self._end_time - self._start_time
+        return utils.td_to_s(self._end_time - self._start_time)
 
     @property
     def hours(self):
-        return pam.utils.timedelta_to_hours(self.end_time - self.start_time)
+        if self._int_times:
+            return (self._end_time - self._start_time) / 3600
+        return pam.utils.timedelta_to_hours(self._end_time - self._start_time)
 
     def shift_start_time(self, new_start_time):
         """
@@ -961,7 +1241,12 @@ class PlanComponent:
         return self.end_time
 
 
+def _is_seconds(time) -> bool:
+    return time is not None and not isinstance(time, datetime)
+
+
 class Activity(PlanComponent):
+    __slots__ = ('act', 'location', 'next_act', 'previous_act')
 
     def __init__(
             self,
@@ -977,6 +1262,7 @@ class Activity(PlanComponent):
         self.seq = seq
         self.act = act
         self.location = Location(loc=loc, link=link, area=area)
+        self._int_times = _is_seconds(start_time) or _is_seconds(end_time)
         self.start_time = start_time
         self.end_time = end_time
         self.freq=freq
@@ -1002,6 +1288,14 @@ class Activity(PlanComponent):
                 return True
         return False
 
+    def matsim_state(self) -> tuple:
+        """
+        Snapshot of the activity as written to MATSim xml, see Plan.matsim_state.
+        """
+        return (
+            self.act, self._start_time, self._end_time, self._int_times, self.location.link, self.location.loc
+        )
+
     def validate_matsim(self) -> None:
         """Checks if activity has required fields for a valid matsim plan."""
         if self.act is None:
@@ -1013,6 +1307,10 @@ class Activity(PlanComponent):
 
 
 class Leg(PlanComponent):
+    __slots__ = (
+        'purp', 'mode', 'start_location', 'end_location', '_distance', 'attributes', 'route',
+        'start_hour', 'next_leg', 'previous_leg'
+    )
     act = 'travel'
 
     def __init__(
@@ -1030,7 +1328,7 @@ class Leg(PlanComponent):
             distance=None,
             purp=None,
             freq=None,
-            attributes={},
+            attributes=None,
             route=None,
     ):
         self.seq = seq
@@ -1038,16 +1336,29 @@ class Leg(PlanComponent):
         self.mode = mode
         self.start_location = Location(loc=start_loc, link=start_link, area=start_area)
         self.end_location = Location(loc=end_loc, link=end_link, area=end_area)
+        self._int_times = _is_seconds(start_time) or _is_seconds(end_time)
         self.start_time = start_time
         self.end_time = end_time
         self.freq = freq
         self._distance = distance
-        # relevant for simulated plans
-        self.attributes = attributes
+        # relevant for simulated plans, legs without attributes or routes share immutable empty ones
+        if attributes is not None:
+            self.attributes = attributes
+        else:
+            self.attributes = EMPTY_ATTRIBUTES
         if route is not None:
             self.route = route
         else:
-            self.route = Route()
+            self.route = EMPTY_ROUTE
+
+    def matsim_state(self) -> tuple:
+        """
+        Snapshot of the leg as written to MATSim xml, see Plan.matsim_state.
+        """
+        return (
+            self.mode, self._start_time, self._end_time, self._int_times,
+            dict(self.attributes) if self.attributes else None, self.route.matsim_state()
+        )
 
     def __str__(self):
         return f"Leg(mode:{self.mode}, area:{self.start_location} --> " \
@@ -1099,6 +1410,13 @@ class Leg(PlanComponent):
             return utils.matsim_time_to_datetime(time)
         return None
 
+    @property
+    def boarding_s(self):
+        time = self.route.transit.get("boardingTime")
+        if time is not None:
+            return utils.matsim_time_to_seconds(time)
+        return None
+
     @property
     def network_route(self):
         return self.route.network_route
@@ -1106,23 +1424,122 @@ class Leg(PlanComponent):
 
 class Route:
     """
-    xml element wrapper for leg routes, in the simplest case of a leg with no route, this will behave as an empty dictionary.
+    Leg route parsed from a MATSim route xml element. Routes are detached from the xml tree, holding only
+    route attributes, network routes as tuples of (interned) link ids, and other route descriptions (such
+    as transit json) as strings that are parsed on access.
+    In the simplest case of a leg with no route, this will behave as an empty dictionary.
     For routed legs this provides some convenience properties such as is_transit, and transit_route.
     """
+    __slots__ = (
+        '_exists', 'type', 'start_link', 'end_link', 'trav_time', '_distance', 'vehicle_ref_id', 'extra',
+        'links', 'description'
+    )
 
     def __init__(self, xml_elem=None) -> None:
+        self.clear()
         if xml_elem:
-            self.xml = xml_elem[0]
+            self.load(xml_elem[0])
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):  # pickled before __slots__, only routes without xml could be pickled
+            self.clear()
+            return
+        _set_slots_state(self, state)
+
+    def matsim_state(self) -> tuple:
+        """
+        Snapshot of the route as written to MATSim xml, see Plan.matsim_state.
+        """
+        return (
+            self._exists, self.type, self.start_link, self.end_link, self.trav_time, self._distance,
+            self.vehicle_ref_id, dict(self.extra) if self.extra else None, self.links, self.description
+        )
+
+    def clear(self) -> None:
+        """
+        Remove all route information, ie make route empty.
+        """
+        self._exists = False
+        self.type = None
+        self.start_link = None
+        self.end_link = None
+        self.trav_time = None
+        self._distance = None
+        self.vehicle_ref_id = None
+        self.extra = None
+        self.links = ()
+        self.description = None
+
+    def load(self, elem) -> None:
+        """
+        Set route from a MATSim route xml element.
+        """
+        self.set(dict(elem.attrib), elem.text)
+
+    def set(self, attributes: dict, text: Optional[str] = None) -> None:
+        """
+        Set route from MATSim route xml attributes and text.
+        """
+        attributes = dict(attributes)
+        self._exists = True
+        self.type = _intern(attributes.pop("type", None))
+        self.start_link = _intern(attributes.pop("start_link", None))
+        self.end_link = _intern(attributes.pop("end_link", None))
+        self.trav_time = attributes.pop("trav_time", None)
+        self._distance = attributes.pop("distance", None)
+        self.vehicle_ref_id = attributes.pop("vehicleRefId", None)
+        self.extra = attributes or None
+        if self.type == "links" and text:
+            self.links = tuple(sys.intern(link) for link in text.split())
         else:
-            self.xml = {}  # this allows an empty route to behave as an empty dict
+            self.description = text
 
     @property
     def exists(self) -> bool:
-        return not isinstance(self.xml, dict)
+        return self._exists
+
+    @property
+    def attrib(self) -> dict:
+        """
+        Route xml attributes.
+        """
+        attrib = {}
+        for key, value in (
+            ("type", self.type),
+            ("start_link", self.start_link),
+            ("end_link", self.end_link),
+            ("trav_time", self.trav_time),
+            ("distance", self._distance),
+            ("vehicleRefId", self.vehicle_ref_id),
+        ):
+            if value is not None:
+                attrib[key] = value
+        if self.extra:
+            attrib.update(self.extra)
+        return attrib
+
+    @property
+    def text(self) -> Optional[str]:
+        if self.links:
+            return " ".join(self.links)
+        return self.description
 
     @property
-    def type(self):
-        return self.xml.get("type", None)
+    def xml(self):
+        """
+        Route as a new MATSim route xml element, or an empty dict if there is no route.
+        """
+        if not self.exists:
+            return {}
+        elem = et.Element("route", self.attrib)
+        elem.text = self.text
+        return elem
+
+    @xml.setter
+    def xml(self, elem) -> None:
+        self.clear()
+        if not isinstance(elem, dict):
+            self.load(elem)
 
     @property
     def is_transit(self) -> bool:
@@ -1139,32 +1556,32 @@ class Route:
     @property
     def network_route(self) -> list:
         if self.is_routed:
-            return self.xml.text.split(" ")
+            return list(self.links)
         return []
 
     @property
     def transit(self) -> dict:
         if self.is_transit:
-            return json.loads(self.xml.text.strip())
+            return json.loads(self.description.strip())
         return {}
 
     def get(self, key, default=None) -> str:
-        return self.xml.get(key, default)
+        return self.attrib.get(key, default)
 
     def __getitem__(self, key):
-        return self.xml[key]
+        return self.attrib[key]
 
     @property
     def distance(self) -> float:
-        distance = self.get("distance")
-        if distance is not None:
-            return float(distance)
+        if self._distance is not None:
+            return float(self._distance)
         return None
 
 
 class RouteV11(Route):
+    __slots__ = ()
 
-    def __init__(self, xml_elem) -> None:
+    def __init__(self, xml_elem=None) -> None:
         super().__init__(xml_elem)
 
     @property
@@ -1175,7 +1592,7 @@ class RouteV11(Route):
     @property
     def transit(self) -> dict:
         if self.is_transit:
-            pt_details = self.xml.text.split('===')
+            pt_details = self.description.split('===')
             return {
                 "accessFacilityId": pt_details[1],
                 "transitLineId": pt_details[2],
@@ -1185,5 +1602,59 @@ class RouteV11(Route):
         return {}
 
 
+class _EmptyRoute(Route):
+    """
+    Shared empty route, used by default for legs without a route. Cannot be loaded with a route,
+    assign a new Route to the leg instead.
+    """
+    __slots__ = ()
+
+    def load(self, elem) -> None:
+        raise TypeError("Cannot modify the shared empty route, assign a new Route to the leg instead.")
+
+    def set(self, attributes: dict, text: Optional[str] = None) -> None:
+        raise TypeError("Cannot modify the shared empty route, assign a new Route to the leg instead.")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return 'EMPTY_ROUTE'
+
+
+class _EmptyAttributes(dict):
+    """
+    Shared immutable empty leg attributes, used by default for legs without attributes.
+    """
+    __slots__ = ()
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Cannot modify shared empty leg attributes, assign a new dict to the leg instead.")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return 'EMPTY_ATTRIBUTES'
+
+
+EMPTY_ROUTE = _EmptyRoute()
+EMPTY_ATTRIBUTES = _EmptyAttributes()
+
+
+def _intern(string: Optional[str]) -> Optional[str]:
+    if string is None:
+        return None
+    return sys.intern(string)
+
+
 class Trip(Leg):
-    pass
+    __slots__ = ()
@@ -1,7 +1,6 @@
 import numpy as np
 
 from pam.activity import Plan
-from pam.utils import td_to_s
 
 
 def plan_to_one_hot(
@@ -31,10 +30,10 @@ def plan_to_one_hot(
     encoded = np.zeros((bins,len(mapping)))
 
     start_bin = 0
-    reference_time = plan.day[0].start_time
+    reference_time = plan.day[0].start_s
     for component in plan.day:
         index = mapping.get(component.act, None)
-        end_bin = round(td_to_s(component.end_time - reference_time) / bin_size)
+        end_bin = round((component.end_s - reference_time) / bin_size)
 
         if end_bin >= duration:  # deal with last component
             end_bin = duration
@@ -96,7 +95,7 @@ class PlansToCategorical():
 
         encoded = np.zeros((self.bins))
         start_bin = 0
-        reference_time = plan.day[0].start_time
+        reference_time = plan.day[0].start_s
         for component in plan.day:
             act = component.act
             if act not in self.act_to_index:
@@ -104,7 +103,7 @@ class PlansToCategorical():
                 self.act_to_index[act] = index
                 self.index_to_act[index] = act
             index = self.act_to_index[act]
-            end_bin = round(td_to_s(component.end_time - reference_time) / self.bin_size)
+            end_bin = round((component.end_s - reference_time) / self.bin_size)
 
             if end_bin >= self.duration:  # deal with last component
                 end_bin = self.duration
@@ -1,7 +1,8 @@
 import click
 import logging
 from pathlib import Path
-from typing import Optional, List
+from typing import Callable, Optional, List
+from xml.sax.saxutils import escape
 import os
 from rich.progress import track
 from rich.console import Console
@@ -10,7 +11,7 @@ import geopandas as gp
 from pam.operations.cropping import simplify_population
 from pam.operations.combine import pop_combine
 from pam.samplers import population as population_sampler
-from pam import read, write
+from pam import read, write, utils
 from pam.report.summary import pretty_print_summary, print_summary
 from pam.report.stringify import stringify_plans
 from pam.report.benchmarks import benchmarks as bms
@@ -84,6 +85,40 @@ def comment_option(func):
     )(func)
     return func
 
+
+def rewrite_persons(
+    path_population_input: str,
+    outfile: write.Writer,
+    update: Callable,
+    source_filter: Optional[Callable[[bytes], bool]] = None,
+    pass_through: bool = True,
+    **config
+):
+    """
+    Rewrite the persons of MATSim plans, applying update to each, a function of a core.Person that
+    returns True if the person was modified. With pass_through (version 12 plans only) unmodified
+    persons are copied from the input as is, and persons whose raw xml fails source_filter are copied
+    without being parsed, rather than re-serialising every person.
+    config is passed to read.matsim.stream_matsim_persons.
+    """
+    if not pass_through or config.get('version', 12) != 12:
+        for person in read.matsim.stream_matsim_persons(path_population_input, **config):
+            update(person)
+            outfile.add_person(person)
+        return None
+
+    keep_non_selected = config.get('keep_non_selected', False)
+    for _, source in read.matsim.stream_person_sources(path_population_input):
+        if source_filter is not None and not source_filter(source) and \
+                (keep_non_selected or not utils.has_non_selected_plan(source)):
+            outfile.add_source(source)
+            continue
+        person = read.matsim.parse_matsim_person_source(source, **config)
+        if update(person):
+            person.mark_dirty()
+        outfile.add_person(person)
+
+
 @click.version_option()
 @click.group()
 def cli():
@@ -611,15 +646,32 @@ def wipe_all_links(
         logger.debug(f"Loading attributes from {path_population_input}")
         attributes = read.matsim.load_attributes_map(path_population_input)
 
+    def wipe(person):
+        for activity in person.activities:
+            activity.location.link = None
+        for plan in person.plans_non_selected:
+            for activity in plan.activities:
+                activity.location.link = None
+        return True
+
+    # persons are only parsed and re-serialised if they mention links, unless plans are changed on read
+    pass_through = not (simplify_pt_trips or crop or not leg_attributes)
+
     with Console().status("[bold orange]Wiping all links from population...", spinner='aesthetic') as _:
         with write.Writer(
             path=path_population_output,
             household_key=None,
             comment=comment,
             keep_non_selected=keep_non_selected,
+            fast=True,
+            pass_through=pass_through,
         ) as outfile:
-            for person in read.matsim.stream_matsim_persons(
+            rewrite_persons(
                 path_population_input,
+                outfile,
+                update=wipe,
+                source_filter=lambda source: b"link=" in source or b"<route" in source,
+                pass_through=pass_through,
                 attributes=attributes,
                 weight=1,
                 version=matsim_version,
@@ -629,13 +681,7 @@ def wipe_all_links(
                 keep_non_selected=keep_non_selected,
                 leg_attributes=leg_attributes,
                 leg_route=False,
-            ):
-                for activity in person.activities:
-                    activity.location.link = None
-                for plan in person.plans_non_selected:
-                    for activity in plan.activities:
-                        activity.location.link = None
-                outfile.add_person(person)
+            )
 
     logger.info('Population wipe complete')
     logger.info(f'Output saved at {path_population_output}')
@@ -717,15 +763,39 @@ def wipe_links(
             if act.location.link in links:
                 return True
 
+    def wipe(person):
+        wiped = False
+        for plan in [person.plan] + person.plans_non_selected:
+            if plan_filter(plan):
+                for leg in plan.legs:
+                    leg.route.clear()
+                for activity in plan.activities:
+                    activity.location.link = None
+                wiped = True
+        return wiped
+
+    # persons whose xml does not mention the links are copied without being parsed
+    patterns = {
+        value.encode("utf-8") for link in links for value in [link, escape(link), escape(link, {'"': "&quot;"})]
+    }
+
+    pass_through = not (simplify_pt_trips or crop or not leg_attributes)
+
     with Console().status("[bold orange]Wiping selected links from population...", spinner='aesthetic') as _:
         with write.Writer(
             path=path_population_output,
             household_key=None,
             comment=comment,
             keep_non_selected=keep_non_selected,
+            fast=True,
+            pass_through=pass_through,
         ) as outfile:
-            for person in read.matsim.stream_matsim_persons(
+            rewrite_persons(
                 path_population_input,
+                outfile,
+                update=wipe,
+                source_filter=lambda source: any(pattern in source for pattern in patterns),
+                pass_through=pass_through,
                 attributes=attributes,
                 weight=1,
                 version=matsim_version,
@@ -735,21 +805,7 @@ def wipe_links(
                 keep_non_selected=keep_non_selected,
                 leg_attributes=leg_attributes,
                 leg_route=True,
-            ):
-                if plan_filter(person.plan):
-                    for leg in person.legs:
-                        leg.route.xml = {}
-                    for activity in person.activities:
-                        activity.location.link = None
-
-                for plan in person.plans_non_selected:
-                    if plan_filter(plan):
-                        for leg in plan.legs:
-                            leg.route.xml = {}
-                        for activity in plan.activities:
-                            activity.location.link = None
-
-                outfile.add_person(person)
+            )
 
     logger.info('Population wipe complete')
     logger.info(f'Output saved at {path_population_output}')
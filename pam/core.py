@@ -12,7 +12,8 @@ import pam.plot as plot
 from pam import PAMInvalidTimeSequenceError, write
 from pam import PAMSequenceValidationError, PAMTimesValidationError, PAMValidationLocationsError, PAMVehicleIdError
 from pam import variables
-from pam.vehicle import Vehicle, ElectricVehicle
+from pam.vehicle import Vehicle, ElectricVehicle, VehicleRegistry
+from pam.frequencies import FrequencyTables
 
 
 class Population:
@@ -21,13 +22,15 @@ class Population:
         self.name = name
         self.logger = logging.getLogger(__name__)
         self.households = {}
+        self._vehicle_registry = VehicleRegistry()
+        self._frequencies = FrequencyTables()
 
     def add(self, target):
         if isinstance(target, list):
             for hh in target:
                 self.add(hh)
         elif isinstance(target, Household):
-            self.households[target.hid] = target
+            self._replace_household(target.hid, target)
         elif isinstance(target, Person):
             self.logger.warning((
                 "Directly adding a Person to a Population requires a Household.",
@@ -156,19 +159,16 @@ class Population:
 
     @property
     def has_vehicles(self):
-        return bool(list(self.vehicles()))
+        return bool(self.vehicle_registry.num_vehicles)
 
     @property
     def has_electric_vehicles(self):
-        return bool(list(self.electric_vehicles()))
+        return bool(self.vehicle_registry.num_electric_vehicles)
 
     @property
     def has_uniquely_indexed_vehicle_types(self):
         # checks indexing of vehicle types in population
-        vehicle_types = self.vehicle_types()
-        all_vehicle_type_ids = [vt.id for vt in vehicle_types]
-        unique_vehicle_type_ids = set(all_vehicle_type_ids)
-        return len(all_vehicle_type_ids) == len(unique_vehicle_type_ids)
+        return self.vehicle_registry.has_uniquely_indexed_vehicle_types
 
     def vehicles(self):
         for _, _, p in self.people():
@@ -182,9 +182,7 @@ class Population:
                 yield v
 
     def vehicle_types(self):
-        v_types = {p.vehicle.vehicle_type for _, _,
-                   p in self.people() if p.vehicle is not None}
-        for vt in v_types:
+        for vt in self.vehicle_registry.vehicle_types:
             yield vt
 
     def electric_vehicle_charger_types(self):
@@ -219,6 +217,15 @@ class Population:
             'num_legs': num_legs,
         }
 
+    def to_frame(self):
+        """
+        Columnar copy of population for fast reporting, see pam.frame.PopulationFrame. Later changes
+        to the population are not reflected in the frame.
+        :return: pam.frame.PopulationFrame
+        """
+        from pam.frame import PopulationFrame
+        return PopulationFrame.from_population(self)
+
     def legs_df(self) -> pd.DataFrame:
         """
         Extract tabular record of population legs.
@@ -373,6 +380,13 @@ class Population:
         with open(path, 'wb') as file:
             pickle.dump(self, file)
 
+    def save_snapshot(self, path: str, compression: Optional[str] = 'zlib'):
+        """
+        Write population to a binary snapshot, faster and more compact than pickle and readable by
+        later versions of pam, see pam.write.save_snapshot and pam.read.load_snapshot.
+        """
+        write.save_snapshot(self, path, compression=compression)
+
     def to_csv(
         self,
         dir: str,
@@ -392,18 +406,100 @@ class Population:
             "Note that this method requires all identifiers from populations being combined to be unique.")
         if isinstance(other, Population):
             for hid, hh in other.households.items():
-                self.households[hid] = copy.deepcopy(hh)
+                self._replace_household(hid, copy.deepcopy(hh))
             return self
         if isinstance(other, Household):
-            self.households[other.hid] = copy.deepcopy(other)
+            self._replace_household(other.hid, copy.deepcopy(other))
             return self
         if isinstance(other, Person):
-            self.households[other.pid] = Household(other.pid)
-            self.households[other.pid].people[other.pid] = copy.deepcopy(other)
+            hh = Household(other.pid)
+            hh.people[other.pid] = copy.deepcopy(other)
+            self._replace_household(other.pid, hh)
             return self
         raise TypeError(
             f"Object for addition must be a Population Household or Person object, not {type(other)}")
 
+    def _replace_household(self, hid, household):
+        """
+        Add (or replace) household, keeping the vehicle registry and frequency tables up to date.
+        """
+        if hid in self.households:
+            self.households[hid]._set_vehicle_registry(None)
+            self.households[hid]._set_frequencies(None)
+        household._set_vehicle_registry(self.vehicle_registry)
+        household._set_frequencies(self.frequencies)
+        self.households[hid] = household
+
+    @property
+    def vehicle_registry(self) -> VehicleRegistry:
+        """
+        Counts of vehicles and vehicle types in the population (see pam.vehicle.VehicleRegistry),
+        maintained as households are added (Population.add, += and readers), persons are added to
+        households (Household.add) and vehicles are assigned (Person.assign_vehicle). After adding or
+        removing households or persons directly (eg del population.households[hid]) rebuild it using
+        rebuild_vehicle_registry.
+        """
+        if self._vehicle_registry is None:
+            self.rebuild_vehicle_registry()
+        return self._vehicle_registry
+
+    def rebuild_vehicle_registry(self) -> None:
+        """
+        Rebuild the vehicle registry by scanning all persons in the population.
+        """
+        registry = VehicleRegistry()
+        for _, household in self:
+            household._set_vehicle_registry(registry)
+        self._vehicle_registry = registry
+
+    @property
+    def frequencies(self) -> FrequencyTables:
+        """
+        Counts of activity types, modes and purposes of the selected plans in the population (see
+        pam.frequencies.FrequencyTables), maintained as households are added (Population.add, +=
+        and readers) and persons are added to households (Household.add). After modifying plans in
+        place (eg by policies or cropping) mark the modified households for recounting using
+        refresh_frequencies. After adding or removing households directly (eg
+        del population.households[hid]) rebuild the tables using rebuild_frequencies.
+        """
+        if self._frequencies is None:
+            self.rebuild_frequencies()
+        return self._frequencies
+
+    def refresh_frequencies(self, hids: Optional[list] = None) -> None:
+        """
+        Recount the given households (all households by default) when the frequency tables are
+        next read. Value codes are kept.
+        :param hids: optional list of household ids
+        """
+        if self._frequencies is None:
+            return
+        households = self.households.values() if hids is None else (self.households[hid] for hid in hids)
+        for household in households:
+            self._frequencies.add(household)
+
+    def rebuild_frequencies(self) -> None:
+        """
+        Rebuild the frequency tables (and value codes) for all households in the population.
+        Households are counted when the tables are next read.
+        """
+        tables = FrequencyTables()
+        for _, household in self:
+            household._set_frequencies(tables)
+        self._frequencies = tables
+
+    def __getstate__(self):
+        # the vehicle registry and frequency tables are rebuilt when first used
+        state = self.__dict__.copy()
+        state['_vehicle_registry'] = None
+        state['_frequencies'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._vehicle_registry = None
+        self._frequencies = None
+
     def reindex(self, prefix: str):
         """
         Safely reindex all household and person identifiers in population using a prefix.
@@ -584,6 +680,10 @@ class Population:
 
 class Household:
     logger = logging.getLogger(__name__)
+    # vehicle registry and frequency tables of population, see Population.vehicle_registry and
+    # Population.frequencies
+    _vehicle_registry = None
+    _frequencies = None
 
     def __init__(
         self,
@@ -612,11 +712,38 @@ class Household:
             for p in person:
                 self.add(p)
         elif isinstance(person, Person):
-            self.people[person.pid] = person
+            self._set_person(person.pid, person)
         else:
             raise UserWarning(
                 f"Expected instance of Person, not: {type(person)}")
 
+    def _set_person(self, pid, person):
+        if self._vehicle_registry is not None:
+            if pid in self.people:
+                self.people[pid]._set_vehicle_registry(None)
+            person._set_vehicle_registry(self._vehicle_registry)
+        self.people[pid] = person
+        if self._frequencies is not None:
+            self._frequencies.add(self)
+
+    def _set_vehicle_registry(self, registry: Optional[VehicleRegistry]):
+        self._vehicle_registry = registry
+        for person in self.people.values():
+            person._set_vehicle_registry(registry)
+
+    def _set_frequencies(self, tables: Optional[FrequencyTables]):
+        if self._frequencies is not None:
+            self._frequencies.remove(self)
+        self._frequencies = tables
+        if tables is not None:
+            tables.add(self)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_vehicle_registry', None)
+        state.pop('_frequencies', None)
+        return state
+
     def get(self, pid, default=None):
         return self.people.get(pid, default)
 
@@ -852,10 +979,10 @@ class Household:
             "Note that this method requires all identifiers from populations being combined to be unique.")
         if isinstance(other, Household):
             for pid, person in other.people.items():
-                self.people[pid] = copy.deepcopy(person)
+                self._set_person(pid, copy.deepcopy(person))
             return self
         if isinstance(other, Person):
-            self.people[other.pid] = copy.deepcopy(other)
+            self._set_person(other.pid, copy.deepcopy(other))
             return self
         raise TypeError(
             f"Object for addition must be a Household or Person object, not {type(other)}")
@@ -881,6 +1008,12 @@ class Household:
 
 class Person:
     logger = logging.getLogger(__name__)
+    # original MATSim xml of person and state when last marked clean, see set_source and dirty
+    source = None
+    _clean = None
+    _vehicle = None
+    # vehicle registry of population, see Population.vehicle_registry
+    _vehicle_registry = None
 
     def __init__(
         self,
@@ -934,6 +1067,79 @@ class Person:
                 f'Vehicle with ID: {vehicle.id} does not match Person ID: {self.pid}')
         self.vehicle = vehicle
 
+    @property
+    def vehicle(self) -> Optional[Vehicle]:
+        return self._vehicle
+
+    @vehicle.setter
+    def vehicle(self, vehicle: Optional[Vehicle]):
+        if self._vehicle_registry is not None:
+            self._vehicle_registry.replace(self._vehicle, vehicle)
+        self._vehicle = vehicle
+
+    def _set_vehicle_registry(self, registry: Optional[VehicleRegistry]):
+        if self._vehicle_registry is not None:
+            self._vehicle_registry.remove(self._vehicle)
+        if registry is not None:
+            registry.add(self._vehicle)
+        self._vehicle_registry = registry
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_vehicle_registry', None)
+        return state
+
+    def __setstate__(self, state):
+        if 'vehicle' in state:  # pickled before vehicle was a property
+            state['_vehicle'] = state.pop('vehicle')
+        self.__dict__.update(state)
+
+    def set_source(self, source: bytes) -> None:
+        """
+        Keep the original (MATSim xml) source of person, which pam.write.matsim.Writer copies in
+        place of serialising the person, unless it has since been modified (see dirty).
+        :param source: bytes, xml of person element
+        """
+        self.source = source
+        self.mark_clean()
+
+    def mark_clean(self) -> None:
+        """
+        Mark person (and plans) as unmodified, ie as matching its source.
+        """
+        plans = [self.plan] + self.plans_non_selected
+        self._clean = (
+            self.pid, dict(self.attributes), self.vehicle, plans, [plan.matsim_state() for plan in plans]
+        )
+        for plan in plans:
+            plan.dirty = False
+
+    def mark_dirty(self) -> None:
+        """
+        Mark person as modified, so that it is serialised rather than copied from its source.
+        """
+        self._clean = None
+
+    @property
+    def dirty(self) -> bool:
+        """
+        Check if person has been modified since it was marked clean (when read with its source), or
+        has no source. Tracks changes to the person id, attributes, vehicle and plans, including direct
+        changes to plan components, by comparing them to their state when marked clean (see
+        activity.Plan.matsim_state).
+        """
+        if self.source is None or self._clean is None:
+            return True
+        pid, attributes, vehicle, plans, states = self._clean
+        if self.pid != pid or self.vehicle is not vehicle or self.attributes != attributes:
+            return True
+        if self.plan is not plans[0] or len(self.plans_non_selected) != len(plans) - 1 or \
+                any(a is not b for a, b in zip(self.plans_non_selected, plans[1:])):
+            return True
+        if any(plan.dirty for plan in plans):
+            return True
+        return any(plan.matsim_state() != state for plan, state in zip(plans, states))
+
     @property
     def av_trip_freq(self):
         if not self.num_legs:
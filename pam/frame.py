@@ -0,0 +1,584 @@
+import copy
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point
+
+import pam.core as core
+from pam.activity import Activity, Leg, infer_tour_activities
+from pam.location import Location
+import pam.utils as utils
+from pam.variables import START_OF_DAY
+
+
+HOUSEHOLD_COLUMNS = ['hid', 'freq', 'hh_freq', 'area', 'x', 'y', 'attributes']
+PERSON_COLUMNS = [
+    'pid', 'hid', 'household', 'freq', 'person_freq', 'hzone', 'home_area', 'home_link', 'home_x',
+    'home_y', 'score', 'attributes', 'vehicle'
+]
+ACTIVITY_COLUMNS = ['person', 'seq', 'act', 'area', 'link', 'x', 'y', 'start_s', 'end_s', 'freq']
+LEG_COLUMNS = [
+    'person', 'seq', 'mode', 'purp', 'start_area', 'end_area', 'start_link', 'end_link', 'start_x',
+    'start_y', 'end_x', 'end_y', 'start_s', 'end_s', 'distance', 'freq', 'attributes', 'route'
+]
+CATEGORICAL_COLUMNS = ['act', 'mode', 'purp']
+IGNORED_TRIP_ACTIVITIES = ["pt interaction", "pt_interaction"]
+
+
+class PopulationFrame:
+    """
+    Columnar (struct of arrays) representation of the selected plans of a core.Population, for
+    fast population wide reporting.
+
+    Households, persons, activities and legs are held as DataFrames of numpy columns. Activities
+    and legs reference their person by row position ('person') and are stored contiguously per
+    person, so that the plan of person i is given by the offset arrays, ie
+    activities[activity_offsets[i]:activity_offsets[i + 1]]. Times are integer seconds since
+    START_OF_DAY. Activity types, modes and purposes are categoricals. Leg attributes and routes,
+    and person attributes and vehicles are kept as python objects so that conversion back to a
+    core.Population is lossless (excepting non-selected plans).
+
+    A frame is an export (copy) of a population, not its backing store: the core.Population object
+    graph remains the working representation, edits to either are not reflected in the other, and
+    to_population builds a new population (sharing no mutable state with the frame).
+
+    For example:
+    `frame = PopulationFrame.from_population(population)
+    frame.stats
+    frame.trips_df()
+    population = frame.to_population()
+    `
+    """
+
+    def __init__(
+        self,
+        households: pd.DataFrame,
+        persons: pd.DataFrame,
+        activities: pd.DataFrame,
+        legs: pd.DataFrame,
+        name: Optional[str] = None,
+    ) -> None:
+        self.households = households
+        self.persons = persons
+        self.activities = activities
+        self.legs = legs
+        self.name = name
+        self.activity_offsets = _offsets(activities.person.to_numpy(), len(persons))
+        self.leg_offsets = _offsets(legs.person.to_numpy(), len(persons))
+
+    def __len__(self):
+        return len(self.persons)
+
+    def __str__(self):
+        return f"PopulationFrame: {len(self.persons)} people in {len(self.households)} households."
+
+    @classmethod
+    def from_population(cls, population: core.Population) -> "PopulationFrame":
+        """
+        Build frame from the selected plans of a core.Population.
+        :param population: core.Population
+        :return: PopulationFrame
+        """
+        households = {k: [] for k in HOUSEHOLD_COLUMNS}
+        coords = _Coordinates()
+        persons = {k: [] for k in PERSON_COLUMNS}
+        activities = {k: [] for k in ACTIVITY_COLUMNS}
+        legs = {k: [] for k in LEG_COLUMNS}
+
+        for h, (hid, household) in enumerate(population.households.items()):
+            location = household._location
+            households['hid'].append(hid)
+            households['freq'].append(household.freq)
+            households['hh_freq'].append(household.hh_freq)
+            households['area'].append(location.area)
+            x, y = coords(location.loc)
+            households['x'].append(x)
+            households['y'].append(y)
+            households['attributes'].append(household.attributes)
+
+            for pid, person in household.people.items():
+                p = len(persons['pid'])
+                home = person.home_location
+                persons['pid'].append(pid)
+                persons['hid'].append(hid)
+                persons['household'].append(h)
+                persons['freq'].append(person.freq)
+                persons['person_freq'].append(person.person_freq)
+                persons['hzone'].append(_home_area(person))
+                persons['home_area'].append(home.area)
+                persons['home_link'].append(home.link)
+                x, y = coords(home.loc)
+                persons['home_x'].append(x)
+                persons['home_y'].append(y)
+                persons['score'].append(person.plan.score)
+                persons['attributes'].append(person.attributes)
+                persons['vehicle'].append(person.vehicle)
+
+                for component in person.plan.day:
+                    if isinstance(component, Leg):
+                        start, end = component.start_location, component.end_location
+                        legs['person'].append(p)
+                        legs['seq'].append(component.seq)
+                        legs['mode'].append(component.mode)
+                        legs['purp'].append(component.purp)
+                        legs['start_area'].append(start.area)
+                        legs['end_area'].append(end.area)
+                        legs['start_link'].append(start.link)
+                        legs['end_link'].append(end.link)
+                        x, y = coords(start.loc)
+                        legs['start_x'].append(x)
+                        legs['start_y'].append(y)
+                        x, y = coords(end.loc)
+                        legs['end_x'].append(x)
+                        legs['end_y'].append(y)
+                        legs['start_s'].append(component.start_s)
+                        legs['end_s'].append(component.end_s)
+                        legs['distance'].append(component._distance)
+                        legs['freq'].append(component.freq)
+                        legs['attributes'].append(component.attributes)
+                        legs['route'].append(component.route)
+                    else:
+                        location = component.location
+                        activities['person'].append(p)
+                        activities['seq'].append(component.seq)
+                        activities['act'].append(component.act)
+                        activities['area'].append(location.area)
+                        activities['link'].append(location.link)
+                        x, y = coords(location.loc)
+                        activities['x'].append(x)
+                        activities['y'].append(y)
+                        activities['start_s'].append(component.start_s)
+                        activities['end_s'].append(component.end_s)
+                        activities['freq'].append(component.freq)
+
+        return cls(
+            households=_to_frame(households, HOUSEHOLD_COLUMNS, numeric=['freq', 'hh_freq', 'x', 'y']),
+            persons=_to_frame(
+                persons, PERSON_COLUMNS, numeric=['freq', 'person_freq', 'home_x', 'home_y', 'score']
+            ),
+            activities=_to_frame(activities, ACTIVITY_COLUMNS, numeric=['x', 'y', 'start_s', 'end_s']),
+            legs=_to_frame(
+                legs, LEG_COLUMNS, numeric=['start_x', 'start_y', 'end_x', 'end_y', 'start_s', 'end_s', 'distance']
+            ),
+            name=population.name,
+        )
+
+    def to_population(
+        self, int_times: bool = False, population: Optional[core.Population] = None
+    ) -> core.Population:
+        """
+        Build a core.Population from frame, or add the households of frame to an existing population.
+        Attributes and routes are copied, so that the population does not share them with the frame
+        (or the population the frame was built from).
+        :param int_times: bool, store plan times as integer seconds, default False
+        :param population: {core.Population, None}, optionally add households to this population
+        :return: core.Population
+        """
+        if population is None:
+            population = core.Population(name=self.name)
+        point = _Points()
+        households = []
+        for hid, hh_freq, area, x, y, attributes in zip(
+            self.households.hid, _values(self.households.hh_freq), self.households.area,
+            _values(self.households.x), _values(self.households.y), self.households.attributes
+        ):
+            households.append(
+                core.Household(hid, attributes=dict(attributes), freq=hh_freq, area=area, loc=point(x, y))
+            )
+
+        activities = list(zip(*(_values(self.activities[k]) for k in ACTIVITY_COLUMNS[1:])))
+        legs = list(zip(*(_values(self.legs[k]) for k in LEG_COLUMNS[1:-2]), *_copied_leg_columns(self.legs)))
+        to_time = (lambda s: s) if int_times else utils.seconds_to_datetime
+        persons = self.persons
+        for p, (pid, h, person_freq, home_area, home_link, home_x, home_y, score, attributes, vehicle) in enumerate(zip(
+            persons.pid, persons.household, _values(persons.person_freq), persons.home_area,
+            persons.home_link, _values(persons.home_x), _values(persons.home_y), _values(persons.score),
+            persons.attributes, persons.vehicle
+        )):
+            person = core.Person(pid, freq=person_freq, attributes=dict(attributes))
+            person.home_location.area = home_area
+            person.home_location.link = home_link
+            person.home_location.loc = point(home_x, home_y)
+            person.vehicle = vehicle
+            person.plan.score = score
+            day = person.plan.day
+            leg_records = legs[self.leg_offsets[p]:self.leg_offsets[p + 1]]
+            for i, (seq, act, area, link, x, y, start_s, end_s, freq) in enumerate(
+                activities[self.activity_offsets[p]:self.activity_offsets[p + 1]]
+            ):
+                if i:
+                    day.append(_leg(*leg_records[i - 1], to_time=to_time, point=point))
+                day.append(
+                    Activity(
+                        seq=seq, act=act, area=area, link=link, loc=point(x, y),
+                        start_time=_time(start_s, to_time), end_time=_time(end_s, to_time), freq=freq,
+                    )
+                )
+            households[h].add(person)
+
+        for household in households:
+            population.add(household)
+        return population
+
+    def infer_activities_from_tour_purpose(self) -> None:
+        """
+        Infer and set activity types of all plans from leg (tour) purposes, as per
+        core.Plan.infer_activities_from_tour_purpose, from the activity and leg arrays.
+        """
+        point = _Points()
+        acts = _values(self.activities.act)
+        activities = self.activities
+        locations = [
+            Location(area=area, link=link, loc=point(x, y)) for area, link, x, y in zip(
+                activities.area, activities.link, _values(activities.x), _values(activities.y)
+            )
+        ]
+        start_s, end_s = _values(activities.start_s), _values(activities.end_s)
+        legs = self.legs
+        purposes = _values(legs.purp)
+        leg_locations = [
+            (Location(area=start_area, link=start_link, loc=point(start_x, start_y)),
+             Location(area=end_area, link=end_link, loc=point(end_x, end_y)))
+            for start_area, start_link, start_x, start_y, end_area, end_link, end_x, end_y in zip(
+                legs.start_area, legs.start_link, _values(legs.start_x), _values(legs.start_y),
+                legs.end_area, legs.end_link, _values(legs.end_x), _values(legs.end_y)
+            )
+        ]
+
+        persons = self.persons
+        for p, (home_area, home_link, home_x, home_y) in enumerate(zip(
+            persons.home_area, persons.home_link, _values(persons.home_x), _values(persons.home_y)
+        )):
+            a, b = self.activity_offsets[p], self.activity_offsets[p + 1]
+            if a == b:
+                continue
+            home = Location(area=home_area, link=home_link, loc=point(home_x, home_y))
+            if not home.exists:  # as per core.Plan.home
+                home = next(
+                    (location for act, location in zip(acts[a:b], locations[a:b])
+                     if act is not None and act.lower()[:4] == 'home'),
+                    locations[a]
+                )
+            l, m = self.leg_offsets[p], self.leg_offsets[p + 1]
+            acts[a:b] = infer_tour_activities(
+                acts=acts[a:b],
+                purposes=purposes[l:m],
+                locations=locations[a:b],
+                leg_locations=leg_locations[l:m],
+                duration=lambda i, a=a: end_s[a + i] - start_s[a + i],
+                home=home,
+            )
+        self.activities['act'] = pd.Series(acts, index=activities.index, dtype=object).astype('category')
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'num_households': len(self.households),
+            'num_people': len(self.persons),
+            'num_activities': len(self.activities),
+            'num_legs': len(self.legs),
+        }
+
+    def legs_df(self) -> pd.DataFrame:
+        """
+        Tabular record of population legs, as per core.Population.legs_df, except that hzone is the
+        home area and leg locations are given by coordinates (ox, oy, dx, dy) rather than Locations.
+        :return pd.DataFrame: record of legs
+        """
+        legs = self.legs
+        person = legs.person.to_numpy()
+        persons = self.persons
+        df = pd.DataFrame({
+            'pid': persons.pid.to_numpy()[person],
+            'hid': persons.hid.to_numpy()[person],
+            'hzone': persons.hzone.to_numpy()[person],
+            'ozone': legs.start_area.to_numpy(),
+            'dzone': legs.end_area.to_numpy(),
+            'ox': legs.start_x.to_numpy(),
+            'oy': legs.start_y.to_numpy(),
+            'dx': legs.end_x.to_numpy(),
+            'dy': legs.end_y.to_numpy(),
+            'seq': np.arange(len(legs)) - self.leg_offsets[person],
+            'purp': _objects(legs.purp),
+            'mode': _objects(legs['mode']),
+            'tst': _times_of_day(legs.start_s.to_numpy()),
+            'tet': _times_of_day(legs.end_s.to_numpy()),
+            'duration': (legs.end_s.to_numpy() - legs.start_s.to_numpy()) / 60,
+            'euclidean_distance': _euclidean_km(legs.start_x, legs.start_y, legs.end_x, legs.end_y),
+            'freq': persons.freq.to_numpy()[person],
+        })
+        df = self._add_person_attributes(df, person)
+        core.Population.add_fields(df)
+        return df
+
+    def trips_df(self, ignore: list = IGNORED_TRIP_ACTIVITIES) -> pd.DataFrame:
+        """
+        Tabular record of population trips, as per core.Population.trips_df, except that hzone is the
+        home area and trip locations are given by coordinates (ox, oy, dx, dy) rather than Locations.
+        A trip is the sequence of legs between activities that are not ignored (eg pt interactions).
+        Trip modes are the modes with the longest total distance (first used on ties). Unlike
+        core, legs with a NaN distance use their euclidean distance, as missing and NaN distances
+        are both held as NaN (and become None in to_population). Where core trips include NaN
+        distances, their modes may differ.
+        :param ignore: list of activity types ignored when splitting trips
+        :return pd.DataFrame: record of trips
+        """
+        activities, legs, persons = self.activities, self.legs, self.persons
+        leg_person = legs.person.to_numpy()
+        # each leg is preceded by the activity at the same position in the plan
+        leg_index = np.arange(len(legs)) - self.leg_offsets[leg_person]
+        origin = self.activity_offsets[leg_person] + leg_index
+        destination = origin + 1
+
+        # a trip ends at the next activity (from the leg destination) that is not ignored
+        act_index = np.arange(len(activities))
+        act_person = activities.person.to_numpy()
+        is_end = ~activities.act.isin(ignore).to_numpy() & (act_index != self.activity_offsets[act_person])
+        next_end = np.where(is_end, act_index, len(activities))
+        next_end = np.minimum.accumulate(next_end[::-1])[::-1] if len(activities) else next_end
+        trip_end = next_end[destination] if len(legs) else np.zeros(0, dtype=int)
+        in_plan = trip_end < self.activity_offsets[leg_person + 1]
+
+        distance = legs.distance.to_numpy(dtype=float).copy()
+        missing = np.isnan(distance)
+        distance[missing] = 1000 * _euclidean_km(
+            legs.start_x, legs.start_y, legs.end_x, legs.end_y
+        )[missing]
+
+        trip_legs = pd.DataFrame({
+            'trip': trip_end[in_plan],
+            'origin': origin[in_plan],
+            'mode': _objects(legs['mode'])[in_plan],
+            'distance': distance[in_plan],
+            'order': np.arange(len(legs))[in_plan],
+        })
+        trips = trip_legs.groupby('trip', sort=True).agg(
+            origin=('origin', 'min'), distance=('distance', 'sum')
+        )
+        mode_distances = trip_legs.groupby(['trip', 'mode'], sort=False, observed=True).agg(
+            distance=('distance', 'sum'), order=('order', 'min')
+        ).reset_index()
+        modes = mode_distances.sort_values(
+            ['trip', 'distance', 'order'], ascending=[True, False, True]
+        ).drop_duplicates('trip').set_index('trip')['mode']
+
+        end = trips.index.to_numpy()
+        start = trips.origin.to_numpy()
+        person = act_person[end]
+        x, y = activities.x.to_numpy(), activities.y.to_numpy()
+        df = pd.DataFrame({
+            'pid': persons.pid.to_numpy()[person],
+            'hid': persons.hid.to_numpy()[person],
+            'hzone': persons.hzone.to_numpy()[person],
+            'ozone': activities.area.to_numpy()[start],
+            'dzone': activities.area.to_numpy()[end],
+            'ox': x[start],
+            'oy': y[start],
+            'dx': x[end],
+            'dy': y[end],
+            'seq': pd.Series(person).groupby(person).cumcount().to_numpy(),
+            'purp': _objects(activities.act)[end],
+            'mode': modes.reindex(trips.index).to_numpy(),
+            'tst': _times_of_day(activities.end_s.to_numpy()[start]),
+            'tet': _times_of_day(activities.start_s.to_numpy()[end]),
+            'duration': (activities.start_s.to_numpy()[end] - activities.end_s.to_numpy()[start]) / 60,
+            'euclidean_distance': _euclidean_km(x[start], y[start], x[end], y[end]),
+            'freq': persons.freq.to_numpy()[person],
+        })
+        df = self._add_person_attributes(df, person)
+        core.Population.add_fields(df)
+        return df
+
+    def activity_counts(self, key=None, value=None) -> dict:
+        """
+        Frequency weighted counts of activity types, as per pam.report.summary.count_activites.
+        """
+        return self._counts(self.activities, 'act', key, value)
+
+    def mode_counts(self, key=None, value=None) -> dict:
+        """
+        Frequency weighted counts of leg modes, as per pam.report.summary.count_modes.
+        """
+        return self._counts(self.legs, 'mode', key, value)
+
+    def activity_log(self) -> pd.DataFrame:
+        """
+        Activity types, start and end times of day and durations (seconds), as per
+        pam.plot.stats.extract_activity_log.
+        """
+        return self._log(self.activities, 'act')
+
+    def leg_log(self) -> pd.DataFrame:
+        """
+        Leg modes, start and end times of day and durations (seconds), as per
+        pam.plot.stats.extract_leg_log.
+        """
+        return self._log(self.legs, 'mode')
+
+    def od_legs_df(self, person_attributes: bool = False) -> pd.DataFrame:
+        """
+        Tabular record of legs as used by pam.write.matrices.write_od_matrices.
+        :param person_attributes: bool, include person attributes, default False
+        :return: pd.DataFrame
+        """
+        legs = self.legs
+        person = legs.person.to_numpy()
+        df = pd.DataFrame({
+            'Household ID': self.persons.hid.to_numpy()[person],
+            'Person ID': self.persons.pid.to_numpy()[person],
+            'Origin': legs.start_area.to_numpy(),
+            'Destination': legs.end_area.to_numpy(),
+            'Purpose': _objects(legs.purp),
+            'Mode': _objects(legs['mode']),
+            'Sequence': legs.seq.to_numpy(),
+            'Start time': START_OF_DAY + pd.to_timedelta(legs.start_s.to_numpy(), unit='s'),
+            'End time': START_OF_DAY + pd.to_timedelta(legs.end_s.to_numpy(), unit='s'),
+            'Freq': self.households.freq.to_numpy()[self.persons.household.to_numpy()[person]],
+        })
+        if person_attributes:
+            df = self._add_person_attributes(df, person)
+        return df
+
+    def _add_person_attributes(self, df: pd.DataFrame, person: np.ndarray) -> pd.DataFrame:
+        attributes = pd.DataFrame.from_records(list(self.persons.attributes))
+        if attributes.empty:
+            return df
+        attributes = attributes.iloc[person].reset_index(drop=True)
+        for column in attributes.columns:  # person attributes take precedence, as per core
+            df[column] = attributes[column].to_numpy()
+        return df
+
+    def _counts(self, table: pd.DataFrame, column: str, key, value) -> dict:
+        weights = self.persons.freq.to_numpy()[table.person.to_numpy()]
+        values = table[column]
+        if key is not None:
+            selected = np.array([a.get(key) == value for a in self.persons.attributes], dtype=bool)
+            keep = selected[table.person.to_numpy()]
+            weights, values = weights[keep], values[keep]
+        counts = pd.Series(weights).groupby(values.to_numpy()).sum()
+        classes = table[column].dropna().unique()
+        return {c: counts.get(c, 0) for c in classes}
+
+    @staticmethod
+    def _log(table: pd.DataFrame, column: str) -> pd.DataFrame:
+        start, end = table.start_s.to_numpy(), table.end_s.to_numpy()
+        return pd.DataFrame({
+            column: _objects(table[column]),
+            'start': start % 86400,
+            'end': end % 86400,
+            'duration': end - start,
+        })
+
+
+class _Coordinates:
+    """
+    Cached point coordinates, points are typically shared by many plan components and reading
+    shapely coordinates is slow.
+    """
+
+    def __init__(self) -> None:
+        self.cache = {}
+
+    def __call__(self, point):
+        if point is None:
+            return None, None
+        key = id(point)
+        xy = self.cache.get(key)
+        if xy is None:
+            xy = self.cache[key] = (point.x, point.y) if not point.is_empty else (None, None)
+        return xy
+
+
+def _offsets(person: np.ndarray, size: int) -> np.ndarray:
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(person, minlength=size), out=offsets[1:])
+    return offsets
+
+
+def _to_frame(columns: dict, names: list, numeric: list) -> pd.DataFrame:
+    df = pd.DataFrame({k: pd.Series(columns[k], dtype=object) for k in names})
+    for k in numeric:
+        df[k] = pd.to_numeric(df[k])
+    for k in names:
+        if k in CATEGORICAL_COLUMNS:
+            df[k] = df[k].astype('category')
+        elif k in ['person', 'household']:
+            df[k] = df[k].astype(np.int64)
+    return df
+
+
+def _home_area(person):
+    home = person.home
+    return home.area if home is not None else None
+
+
+def _objects(series: pd.Series) -> np.ndarray:
+    """
+    Column values as an array of python objects, with missing values as None.
+    """
+    return series.astype(object).where(series.notna(), None).to_numpy()
+
+
+def _values(series: pd.Series) -> list:
+    return _objects(series).tolist()
+
+
+class _Points:
+    """
+    Cached points, so that plan components at the same coordinates share a point (as when reading
+    MATSim plans), creating shapely points is slow.
+    """
+
+    def __init__(self) -> None:
+        self.cache = {}
+
+    def __call__(self, x, y):
+        if x is None or y is None:
+            return None
+        point = self.cache.get((x, y))
+        if point is None:
+            point = self.cache[(x, y)] = Point(x, y)
+        return point
+
+
+def _time(seconds, to_time):
+    if seconds is None:
+        return None
+    return to_time(int(seconds))
+
+
+def _copied_leg_columns(legs: pd.DataFrame) -> tuple:
+    """
+    Copies of leg attributes and routes.
+    """
+    attributes = [dict(a) if a else None for a in legs.attributes]
+    routes = []
+    for route in legs.route:
+        if route is not None:
+            route = copy.copy(route)  # the shared empty route is not copied
+            if route.extra:
+                route.extra = dict(route.extra)
+        routes.append(route)
+    return attributes, routes
+
+
+def _leg(seq, mode, purp, start_area, end_area, start_link, end_link, start_x, start_y, end_x, end_y,
+         start_s, end_s, distance, freq, attributes, route, to_time, point) -> Leg:
+    return Leg(
+        seq=seq, mode=mode, purp=purp, start_area=start_area, end_area=end_area,
+        start_link=start_link, end_link=end_link, start_loc=point(start_x, start_y),
+        end_loc=point(end_x, end_y), start_time=_time(start_s, to_time),
+        end_time=_time(end_s, to_time), distance=distance, freq=freq, attributes=attributes,
+        route=route,
+    )
+
+
+def _times_of_day(seconds: np.ndarray) -> np.ndarray:
+    return (pd.Timestamp(0) + pd.to_timedelta(seconds % 86400, unit='s')).time
+
+
+def _euclidean_km(start_x, start_y, end_x, end_y) -> np.ndarray:
+    dx = np.asarray(end_x, dtype=float) - np.asarray(start_x, dtype=float)
+    dy = np.asarray(end_y, dtype=float) - np.asarray(start_y, dtype=float)
+    return np.hypot(dx, dy) / 1000
@@ -0,0 +1,140 @@
+from collections import Counter
+from itertools import chain
+from operator import attrgetter
+
+from pam.activity import Activity
+
+
+FREQUENCY_FIELDS = ('act', 'mode', 'purp')
+
+
+class FrequencyTables:
+    """
+    Counts of the activity types, leg modes and leg purposes of the selected plans of a population,
+    maintained as households are added or replaced and persons are added to households (see
+    core.Population.frequencies), so that population-wide counts do not require rescanning the
+    population.
+
+    Each value is also given a small integer code, in order of first appearance. Codes are stable
+    for the life of the tables, including after a household is recounted or removed.
+
+    Households are counted when the tables are next read rather than when added, so readers can
+    fill plans after adding households. Only households whose contents were added or replaced
+    are recounted; after modifying plans in place mark the modified households for recounting
+    using core.Population.refresh_frequencies.
+
+    For example:
+    `tables = population.frequencies
+    tables.counts('mode')  # {'car': 10, 'walk': 4}
+    tables.code('act', 'home')  # 0
+    tables.decode('act', 0)  # 'home'
+    `
+    """
+
+    def __init__(self) -> None:
+        self.codes = {field: {} for field in FREQUENCY_FIELDS}
+        self.values = {field: [] for field in FREQUENCY_FIELDS}
+        self._counts = {field: Counter() for field in FREQUENCY_FIELDS}
+        self._counted = {}  # id(household): (household, values of each field when counted)
+        self._pending = {}  # id(household): household
+
+    def add(self, household) -> None:
+        """
+        Count household (again) when the tables are next read.
+        :param household: core.Household
+        """
+        self._pending[id(household)] = household
+
+    def remove(self, household) -> None:
+        """
+        Discount household.
+        :param household: core.Household
+        """
+        self._pending.pop(id(household), None)
+        counted = self._counted.pop(id(household), None)
+        if counted is not None:
+            self._update([counted[1]], subtract=True)
+
+    def code(self, field: str, value: str) -> int:
+        """
+        Get the integer code of a value, adding it to the tables (with a count of zero) if new.
+        :param field: str, one of FREQUENCY_FIELDS
+        :param value: str
+        :return: int
+        """
+        codes = self.codes[field]
+        code = codes.get(value)
+        if code is None:
+            code = len(codes)
+            codes[value] = code
+            self.values[field].append(value)
+        return code
+
+    def decode(self, field: str, code: int) -> str:
+        return self.values[field][code]
+
+    def counts(self, field: str) -> dict:
+        """
+        Number of components of selected plans using each value of field.
+        :param field: str, one of FREQUENCY_FIELDS
+        :return: dict
+        """
+        self._count_pending()
+        counts = self._counts[field]
+        return {value: counts[value] for value in self.values[field] if counts[value] > 0}
+
+    def classes(self, field: str) -> set:
+        """
+        Values of field used by at least one component of a selected plan.
+        :param field: str, one of FREQUENCY_FIELDS
+        :return: set
+        """
+        return set(self.counts(field))
+
+    @property
+    def activities(self) -> dict:
+        return self.counts('act')
+
+    @property
+    def modes(self) -> dict:
+        return self.counts('mode')
+
+    @property
+    def purposes(self) -> dict:
+        return self.counts('purp')
+
+    def _count_pending(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        removed = [self._counted.pop(key)[1] for key in pending if key in self._counted]
+        added = []
+        for key, household in pending.items():
+            values = self._values(household)
+            self._counted[key] = (household, values)
+            added.append(values)
+        self._update(removed, subtract=True)
+        self._update(added)
+
+    def _values(self, household) -> tuple:
+        activities, legs = [], []
+        for person in household.people.values():
+            for component in person.plan.day:
+                (activities if isinstance(component, Activity) else legs).append(component)
+        return (
+            tuple(map(attrgetter('act'), activities)),
+            tuple(map(attrgetter('mode'), legs)),
+            tuple(map(attrgetter('purp'), legs)),
+        )
+
+    def _update(self, counted: list, subtract: bool = False) -> None:
+        for i, field in enumerate(FREQUENCY_FIELDS):
+            counts = self._counts[field]
+            values = chain.from_iterable(household_values[i] for household_values in counted)
+            if subtract:
+                counts.subtract(values)
+                continue
+            counts.update(values)
+            for value in counts:  # distinct values, in order of first appearance
+                if value is not None:
+                    self.code(field, value)
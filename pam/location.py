@@ -1,9 +1,17 @@
+from typing import Union
+
+
 class Location:
+    __slots__ = ('loc', 'link', 'area')
+
     def __init__(self, loc=None, link=None, area=None):
         self.loc = loc
         self.link = link
         self.area = area
 
+    def __setstate__(self, state):
+        _set_slots_state(self, state)
+
     @property
     def x(self):
         if self.loc:
@@ -57,3 +65,15 @@ class Location:
 
     def copy(self):
         return Location(loc=self.loc, link=self.link, area=self.area)
+
+
+def _set_slots_state(obj, state: Union[dict, tuple]) -> None:
+    """
+    Set pickled state of an object with __slots__, accepting both (dict, slots) state and a plain
+    dict, as pickled before the class had __slots__.
+    """
+    if isinstance(state, tuple):
+        dict_state, slots_state = state
+        state = {**(dict_state or {}), **(slots_state or {})}
+    for name, value in state.items():
+        setattr(obj, name, value)
@@ -36,6 +36,8 @@ def simplify_population(
         population.households[hid].people) == 0]
     for hid in remove_hhs:
         del population.households[hid]
+    population.rebuild_vehicle_registry()
+    population.rebuild_frequencies()
 
 
 def simplify_external_plans(
@@ -2,11 +2,14 @@ import pandas as pd
 from matplotlib import pyplot as plt
 import numpy as np
 
+from pam.frame import PopulationFrame
 from pam.utils import dt_to_s, td_to_s
 from datetime import timedelta
 
 
 def extract_activity_log(population):
+    if isinstance(population, PopulationFrame):
+        return population.activity_log()
     log = []
     for hid, pid, person in population.people():
         for activity in person.activities:
@@ -21,6 +24,8 @@ def extract_activity_log(population):
 
 
 def extract_leg_log(population):
+    if isinstance(population, PopulationFrame):
+        return population.leg_log()
     log = []
     for hid, pid, person in population.people():
         for leg in person.legs:
@@ -424,5 +424,6 @@ def apply_policies(population, policies: Union[List[Policy], Policy], in_place=F
     for hid, household in pop.households.items():
         for policy in policies:
             policy.apply_to(household)
+    pop.refresh_frequencies()
     if not in_place:
         return pop
@@ -1,7 +1,10 @@
 import pickle
 
 from pam.read.diary import *
+from pam.read.mapped import *
 from pam.read.matsim import *
+from pam.read.parquet import *
+from pam.read.snapshot import *
 
 
 def load_pickle(path):
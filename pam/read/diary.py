@@ -1,12 +1,21 @@
+import numpy as np
 import pandas as pd
 import logging
-from typing import Union, Optional
+from typing import Iterator, Union, Optional
 
 import pam.core as core
 import pam.activity as activity
 import pam.utils as utils
 
 
+# start time of first activity of diary plans
+START_OF_DAY = utils.parse_time(0)
+
+# number of trips read at a time when streaming travel diaries
+DEFAULT_TRIPS_CHUNK_SIZE = 100000
+
+
+
 def load_travel_diary(
     trips: Union[pd.DataFrame, str],
     persons_attributes: Union[pd.DataFrame, str, None] = None,
@@ -21,6 +30,9 @@ def load_travel_diary(
     ):
     """
     Turn standard tabular data inputs (travel survey and attributes) into core population format.
+    The population is built in a single process. Building households in a process pool is slower,
+    because unpickling and rebuilding the workers' households costs about as much as the serial read
+    (see scripts/performance/parallel-read-benchmark.py).
     :param trips: DataFrame
     :param persons_attributes: DataFrame
     :param hhs_attributes: DataFrame
@@ -49,6 +61,259 @@ def load_travel_diary(
         logger.warning(f"Attempting to load trips dataframe from path: {hhs_attributes}")
         hhs_attributes = pd.read_csv(hhs_attributes)
 
+    trips, persons_attributes, hhs_attributes, reader = _prepare_travel_diary(
+        trips = trips,
+        persons_attributes = persons_attributes,
+        hhs_attributes = hhs_attributes,
+        sample_perc = sample_perc,
+        tour_based = tour_based,
+        from_to = from_to,
+        include_loc = include_loc,
+        sort_by_seq = sort_by_seq,
+        trip_freq_as_person_freq = trip_freq_as_person_freq,
+        trip_freq_as_hh_freq = trip_freq_as_hh_freq,
+        logger = logger,
+        )
+
+    population = reader(
+        trips = trips,
+        persons_attributes = persons_attributes,
+        hhs_attributes = hhs_attributes,
+        include_loc = include_loc,
+        sort_by_seq = sort_by_seq,
+        )
+
+    return population
+
+
+def stream_travel_diary(
+    trips: str,
+    persons_attributes: Union[pd.DataFrame, str, None] = None,
+    hhs_attributes: Union[pd.DataFrame, str, None] = None,
+    tour_based: bool = True,
+    from_to: bool = False,
+    include_loc: bool = False,
+    sort_by_seq: Union[bool, None] = None,
+    trip_freq_as_person_freq: bool = False,
+    trip_freq_as_hh_freq: bool = False,
+    chunk_size: int = DEFAULT_TRIPS_CHUNK_SIZE,
+    format: Optional[str] = None,
+    ) -> Iterator[core.Household]:
+    """
+    Stream households from a trips table (csv or parquet) that is too large to load, reading
+    chunk_size trips at a time and yielding each household once all of its trips are read.
+    Trips must be grouped by household ('hid', or 'pid' if trips have no household ids), such as sorted by
+    'hid' and 'pid'. Households are built as per load_travel_diary, and may be passed directly to
+    pam.write.Writer.add_hh. Households (and persons) found only in attributes tables are yielded
+    (staying at home) after all trips have been read. Attributes tables are held in memory.
+    :param trips: str, path to trips csv or parquet
+    :param persons_attributes: {DataFrame, str, None}
+    :param hhs_attributes: {DataFrame, str, None}
+    :param tour_based: bool=True, set to False to force a simpler trip-based purpose parser
+    :param from_to: bool=False, set to True to force the from-to purpose parser (requires 'oact' and 'dact' trips columns)
+    :param include_loc: bool=False, optionally include location data as shapely Point geometries ('start_loc' and 'end_loc' trips columns)
+    :param sort_by_seq=None, optionally force trip sorting as True or False
+    :param trip_freq_as_person_freq:bool=False.
+    :param trip_freq_as_hh_freq:bool=False.
+    :param chunk_size: int, number of trips read at a time, default 100000
+    :param format: {'csv', 'parquet', None}, trips format, default None infers from path
+    :return: core.Household generator
+    """
+    logger = logging.getLogger(__name__)
+    # input warnings are only logged for the first block, rather than repeated for every chunk
+    quiet_logger = _QuietLogger(logger, {})
+
+    if isinstance(persons_attributes, str):
+        logger.warning(f"Attempting to load persons dataframe from path: {persons_attributes}")
+        persons_attributes = pd.read_csv(persons_attributes)
+
+    if isinstance(hhs_attributes, str):
+        logger.warning(f"Attempting to load households dataframe from path: {hhs_attributes}")
+        hhs_attributes = pd.read_csv(hhs_attributes)
+
+    if persons_attributes is not None and not isinstance(persons_attributes, pd.DataFrame):
+        raise UserWarning("Unrecognised input for person_attributes")
+
+    if hhs_attributes is not None and not isinstance(hhs_attributes, pd.DataFrame):
+        raise UserWarning("Unrecognised input for hh_attributes")
+
+    persons_index = _TableIndex(persons_attributes, ['hid', 'pid'])
+    hhs_index = _TableIndex(hhs_attributes, ['hid'])
+
+    config = dict(
+        tour_based = tour_based,
+        from_to = from_to,
+        include_loc = include_loc,
+        sort_by_seq = sort_by_seq,
+        trip_freq_as_person_freq = trip_freq_as_person_freq,
+        trip_freq_as_hh_freq = trip_freq_as_hh_freq,
+        )
+    seen = set()
+    empty = None
+    carry = None
+    key = None
+
+    for chunk in _read_trips_chunks(trips, chunk_size=chunk_size, format=format):
+        if key is None:
+            key = 'hid' if 'hid' in chunk.columns else 'pid'
+            if key == 'pid' and persons_index.key == 'hid':
+                raise UserWarning("Streaming trips requires a trips 'hid' column if persons have household ids.")
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+        empty = chunk.iloc[:0]
+
+        # the last household may continue in the next chunk
+        keys = chunk[key].to_numpy()
+        num_complete = len(keys) - int((keys == keys[-1]).sum()) if len(keys) else 0
+        carry = chunk.iloc[num_complete:]
+        complete = chunk.iloc[:num_complete]
+        if (carry[key].to_numpy() != keys[-1]).any():
+            raise UserWarning(f"Trips must be grouped by '{key}' to be streamed.")
+        if not len(complete):
+            continue
+
+        yield from _read_trips_block(
+            complete, key, persons_index, hhs_index, seen, config,
+            logger if len(seen) == 0 else quiet_logger
+            )
+
+    if carry is not None and len(carry):
+        yield from _read_trips_block(
+            carry, key, persons_index, hhs_index, seen, config,
+            logger if len(seen) == 0 else quiet_logger
+            )
+
+    # households only found in attributes
+    if empty is not None:
+        remaining = [hid for hid in dict.fromkeys(hhs_index.keys('hid') + persons_index.keys('hid')) if hid not in seen]
+        if remaining:
+            yield from _read_trips_block(
+                empty, 'hid', persons_index, hhs_index, seen, config, quiet_logger, hids=remaining
+                )
+
+
+def _read_trips_chunks(path: str, chunk_size: int, format: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Read trips table in chunks of rows, indexed by row number.
+    """
+    if format is None:
+        format = 'parquet' if str(path).endswith('.parquet') else 'csv'
+    if format not in utils.TABLE_FORMATS:
+        raise UserWarning(f"Unknown table format '{format}', expected one of {utils.TABLE_FORMATS}.")
+    if format == 'csv':
+        yield from pd.read_csv(path, chunksize=chunk_size)
+        return
+
+    _, pq = utils.import_pyarrow()
+    rows = 0
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        chunk = batch.to_pandas()
+        chunk.index = pd.RangeIndex(rows, rows + len(chunk))
+        rows += len(chunk)
+        yield chunk
+
+
+def _read_trips_block(
+    trips: pd.DataFrame,
+    key: str,
+    persons_index: "_TableIndex",
+    hhs_index: "_TableIndex",
+    seen: set,
+    config: dict,
+    logger: logging.Logger,
+    hids: Optional[list] = None,
+    ) -> Iterator[core.Household]:
+    """
+    Read households of a block of complete households of trips.
+    """
+    keys = trips[key].unique().tolist() if hids is None else hids
+    if seen.intersection(keys):
+        raise UserWarning(f"Trips must be grouped by '{key}' to be streamed.")
+    seen.update(keys)
+    persons_keys = keys
+    if persons_index.key == 'pid' and key == 'hid':
+        persons_keys = trips.pid.unique().tolist()
+
+    trips, persons_attributes, hhs_attributes, reader = _prepare_travel_diary(
+        trips = trips.copy(),
+        persons_attributes = persons_index.take(persons_keys),
+        hhs_attributes = hhs_index.take(keys),
+        sample_perc = None,
+        logger = logger,
+        **config,
+        )
+    population = reader(
+        trips = trips,
+        persons_attributes = persons_attributes,
+        hhs_attributes = hhs_attributes,
+        include_loc = config['include_loc'],
+        sort_by_seq = config['sort_by_seq'],
+        )
+    yield from population.households.values()
+
+
+class _QuietLogger(logging.LoggerAdapter):
+    """
+    Logger adapter only passing on errors, without changing the level of the logger itself.
+    """
+
+    def isEnabledFor(self, level):
+        return level >= logging.ERROR and self.logger.isEnabledFor(level)
+
+
+class _TableIndex:
+    """
+    Positions of the rows of an attributes table by household (or person) id.
+    """
+
+    def __init__(self, table: Optional[pd.DataFrame], keys: list) -> None:
+        self.table = table
+        self.key = None
+        self.positions = {}
+        if table is None:
+            return
+        for key in keys:
+            if key in table.columns:
+                values = table[key]
+            elif table.index.name == key:
+                values = table.index.to_series()
+            else:
+                continue
+            self.key = key
+            self.positions = values.groupby(values.to_numpy(), sort=False).indices
+            return
+
+    def keys(self, key: str) -> list:
+        if self.key != key:
+            return []
+        return list(self.positions)
+
+    def take(self, keys: list) -> Optional[pd.DataFrame]:
+        if self.table is None:
+            return None
+        positions = [self.positions[k] for k in keys if k in self.positions]
+        positions = np.sort(np.concatenate(positions)) if positions else []
+        return self.table.iloc[positions].copy()
+
+
+def _prepare_travel_diary(
+    trips: pd.DataFrame,
+    persons_attributes: Optional[pd.DataFrame],
+    hhs_attributes: Optional[pd.DataFrame],
+    sample_perc: Optional[float],
+    tour_based: bool,
+    from_to: bool,
+    include_loc: bool,
+    sort_by_seq: Optional[bool],
+    trip_freq_as_person_freq: bool,
+    trip_freq_as_hh_freq: bool,
+    logger: logging.Logger,
+    ):
+    """
+    Check travel diary tables and fill missing household ids, home zones and frequencies (see
+    load_travel_diary), returning (trips, persons_attributes, hhs_attributes, reader), where
+    reader is the travel diary parser to use.
+    """
     if not isinstance(trips, pd.DataFrame):
         raise UserWarning("Unrecognised input for trips input.")
 
@@ -289,32 +554,15 @@ If you do not wish to assume this, try setting 'tour_based' = True (default).
 
     if from_to:
         logger.debug("Initiating from-to parser.")
-        return from_to_travel_diary_read(
-            trips = trips,
-            persons_attributes = persons_attributes,
-            hhs_attributes = hhs_attributes,
-            include_loc = include_loc,
-            sort_by_seq  = sort_by_seq,
-        )
-
-    if tour_based:
+        reader = from_to_travel_diary_read
+    elif tour_based:
         logger.debug("Initiating tour-based parser.")
-        return tour_based_travel_diary_read(
-            trips = trips,
-            persons_attributes = persons_attributes,
-            hhs_attributes = hhs_attributes,
-            include_loc = include_loc,
-            sort_by_seq  = sort_by_seq,
-            )
+        reader = tour_based_travel_diary_read
+    else:
+        logger.debug("Initiating trip-based parser.")
+        reader = trip_based_travel_diary_read
 
-    logger.debug("Initiating trip-based parser.")
-    return trip_based_travel_diary_read(
-        trips = trips,
-        persons_attributes = persons_attributes,
-        hhs_attributes = hhs_attributes,
-        include_loc = include_loc,
-        sort_by_seq = sort_by_seq,
-        )
+    return trips, persons_attributes, hhs_attributes, reader
 
 
 def build_population(
@@ -377,15 +625,10 @@ def add_hhs_from_persons_attributes(
     if persons_attributes is None or 'hid' not in persons_attributes.columns:
         return None
 
-    if 'hzone' in persons_attributes.columns:
-        hzone_lookup = persons_attributes.groupby('hid').head(1).set_index('hid').hzone.to_dict()
-    else:
-        hzone_lookup = {}
-
     logger.info("Adding hhs from persons_attributes")
-    for hid, hh_data in persons_attributes.groupby('hid'):
+    hids, hzones = _first_by_key(persons_attributes, ['hid'], 'hzone')
+    for hid, hzone in zip(hids, hzones):
         if hid not in population.households:
-            hzone = hzone_lookup.get(hid)
             household = core.Household(
                 hid,
                 area=hzone
@@ -403,9 +646,9 @@ def add_hhs_from_trips(
         return None
 
     logger.info("Adding hhs from trips")
-    for hid, hh_data in trips.groupby('hid'):
+    hids, hzones = _first_by_key(trips, ['hid'], 'hzone')
+    for hid, hzone in zip(hids, hzones):
         if hid not in population.households:
-            hzone = hh_data.iloc[0].to_dict().get("hzone")
             household = core.Household(
                 hid,
                 area=hzone
@@ -425,12 +668,13 @@ def add_persons_from_persons_attributes(
     persons_attributes_dict  = persons_attributes.reset_index().set_index(['hid','pid']).to_dict('index')
 
     logger.info("Adding persons from persons_attributes")
-    for hid, hh_data in persons_attributes.groupby('hid'):
+    pids = persons_attributes.index.to_numpy()
+    for hid, positions in persons_attributes.groupby('hid').indices.items():
         household = population.get(hid)
         if household is None:
             logger.warning(f"Failed to find household {hid} in population - unable to add person.")
             continue
-        for pid in hh_data.index:
+        for pid in pids[positions].tolist():
             if pid in household.people:
                 continue
 
@@ -455,7 +699,8 @@ def add_persons_from_trips(
         return None
 
     logger.info("Adding persons from trips")
-    for (hid, pid), hh_person_data in trips.groupby(['hid', 'pid']):
+    keys, hzones = _first_by_key(trips, ['hid', 'pid'], 'hzone')
+    for (hid, pid), hzone in zip(keys, hzones):
         household = population.households.get(hid)
         if household is None:
             logger.warning(f"Failed to find household {hid} in population - unable to add person.")
@@ -464,10 +709,29 @@ def add_persons_from_trips(
             continue
         person = core.Person(
             pid,
-            home_area=hh_person_data.iloc[0].to_dict().get("hzone"),
+            home_area=hzone,
             )
         household.add(person)
 
+
+def _first_by_key(df: pd.DataFrame, keys: list, column: str):
+    """
+    Sorted unique keys of a dataframe with the value of column in the first row of each key.
+    :param df: pd.DataFrame
+    :param keys: list, key column names
+    :param column: str, column name, values are None if df has no such column
+    :return: tuple of (list of keys, list of values)
+    """
+    firsts = df.groupby(keys, sort=True).head(1)
+    firsts = firsts.sort_values(keys, kind='stable')
+    if len(keys) == 1:
+        unique_keys = firsts[keys[0]].tolist()
+    else:
+        unique_keys = list(zip(*[firsts[key].tolist() for key in keys]))
+    if column not in df.columns:
+        return unique_keys, [None] * len(unique_keys)
+    return unique_keys, firsts[column].tolist()
+
 def hh_person_df_to_dict(
     df: pd.DataFrame,
     key_hh: str,
@@ -513,73 +777,17 @@ def tour_based_travel_diary_read(
         hhs_attributes=hhs_attributes
     )
 
-    if sort_by_seq is None and 'seq' in trips.columns:
-        sort_by_seq = True
-
-    if sort_by_seq:
-        trips = trips.sort_values(['hid','pid','seq'])
-
-    trips_dict = hh_person_df_to_dict(trips, 'hid', 'pid') # convert to dict for faster indexing
+    diary = _PersonTrips(trips, include_loc=include_loc, sort_by_seq=sort_by_seq)
+    acts = [None] * len(diary)
 
     for hid, household in population:
         for pid, person in household:
-            person_trips = trips_dict.get(hid, {}).get(pid, pd.DataFrame())
-
-            if not len(person_trips):
+            span = diary.slices.get((hid, pid))
+            if span is None:
                 person.stay_at_home()
                 continue
 
-            loc = None
-            if include_loc:
-                loc = person_trips.start_loc.iloc[0]
-
-            person = population[hid][pid]
-
-            person.add(
-                activity.Activity(
-                    seq=0,
-                    act=None,
-                    area=person_trips.ozone.iloc[0],
-                    loc=loc,
-                    start_time=utils.parse_time(0),
-                )
-            )
-
-            for n, trip in person_trips.iterrows():
-
-                start_loc = None
-                end_loc = None
-
-                if include_loc:
-                    start_loc = trip.start_loc
-                    end_loc = trip.end_loc
-
-                person.add(
-                    activity.Leg(
-                        seq=n,
-                        purp=trip.purp.lower(),
-                        mode=trip['mode'].lower(),
-                        start_area=trip.ozone,
-                        end_area=trip.dzone,
-                        start_loc=start_loc,
-                        end_loc=end_loc,
-                        start_time=utils.parse_time(trip.tst),
-                        end_time=utils.parse_time(trip.tet),
-                        distance = trip.get('distance'),
-                        freq=trip.freq,
-                    )
-                )
-
-                person.add(
-                    activity.Activity(
-                        seq=n + 1,
-                        act=None,
-                        area=trip.dzone,
-                        loc=end_loc,
-                        start_time=utils.parse_time(trip.tet),
-                    )
-                )
-
+            person.plan.day.extend(diary.plan_components(*span, first_act=None, acts=acts, freq=True))
             person.plan.finalise_activity_end_times()
             person.plan.infer_activities_from_tour_purpose()
             person.plan.set_leg_purposes()
@@ -613,77 +821,17 @@ def trip_based_travel_diary_read(
         hhs_attributes=hhs_attributes
     )
 
-    if sort_by_seq is None and 'seq' in trips.columns:
-        sort_by_seq = True
-
-    if sort_by_seq:
-        trips = trips.sort_values(['hid','pid','seq'])
-
-    trips_dict = hh_person_df_to_dict(trips, 'hid', 'pid') # convert to dict for faster indexing
+    diary = _PersonTrips(trips, include_loc=include_loc, sort_by_seq=sort_by_seq)
 
     for hid, household in population:
         for pid, person in household:
-            person_trips = trips_dict.get(hid, {}).get(pid, pd.DataFrame())
-
-            if not len(person_trips):
+            span = diary.slices.get((hid, pid))
+            if span is None:
                 person.stay_at_home()
                 continue
 
-            home_area = household.location.area or person_trips.hzone.iloc[0]
-            origin_area = person_trips.ozone.iloc[0]
-
-            loc = None
-            if include_loc:
-                loc = person_trips.start_loc.iloc[0]
-
-            person.add(
-                activity.Activity(
-                    seq=0,
-                    act='home',
-                    area=origin_area,
-                    loc=loc,
-                    start_time=utils.parse_time(0),
-                )
-            )
-
-            for n, trip in person_trips.iterrows():
-
-                start_loc = None
-                end_loc = None
-                if include_loc:
-                    start_loc = trip.start_loc
-                    end_loc = trip.end_loc
-                purpose = trip.purp.lower()
-
-                person.add(
-                    activity.Leg(
-                        seq=n,
-                        purp=purpose,
-                        mode=trip['mode'].lower(),
-                        start_area=trip.ozone,
-                        end_area=trip.dzone,
-                        start_loc=start_loc,
-                        end_loc=end_loc,
-                        start_time=utils.parse_time(trip.tst),
-                        end_time=utils.parse_time(trip.tet),
-                        distance = trip.get('distance')
-                    )
-                )
-
-                person.add(
-                    activity.Activity(
-                        seq=n + 1,
-                        act=purpose,
-                        area=trip.dzone,
-                        loc=end_loc,
-                        start_time=utils.parse_time(trip.tet),
-                    )
-                )
-
+            person.plan.day.extend(diary.plan_components(*span, first_act='home', acts=diary.purp))
             person.plan.finalise_activity_end_times()
-            household.add(person)
-
-        population.add(household)
 
     return population
 
@@ -716,80 +864,131 @@ def from_to_travel_diary_read(
         hhs_attributes=hhs_attributes
     )
 
-    if sort_by_seq is None and 'seq' in trips.columns:
-        sort_by_seq = True
-
-    if sort_by_seq:
-        trips = trips.sort_values(['hid','pid','seq'])
-
-    trips_dict = hh_person_df_to_dict(trips, 'hid', 'pid') # convert to dict for faster indexing
+    diary = _PersonTrips(trips, include_loc=include_loc, sort_by_seq=sort_by_seq, purpose='dact')
+    oacts = diary.lower_column(trips, 'oact')
 
     for hid, household in population:
         for pid, person in household:
-            person_trips = trips_dict.get(hid, {}).get(pid, pd.DataFrame())
-
-            if not len(person_trips):
+            span = diary.slices.get((hid, pid))
+            if span is None:
                 person.stay_at_home()
                 continue
 
-            first_act = person_trips.iloc[0].oact.lower()
+            first_act = oacts[span[0]]
             if not first_act == "home":
                 logger.warning(f" Person pid:{pid} hid:{hid} plan does not start with 'home' activity: {first_act}")
 
-            loc = None
-            if include_loc:
-                loc = person_trips.start_loc.iloc[0]
+            person.plan.day.extend(diary.plan_components(*span, first_act=first_act, acts=diary.purp))
+            person.plan.finalise_activity_end_times()
 
-            person.add(
-                activity.Activity(
-                    seq=0,
-                    act=first_act,
-                    area=person_trips.iloc[0].ozone,
-                    loc=loc,
-                    start_time=utils.parse_time(0),
-                )
-            )
+    return population
 
-            for n, trip in person_trips.iterrows():
-
-                start_loc = None
-                end_loc = None
-                if include_loc:
-                    start_loc = trip.start_loc
-                    end_loc = trip.end_loc
-                purpose=trip.dact.lower()
-
-                person.add(
-                    activity.Leg(
-                        seq=n,
-                        purp=purpose,
-                        mode=trip['mode'].lower(),
-                        start_area=trip.ozone,
-                        end_area=trip.dzone,
-                        start_loc=start_loc,
-                        end_loc=end_loc,
-                        start_time=utils.parse_time(trip.tst),
-                        end_time=utils.parse_time(trip.tet),
-                        distance = trip.get('distance')
-                    )
-                )
 
-                person.add(
-                    activity.Activity(
-                        seq=n + 1,
-                        act=purpose,
-                        area=trip.dzone,
-                        loc=end_loc,
-                        start_time=utils.parse_time(trip.tet),
-                    )
-                )
+class _PersonTrips:
+    """
+    Trips table as columns of python values, ordered by person (households and persons sorted by
+    identifier, trips in table order, or by 'seq' if sorted) with the (start, stop) positions of each
+    person's trips, so that plans are built from column slices rather than by iterating dataframe rows.
+    Times are parsed and purposes and modes lower-cased once per unique value.
+    """
 
-            person.plan.finalise_activity_end_times()
-            household.add(person)
+    def __init__(
+        self,
+        trips: pd.DataFrame,
+        include_loc: bool = False,
+        sort_by_seq: Union[bool, None] = None,
+        purpose: str = 'purp',
+    ) -> None:
+        if sort_by_seq is None and 'seq' in trips.columns:
+            sort_by_seq = True
+        if sort_by_seq:
+            trips = trips.sort_values(['hid','pid','seq'])
+
+        groups = trips.groupby(['hid', 'pid']).indices
+        self.order = np.concatenate(list(groups.values())) if groups else np.array([], dtype=int)
+        stops = np.cumsum([len(positions) for positions in groups.values()]).tolist()
+        self.slices = dict(zip(groups, zip([0] + stops[:-1], stops)))
+
+        self.index = trips.index.to_numpy()[self.order].tolist()
+        self.ozone = self.column(trips, 'ozone')
+        self.dzone = self.column(trips, 'dzone')
+        self.purp = self.lower_column(trips, purpose)
+        self.mode = self.lower_column(trips, 'mode')
+        self.tst = _parse_times(self.column(trips, 'tst'))
+        self.tet = _parse_times(self.column(trips, 'tet'))
+        self.freq = self.column(trips, 'freq')
+        self.distance = self.column(trips, 'distance')
+        self.start_loc = self.column(trips, 'start_loc') if include_loc else [None] * len(self)
+        self.end_loc = self.column(trips, 'end_loc') if include_loc else [None] * len(self)
+
+    def __len__(self):
+        return len(self.order)
+
+    def column(self, trips: pd.DataFrame, name: str) -> list:
+        """
+        Column values in person order, or None if trips has no such column.
+        """
+        if name not in trips.columns:
+            return [None] * len(self)
+        return trips[name].to_numpy()[self.order].tolist()
 
-        population.add(household)
+    def lower_column(self, trips: pd.DataFrame, name: str) -> list:
+        values = self.column(trips, name)
+        lower = {value: value.lower() for value in set(values)}
+        return [lower[value] for value in values]
 
-    return population
+    def plan_components(self, start: int, stop: int, first_act, acts: list, freq: bool = False) -> list:
+        """
+        Activities and legs of a plan from trips at positions start to stop. Legs are numbered by
+        trips index and followed by activities of the given acts (eg None for later inference).
+        :param start: int, position of first trip
+        :param stop: int, position after last trip
+        :param first_act: {str, None}, type of first activity
+        :param acts: list, activity type following each trip
+        :param freq: bool, set leg frequencies from trips 'freq', default False
+        :return: list of activity.Activity and activity.Leg
+        """
+        components = [
+            activity.Activity(
+                seq=0,
+                act=first_act,
+                area=self.ozone[start],
+                loc=self.start_loc[start],
+                start_time=START_OF_DAY,
+            )
+        ]
+        for i in range(start, stop):
+            n = self.index[i]
+            components.append(
+                activity.Leg(
+                    seq=n,
+                    purp=self.purp[i],
+                    mode=self.mode[i],
+                    start_area=self.ozone[i],
+                    end_area=self.dzone[i],
+                    start_loc=self.start_loc[i],
+                    end_loc=self.end_loc[i],
+                    start_time=self.tst[i],
+                    end_time=self.tet[i],
+                    distance=self.distance[i],
+                    freq=self.freq[i] if freq else None,
+                )
+            )
+            components.append(
+                activity.Activity(
+                    seq=n + 1,
+                    act=acts[i],
+                    area=self.dzone[i],
+                    loc=self.end_loc[i],
+                    start_time=self.tet[i],
+                )
+            )
+        return components
+
+
+def _parse_times(values: list) -> list:
+    parsed = {value: utils.parse_time(value) for value in set(values)}
+    return [parsed[value] for value in values]
 
 
 def sample_population(trips_df, sample_perc, attributes_df=None, weight_col='freq'):
@@ -0,0 +1,323 @@
+import gzip
+import html
+import logging
+import os
+import re
+import zlib
+from bisect import bisect_right
+from typing import Optional
+
+import pam.utils as utils
+
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+READ_BLOCK_SIZE = 1024 * 1024
+
+PERSON_START = re.compile(rb"<person[\s>/]")
+PERSON_END = b"</person>"
+ID_ATTRIBUTE = re.compile(rb"""\sid\s*=\s*(["'])(.*?)\1""", re.DOTALL)
+
+
+class PersonIndex:
+    """
+    Sidecar index of <person> elements in a (optionally compressed) MATSim plans file.
+    Maps person ids to (start, end) byte offsets in the uncompressed xml. For gzip inputs seek points
+    map the start of each gzip member to its uncompressed offset, so that reading can start from the
+    nearest member rather than the start of the file (eg for plans written by pam.write.write_matsim
+    with compression='pgzip' or workers > 1). Single member gzip files (as written by MATSim), bz2
+    and zstd inputs have a single seek point, so reading decompresses (but does not parse) the input
+    from the start up to the last requested person. Uncompressed xml is read directly.
+
+    For example:
+    `index = PersonIndex.build(PATH)
+    index.save()
+    persons = pam.read.matsim.read_matsim_persons(PATH, pids=["a", "b"], index=index)
+    `
+    """
+
+    def __init__(
+        self,
+        source: str,
+        offsets: dict,
+        seek_points: Optional[list] = None,
+        compression: Optional[str] = None,
+        source_size: Optional[int] = None,
+        source_mtime: Optional[int] = None,
+    ) -> None:
+        self.source = str(source)
+        self.offsets = offsets
+        self.seek_points = seek_points or [(0, 0)]
+        self.compression = compression
+        self.source_size = source_size
+        self.source_mtime = source_mtime
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, pid):
+        return pid in self.offsets
+
+    @property
+    def pids(self):
+        return list(self.offsets)
+
+    @property
+    def is_stale(self) -> bool:
+        """
+        Check if the indexed source has been modified since the index was built.
+        """
+        stat = os.stat(self.source)
+        return stat.st_size != self.source_size or stat.st_mtime_ns != self.source_mtime
+
+    @classmethod
+    def build(cls, path: str) -> "PersonIndex":
+        """
+        Build index by scanning (without parsing) the xml at given path.
+        :param path: path to matsim plans xml
+        :return: PersonIndex
+        """
+        compression = utils.compression_of(path)
+        offsets = {}
+        seek_points = [(0, 0)]
+        if compression == "gzip":
+            blocks = _gzip_blocks(path, seek_points)
+        else:
+            blocks = _stream_blocks(path)
+
+        buffer = b""
+        base = 0  # uncompressed offset of buffer start
+        for block in blocks:
+            buffer += block
+            consumed = _scan_persons(buffer, base, offsets)
+            buffer = buffer[consumed:]
+            base += consumed
+
+        stat = os.stat(path)
+        return cls(
+            source=path,
+            offsets=offsets,
+            seek_points=seek_points,
+            compression=compression,
+            source_size=stat.st_size,
+            source_mtime=stat.st_mtime_ns,
+        )
+
+    def save(self, path: Optional[str] = None) -> str:
+        """
+        Write index as tab separated text, by default alongside the source (eg plans.xml.gz.idx).
+        :param path: optional output path
+        :return: str, output path
+        """
+        path = path or default_index_path(self.source)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(f"pam_person_index\t{INDEX_VERSION}\n")
+            file.write(f"compression\t{self.compression or ''}\n")
+            file.write(f"source_size\t{self.source_size}\n")
+            file.write(f"source_mtime\t{self.source_mtime}\n")
+            for compressed, uncompressed in self.seek_points:
+                file.write(f"s\t{compressed}\t{uncompressed}\n")
+            for pid, (start, end) in self.offsets.items():
+                file.write(f"p\t{start}\t{end}\t{pid}\n")
+        return path
+
+    @classmethod
+    def load(cls, source: str, path: Optional[str] = None) -> "PersonIndex":
+        """
+        Load index of source plans from given path, by default from alongside the source.
+        :param source: path to indexed matsim plans xml
+        :param path: optional index path
+        :return: PersonIndex
+        """
+        path = path or default_index_path(source)
+        header = {}
+        offsets = {}
+        seek_points = []
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                record = line.rstrip("\n").split("\t", 3)
+                if record[0] == "p":
+                    offsets[record[3]] = (int(record[1]), int(record[2]))
+                elif record[0] == "s":
+                    seek_points.append((int(record[1]), int(record[2])))
+                else:
+                    header[record[0]] = record[1]
+        if header.get("pam_person_index") != str(INDEX_VERSION):
+            raise UserWarning(f"Unsupported person index version at {path}, please rebuild the index.")
+        return cls(
+            source=source,
+            offsets=offsets,
+            seek_points=seek_points,
+            compression=header["compression"] or None,
+            source_size=int(header["source_size"]),
+            source_mtime=int(header["source_mtime"]),
+        )
+
+    def read(self, pids: list):
+        """
+        Read raw xml of requested persons, in order of their position in the source. Unknown pids
+        are ignored.
+        :param pids: list of person ids
+        :return: Generator of (pid, bytes)
+        """
+        targets = sorted((self.offsets[pid], pid) for pid in pids if pid in self.offsets)
+        if not targets:
+            return
+        if self.compression is None:
+            with open(self.source, "rb") as file:
+                for (start, end), pid in targets:
+                    file.seek(start)
+                    yield pid, file.read(end - start)
+            return
+
+        seek_offsets = [uncompressed for _, uncompressed in self.seek_points]
+        stream = None
+        position = None
+        try:
+            for (start, end), pid in targets:
+                compressed, uncompressed = self.seek_points[bisect_right(seek_offsets, start) - 1]
+                if stream is None or position > start or position < uncompressed:
+                    if stream is not None:
+                        stream.close()
+                    stream = self._open_at(compressed)
+                    position = uncompressed
+                _skip(stream, start - position)
+                yield pid, stream.read(end - start)
+                position = end
+        finally:
+            if stream is not None:
+                stream.close()
+
+    def _open_at(self, compressed: int):
+        if self.compression == "gzip":
+            file = open(self.source, "rb")
+            file.seek(compressed)
+            return _ClosingGzipFile(fileobj=file)
+        return utils.open_xml(self.source)
+
+
+class _ClosingGzipFile(gzip.GzipFile):
+    """
+    GzipFile that also closes the underlying file object.
+    """
+
+    def close(self):
+        fileobj = self.fileobj
+        super().close()
+        if fileobj is not None:
+            fileobj.close()
+
+
+def default_index_path(source: str) -> str:
+    return str(source) + INDEX_SUFFIX
+
+
+def load_or_build_person_index(source: str, path: Optional[str] = None, save: bool = False) -> PersonIndex:
+    """
+    Load the person index of given plans, (re)building it if missing or stale.
+    :param source: path to matsim plans xml
+    :param path: optional index path, defaults to alongside the source
+    :param save: bool, save a newly built index, default False
+    :return: PersonIndex
+    """
+    logger = logging.getLogger(__name__)
+    path = path or default_index_path(source)
+    if os.path.exists(path):
+        index = PersonIndex.load(source, path)
+        if not index.is_stale:
+            return index
+        logger.warning(f"Person index at {path} is out of date, rebuilding.")
+    logger.info(f"Building person index for {source}.")
+    index = PersonIndex.build(source)
+    if save:
+        index.save(path)
+    return index
+
+
+def stream_person_sources(path: str):
+    """
+    Stream the raw (unparsed) xml of each person element in given plans, in order, eg to copy
+    unmodified persons to a new plans file without parsing and serialising them.
+    :param path: path to matsim plans xml
+    :return: Generator of (pid, bytes)
+    """
+    buffer = b""
+    for block in _stream_blocks(path):
+        buffer += block
+        offsets = {}
+        consumed = _scan_persons(buffer, 0, offsets)
+        for pid, (start, end) in offsets.items():
+            yield pid, buffer[start:end]
+        buffer = buffer[consumed:]
+
+
+def _scan_persons(buffer: bytes, base: int, offsets: dict) -> int:
+    """
+    Record offsets of all complete person elements in buffer. Returns number of bytes consumed,
+    ie the buffer position before which no further persons can start.
+    """
+    position = 0
+    while True:
+        match = PERSON_START.search(buffer, position)
+        if match is None:
+            return max(position, len(buffer) - len(PERSON_END))
+        start = match.start()
+        tag_end = buffer.find(b">", start)
+        if tag_end < 0:
+            return start
+        if buffer[tag_end - 1:tag_end] == b"/":  # empty person
+            end = tag_end + 1
+        else:
+            end = buffer.find(PERSON_END, tag_end)
+            if end < 0:
+                return start
+            end += len(PERSON_END)
+        pid = ID_ATTRIBUTE.search(buffer, start, tag_end)
+        if pid is not None:
+            offsets[html.unescape(pid.group(2).decode("utf-8"))] = (base + start, base + end)
+        position = end
+
+
+def _stream_blocks(path: str):
+    with utils.open_xml(path) as stream:
+        while True:
+            block = stream.read(READ_BLOCK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+def _gzip_blocks(path: str, seek_points: list):
+    """
+    Decompress gzip at given path, recording (compressed, uncompressed) offsets of the start of each
+    gzip member in seek_points.
+    """
+    decompressor = zlib.decompressobj(wbits=31)
+    uncompressed = 0
+    new_member = False
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(READ_BLOCK_SIZE)
+            if not data:
+                return
+            while data:
+                if new_member:
+                    seek_points.append((file.tell() - len(data), uncompressed))
+                    decompressor = zlib.decompressobj(wbits=31)
+                    new_member = False
+                block = decompressor.decompress(data)
+                uncompressed += len(block)
+                if block:
+                    yield block
+                data = b""
+                if decompressor.eof:
+                    new_member = True
+                    data = decompressor.unused_data
+
+
+def _skip(stream, size: int) -> None:
+    while size > 0:
+        skipped = len(stream.read(min(size, READ_BLOCK_SIZE)))
+        if not skipped:
+            return
+        size -= skipped
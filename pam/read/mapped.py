@@ -0,0 +1,308 @@
+import json
+import os
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Iterator, Optional
+
+import numpy as np
+
+import pam.core as core
+from pam.activity import Activity, Route, RouteV11
+from pam.frame import ACTIVITY_COLUMNS, LEG_COLUMNS, _Points, _leg, _time
+from pam.read.parquet import _VehicleDecoder
+import pam.utils as utils
+from pam.write.mapped import MAPPED_FORMAT_VERSION, MAPPED_HID_ORDER, MAPPED_METADATA, MAPPED_OFFSETS, MAPPED_TABLES
+from pam.write.parquet import _json_default
+
+# number of decoded (immutable) values, such as ids, activity types and modes, shared per population
+VALUE_CACHE_SIZE = 4096
+# first bytes of json encoded dicts and lists, which are decoded for every access rather than shared
+MUTABLE_JSON = (ord('{'), ord('['))
+
+
+def read_mapped(dir: str, int_times: bool = False) -> "MappedPopulation":
+    """
+    Open a population written by pam.write.to_mapped as a read only, memory mapped population.
+    :param dir: str, path to population directory
+    :param int_times: bool, store plan times of returned persons as integer seconds, default False
+    :return: MappedPopulation
+    """
+    return MappedPopulation(dir, int_times=int_times)
+
+
+class MappedPopulation:
+    """
+    Read only population backed by memory mapped arrays (see pam.write.to_mapped). Households and
+    persons are built from the arrays when accessed, and processes
+    mapping the same population share a single (page cache) copy of it. Pickling (eg to send to
+    worker processes) only copies the path.
+
+    Supports the read parts of the core.Population interface (iteration, households, people(),
+    stats etc). Returned households and persons are new objects, so modifying them does not modify
+    the population, use to_population() to get a mutable copy.
+
+    For example:
+    `to_mapped(population, PATH)
+    population = read_mapped(PATH)
+    with ProcessPoolExecutor() as executor:
+        scores = executor.map(partial(score_people, population), ranges)
+    `
+    """
+
+    def __init__(self, dir: str, int_times: bool = False) -> None:
+        self.dir = dir
+        self.int_times = int_times
+        metadata = read_mapped_metadata(dir)
+        self.name = metadata['name']
+        self.kinds = metadata['columns']
+        self.columns = {
+            table: {
+                column: np.load(os.path.join(dir, table, f"{column}.npy"), mmap_mode='r')
+                for column in columns
+            }
+            for table, columns in self.kinds.items()
+        }
+        self.person_offsets, self.activity_offsets, self.leg_offsets = (
+            np.load(os.path.join(dir, f"{name}.npy"), mmap_mode='r') for name in MAPPED_OFFSETS
+        )
+        self.strings = np.load(os.path.join(dir, "strings.npy"), mmap_mode='r')
+        self.string_offsets = np.load(os.path.join(dir, "string_offsets.npy"), mmap_mode='r')
+        self.hid_order = np.load(os.path.join(dir, MAPPED_HID_ORDER), mmap_mode='r')
+        self.households = _MappedHouseholds(self)
+        self._shared_value = lru_cache(maxsize=VALUE_CACHE_SIZE)(self._decode)
+        self._vehicles = _VehicleDecoder()
+
+    def __getstate__(self):
+        return {'dir': self.dir, 'int_times': self.int_times}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self.columns['persons']['pid'])
+
+    def __str__(self):
+        return f"MappedPopulation: {len(self)} people in {self.num_households} households."
+
+    def __iter__(self):
+        for h in range(self.num_households):
+            household = self.household(h)
+            yield household.hid, household
+
+    def __getitem__(self, hid):
+        return self.household(self.household_index(hid))
+
+    def __contains__(self, hid):
+        try:
+            self.household_index(hid)
+        except KeyError:
+            return False
+        return True
+
+    def get(self, hid, default=None):
+        if hid in self:
+            return self[hid]
+        return default
+
+    @property
+    def num_households(self):
+        return len(self.columns['households']['hid'])
+
+    @property
+    def population(self):
+        return len(self)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'num_households': self.num_households,
+            'num_people': len(self),
+            'num_activities': len(self.columns['activities']['person']),
+            'num_legs': len(self.columns['legs']['person']),
+        }
+
+    def people(self, start: int = 0, stop: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Iterator for people in population, returns hid, pid and Person. Optionally iterate a range
+        of persons (by position), eg to split work between processes.
+        :param start: int, position of first person, default 0
+        :param stop: {int, None}, position after last person, default None (all persons)
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        for p in range(start, stop):
+            person = self.person(p)
+            yield self._value(self.columns['persons']['hid'][p]), person.pid, person
+
+    def household_index(self, hid) -> int:
+        """
+        Position of household, found by binary search of the households sorted by hid.
+        :param hid: household id
+        :return: int
+        """
+        key = json.dumps(hid, default=_json_default).encode("utf-8")
+        codes = self.columns['households']['hid']
+        low, high = 0, len(self.hid_order)
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(codes[self.hid_order[middle]]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.hid_order) and self._bytes(codes[self.hid_order[low]]) == key:
+            return int(self.hid_order[low])
+        raise KeyError(hid)
+
+    def household(self, h: int) -> core.Household:
+        """
+        Build household at given position, including its persons.
+        :param h: int, household position
+        :return: core.Household
+        """
+        columns = self.columns['households']
+        x, y = _float(columns['x'][h]), _float(columns['y'][h])
+        household = core.Household(
+            self._value(columns['hid'][h]),
+            attributes=self._value(columns['attributes'][h]) or {},
+            freq=_float(columns['hh_freq'][h]),
+            area=self._value(columns['area'][h]),
+            loc=_Points()(x, y),
+        )
+        for p in range(self.person_offsets[h], self.person_offsets[h + 1]):
+            household.add(self.person(p))
+        return household
+
+    def person(self, p: int) -> core.Person:
+        """
+        Build person (and selected plan) at given position.
+        :param p: int, person position
+        :return: core.Person
+        """
+        columns = self.columns['persons']
+        point = _Points()
+        to_time = (lambda s: s) if self.int_times else utils.seconds_to_datetime
+        person = core.Person(
+            self._value(columns['pid'][p]),
+            freq=_float(columns['person_freq'][p]),
+            attributes=self._value(columns['attributes'][p]) or {},
+        )
+        person.home_location.area = self._value(columns['home_area'][p])
+        person.home_location.link = self._value(columns['home_link'][p])
+        person.home_location.loc = point(_float(columns['home_x'][p]), _float(columns['home_y'][p]))
+        person.vehicle = self._vehicles(self._string(columns['vehicle'][p]))
+        person.plan.score = _float(columns['score'][p])
+
+        activities = self._rows('activities', ACTIVITY_COLUMNS[1:], *self.activity_offsets[p:p + 2])
+        legs = self._rows('legs', LEG_COLUMNS[1:], *self.leg_offsets[p:p + 2])
+        day = person.plan.day
+        for i, (seq, act, area, link, x, y, start_s, end_s, freq) in enumerate(activities):
+            if i:
+                day.append(_leg(*legs[i - 1], to_time=to_time, point=point))
+            day.append(
+                Activity(
+                    seq=seq, act=act, area=area, link=link, loc=point(x, y),
+                    start_time=_time(start_s, to_time), end_time=_time(end_s, to_time), freq=freq,
+                )
+            )
+        return person
+
+    def to_population(self) -> core.Population:
+        """
+        Build a (mutable) core.Population.
+        :return: core.Population
+        """
+        population = core.Population(name=self.name)
+        for hid, household in self:
+            population.add(household)
+        return population
+
+    def _rows(self, table: str, names: list, start: int, stop: int) -> list:
+        columns = []
+        for name in names:
+            values = self.columns[table][name][start:stop].tolist()
+            kind = self.kinds[table][name]
+            if kind == 'float':
+                values = [None if v != v else v for v in values]
+            elif kind == 'value':
+                values = [self._value(v) for v in values]
+            elif kind == 'route':
+                values = [_route(self._string(v)) for v in values]
+            columns.append(values)
+        return list(zip(*columns))
+
+    def _bytes(self, code) -> bytes:
+        code = int(code)
+        return bytes(self.strings[self.string_offsets[code]:self.string_offsets[code + 1]])
+
+    def _string(self, code) -> Optional[str]:
+        if code < 0:
+            return None
+        return self._bytes(code).decode("utf-8")
+
+    def _value(self, code):
+        """
+        Decode json value. Recently used immutable values are cached (up to VALUE_CACHE_SIZE) so that
+        they are shared, dicts and lists are decoded for every access.
+        """
+        code = int(code)
+        if code < 0:
+            return None
+        if self.strings[self.string_offsets[code]] in MUTABLE_JSON:
+            return json.loads(self._string(code))
+        return self._shared_value(code)
+
+    def _decode(self, code: int):
+        return json.loads(self._string(code))
+
+
+class _MappedHouseholds(Mapping):
+    """
+    Read only mapping of hid to household, built on access.
+    """
+
+    def __init__(self, population: MappedPopulation) -> None:
+        self.population = population
+
+    def __getitem__(self, hid):
+        return self.population[hid]
+
+    def __iter__(self):
+        population = self.population
+        return (population._value(code) for code in population.columns['households']['hid'])
+
+    def __len__(self):
+        return self.population.num_households
+
+    def items(self):
+        return iter(self.population)
+
+    def values(self):
+        return (household for _, household in self.population)
+
+
+def read_mapped_metadata(dir: str) -> dict:
+    path = os.path.join(dir, MAPPED_METADATA)
+    if not os.path.exists(path):
+        raise UserWarning(f"Cannot find mapped population metadata at {path}.")
+    with open(path) as f:
+        metadata = json.load(f)
+    if metadata.get('version') != MAPPED_FORMAT_VERSION or set(metadata['columns']) != set(MAPPED_TABLES):
+        raise UserWarning(
+            f"Unsupported mapped population version {metadata.get('version')}, expected {MAPPED_FORMAT_VERSION}."
+        )
+    return metadata
+
+
+def _float(value) -> Optional[float]:
+    value = value.item()
+    if value != value:
+        return None
+    return value
+
+
+def _route(value: Optional[str]):
+    if value is None:
+        return None
+    data = json.loads(value)
+    route = RouteV11() if data['v11'] else Route()
+    route.set(data['attrib'], data['text'])
+    return route
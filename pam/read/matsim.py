@@ -2,14 +2,70 @@ import pandas as pd
 from shapely.geometry import Point
 from datetime import datetime, timedelta
 import logging
-from typing import Union
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from io import BytesIO
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Union
+from lxml import etree
 
 import pam.core as core
 import pam.activity as activity
-from pam.activity import Route, RouteV11
+from pam.activity import Route, RouteV11, _intern
 import pam.utils as utils
+from pam.read.index import PersonIndex, load_or_build_person_index, stream_person_sources, _scan_persons
+from pam.read.snapshot import _HouseholdBuilder
 from pam.vehicle import VehicleType, Vehicle, ElectricVehicle
 from pam.variables import START_OF_DAY
+from pam.write.snapshot import person_record
+
+
+# optional fields that can be parsed from MATSim plans, see stream_matsim_persons
+MATSIM_FIELDS = {
+    'attributes',  # person attributes
+    'loc',  # activity coordinates
+    'link',  # activity links
+    'leg_attributes',  # leg attributes such as routingMode
+    'route',  # leg routes, including distance and start and end links
+}
+
+
+def validate_fields(fields: Iterable[str]) -> set:
+    fields = set(fields)
+    unknown = fields - MATSIM_FIELDS
+    if unknown:
+        raise UserWarning(f"Unknown MATSim fields: {unknown}, expected a subset of {MATSIM_FIELDS}.")
+    return fields
+
+
+class PlanSummary(NamedTuple):
+    """
+    Cheap summary of a MATSim plan element, for filtering plans before they are parsed.
+    """
+    selected : bool
+    score : Optional[float]
+    activities : list
+    modes : list
+
+
+def summarise_matsim_plan(plan_xml) -> PlanSummary:
+    """
+    Scan plan element for activity types and leg modes, without parsing times, locations or routes.
+    """
+    activities = []
+    modes = []
+    for stage in plan_xml:
+        if stage.tag in ['act', 'activity']:
+            activities.append(stage.get('type'))
+        elif stage.tag == 'leg':
+            modes.append(stage.get('mode'))
+    score = plan_xml.get('score')
+    return PlanSummary(
+        selected=plan_xml.get('selected') == 'yes',
+        score=float(score) if score else None,
+        activities=activities,
+        modes=modes,
+    )
 
 
 def read_matsim(
@@ -26,6 +82,11 @@ def read_matsim(
         keep_non_selected : bool = False,
         leg_attributes : bool = True,
         leg_route : bool = True,
+        workers : int = 1,
+        person_filter : Optional[Callable[[str, dict], bool]] = None,
+        plan_filter : Optional[Callable[[PlanSummary], bool]] = None,
+        fields : Optional[Iterable[str]] = None,
+        int_times : bool = False,
 ):
     """
     Load a MATSim format population into core population format.
@@ -45,6 +106,11 @@ def read_matsim(
     :param keep_non_selected: Whether to parse non-selected plans (storing them in person.plans_non_selected)
     :param leg_attributes: Parse leg attributes such as routing mode, default = True
     :param leg_route: Parse leg route, default = True
+    :param workers: int, number of processes used to parse plans, default = 1 (no multiprocessing)
+    :param person_filter: optional function (pid, attributes) -> bool, see stream_matsim_persons
+    :param plan_filter: optional function (PlanSummary) -> bool, see stream_matsim_persons
+    :param fields: optional subset of MATSIM_FIELDS to parse, see stream_matsim_persons
+    :param int_times: bool, store plan times as integer seconds, see stream_matsim_persons
     :return: core.Population
     """
     logger = logging.getLogger(__name__)
@@ -63,6 +129,9 @@ Either remove the attributes_path arg, or enable version 11.
     if version not in [11, 12]:
         raise UserWarning("Version must be set to 11 or 12.")
 
+    if household_key and fields is not None and 'attributes' not in validate_fields(fields):
+        raise UserWarning("Reading households using a household_key requires the 'attributes' field.")
+
     if version == 11 and not attributes_path:
         logger.warning(
 """
@@ -96,6 +165,11 @@ have attributes or be able to use a household attribute id. Check this is intend
         keep_non_selected = keep_non_selected,
         leg_attributes=leg_attributes,
         leg_route=leg_route,
+        workers=workers,
+        person_filter=person_filter,
+        plan_filter=plan_filter,
+        fields=fields,
+        int_times=int_times,
         ):
         # Check if using households, then update population accordingly.
         if household_key and person.attributes.get(household_key):  # using households
@@ -126,11 +200,27 @@ def stream_matsim_persons(
     keep_non_selected : bool = False,
     leg_attributes : bool = True,
     leg_route : bool = True,
+    workers : int = 1,
+    person_filter : Optional[Callable[[str, dict], bool]] = None,
+    plan_filter : Optional[Callable[[PlanSummary], bool]] = None,
+    stats : Optional[dict] = None,
+    fields : Optional[Iterable[str]] = None,
+    int_times : bool = False,
+    keep_source : bool = False,
     ) -> core.Person:
     """
     Stream a MATSim format population into core.Person objects.
     Expects agent attributes (and vehicles) to be supplied as optional dictionaries, this allows this
     function to support 'version 11' plans.
+    Persons can be filtered before their plans are parsed using person_filter, which is passed the
+    person id and (raw string) attributes, and plan_filter, which is passed a PlanSummary of the selected
+    plan. Persons failing either filter are skipped without being built.
+    Parsing can be restricted to a subset of MATSIM_FIELDS (eg fields=["loc"]) for analyses that do
+    not need all plan information. Activity types, leg modes and times are always parsed.
+    Plan times can be stored as integer seconds since START_OF_DAY using int_times, which is faster
+    to read, score, write and encode (see activity.PlanComponent.set_int_times).
+    With keep_source persons keep their original xml, which pam.write.matsim.Writer copies in place of
+    serialising persons that have not been modified (see core.Person.dirty).
     todo: a v12 only method could also stream attributes and would use less memory
     :param plans: path to matsim format xml
     :param attributes: {}, map of person attributes, only required for v11
@@ -144,26 +234,141 @@ def stream_matsim_persons(
     :param keep_non_selected: Whether to parse non-selected plans (storing them in person.plans_non_selected).
     :param leg_attributes: Parse leg attributes such as routing mode, default = True
     :param leg_route: Parse leg route, default = True
+    :param workers: int, number of processes used to parse plans, default = 1 (no multiprocessing)
+    :param person_filter: optional function (pid, attributes) -> bool, must be picklable if workers > 1
+    :param plan_filter: optional function (PlanSummary) -> bool, must be picklable if workers > 1
+    :param stats: optional dict, updated with counts of 'persons' read and 'skipped' by filters
+    :param fields: optional subset of MATSIM_FIELDS to parse, default None (all fields)
+    :param int_times: bool, store plan times as integer seconds, default False
+    :param keep_source: bool, keep the original xml of each person (version 12 only), default False
     :return: core.Person
     """
+    logger = logging.getLogger(__name__)
 
     if version not in [11, 12]:
         raise UserWarning("Version must be set to 11 or 12.")
+    if keep_source and (version != 12 or workers > 1):
+        raise UserWarning("Keeping person sources requires version 12 plans and workers=1.")
+
+    if fields is not None:
+        fields = validate_fields(fields)
+        leg_attributes = leg_attributes and 'leg_attributes' in fields
+        leg_route = leg_route and 'route' in fields
+
+    config = dict(
+        weight=weight,
+        version=version,
+        simplify_pt_trips=simplify_pt_trips,
+        autocomplete=autocomplete,
+        crop=crop,
+        keep_non_selected=keep_non_selected,
+        leg_attributes=leg_attributes,
+        leg_route=leg_route,
+        person_filter=person_filter,
+        plan_filter=plan_filter,
+        fields=fields,
+        int_times=int_times,
+    )
+    if workers > 1:
+        persons = _stream_matsim_persons_parallel(
+            plans_path, attributes=attributes, vehicles=vehicles, workers=workers, **config
+        )
+    elif keep_source:
+        persons = (
+            parse_matsim_person_source(source, attributes=attributes, vehicles=vehicles, **config)
+            for _, source in stream_person_sources(plans_path)
+        )
+    else:
+        persons = (
+            parse_matsim_person(person_xml, attributes=attributes, vehicles=vehicles, **config)
+            for person_xml in utils.get_elems(plans_path, "person")
+        )
+
+    if stats is None:
+        stats = {}
+    stats.update({"persons": 0, "skipped": 0})
+    for person in persons:
+        stats["persons"] += 1
+        if person is None:
+            stats["skipped"] += 1
+            continue
+        yield person
 
-    for person_xml in utils.get_elems(plans_path, "person"):
+    if person_filter is not None or plan_filter is not None:
+        logger.info(f"Skipped {stats['skipped']} of {stats['persons']} persons from {plans_path}.")
 
-        if version == 11:
-            person_id = person_xml.xpath("@id")[0]
-            agent_attributes = attributes.get(person_id, {})
-        else:
-            person_id, agent_attributes = get_attributes_from_person(person_xml)
 
-        vehicle = vehicles.get(person_id, None)
-        person = core.Person(person_id, attributes=agent_attributes, freq=weight, vehicle=vehicle)
+def parse_matsim_person_source(source: bytes, **kwargs) -> Optional[core.Person]:
+    """
+    Parse the raw xml of a MATSim person (see pam.read.index.stream_person_sources) into a core.Person
+    that keeps its source (see core.Person.set_source), see stream_matsim_persons for arguments.
+    Returns None if the person fails the person_filter or plan_filter.
+    """
+    person = parse_matsim_person(etree.fromstring(source), **kwargs)
+    if person is not None:
+        person.set_source(source)
+    return person
+
 
+def parse_matsim_person(
+    person_xml,
+    attributes = {},
+    vehicles = {},
+    weight : int = 100,
+    version : int = 12,
+    simplify_pt_trips : bool = False,
+    autocomplete : bool = True,
+    crop : bool = False,
+    keep_non_selected : bool = False,
+    leg_attributes : bool = True,
+    leg_route : bool = True,
+    person_filter : Optional[Callable[[str, dict], bool]] = None,
+    plan_filter : Optional[Callable[[PlanSummary], bool]] = None,
+    fields : Optional[set] = None,
+    int_times : bool = False,
+    ) -> Optional[core.Person]:
+    """
+    Parse a MATSim person element into a core.Person, see stream_matsim_persons for arguments.
+    Returns None if the person fails the person_filter or plan_filter.
+    """
+    if version == 11:
+        person_id = person_xml.xpath("@id")[0]
+        agent_attributes = attributes.get(person_id, {})
+    elif fields is None or 'attributes' in fields or person_filter is not None:
+        person_id, agent_attributes = get_attributes_from_person(person_xml)
+    else:
+        person_id, agent_attributes = person_xml.get('id'), {}
+
+    if person_filter is not None and not person_filter(person_id, agent_attributes):
+        return None
+    if fields is not None and 'attributes' not in fields:
+        agent_attributes = {}
+
+    if plan_filter is not None:
         for plan_xml in person_xml:
-            if plan_xml.get('selected') == 'yes':
-                person.plan = parse_matsim_plan(
+            if plan_xml.get('selected') == 'yes' and not plan_filter(summarise_matsim_plan(plan_xml)):
+                return None
+
+    vehicle = vehicles.get(person_id, None)
+    person = core.Person(person_id, attributes=agent_attributes, freq=weight, vehicle=vehicle)
+
+    for plan_xml in person_xml:
+        if plan_xml.get('selected') == 'yes':
+            person.plan = parse_matsim_plan(
+                plan_xml=plan_xml,
+                person_id=person_id,
+                version=version,
+                simplify_pt_trips=simplify_pt_trips,
+                crop=crop,
+                autocomplete=autocomplete,
+                leg_attributes=leg_attributes,
+                leg_route=leg_route,
+                fields=fields,
+                int_times=int_times,
+                )
+        elif keep_non_selected and plan_xml.get('selected') == 'no':
+            person.plans_non_selected.append(
+                parse_matsim_plan(
                     plan_xml=plan_xml,
                     person_id=person_id,
                     version=version,
@@ -172,23 +377,162 @@ def stream_matsim_persons(
                     autocomplete=autocomplete,
                     leg_attributes=leg_attributes,
                     leg_route=leg_route,
+                    fields=fields,
+                    int_times=int_times,
                     )
-            elif keep_non_selected and plan_xml.get('selected') == 'no':
-                person.plans_non_selected.append(
-                    parse_matsim_plan(
-                        plan_xml=plan_xml,
-                        person_id=person_id,
-                        version=version,
-                        simplify_pt_trips=simplify_pt_trips,
-                        crop=crop,
-                        autocomplete=autocomplete,
-                        leg_attributes=leg_attributes,
-                        leg_route=leg_route,
-                        )
-                    )
+                )
+    return person
+
+
+def _stream_matsim_persons_parallel(
+    plans_path,
+    attributes : dict,
+    vehicles : dict,
+    workers : int,
+    **kwargs,
+    ):
+    """
+    Parse chunks of MATSim persons in a process pool, yielding core.Persons (or None for filtered
+    persons) in their original order. Vehicles, and v11 agent attributes if they are not needed for
+    filtering, are assigned in the calling process, so that large maps do not need to be sent to workers.
+    Otherwise each chunk is sent only the attributes of its own persons.
+    Workers return plain snapshot records of persons (see pam.write.snapshot.person_record), which
+    are much cheaper to unpickle and rebuild in the calling process than pickled core.Persons.
+    At most 2 * workers chunks are held in memory at a time.
+    """
+    if kwargs["version"] != 11:
+        attributes = {}  # v12 attributes are read from the plans
+    filter_attributes = attributes if kwargs["person_filter"] is not None else {}
+    fields = kwargs["fields"]
+    if filter_attributes or (fields is not None and 'attributes' not in fields):
+        attributes = {}  # assigned (or dropped) by workers
+    parse_chunk = partial(_parse_matsim_chunk, **kwargs)
+    chunks = utils.split_elems(plans_path, "person", chunk_size=utils.DEFAULT_CHUNK_SIZE)
+    pending = deque()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunks:
+            pending.append(
+                executor.submit(parse_chunk, chunk, attributes=_chunk_attributes(chunk, filter_attributes))
+            )
+            if len(pending) >= 2 * workers:
+                yield from _complete_chunk(pending.popleft().result(), attributes, vehicles, kwargs["int_times"])
+        while pending:
+            yield from _complete_chunk(pending.popleft().result(), attributes, vehicles, kwargs["int_times"])
+
+
+def _chunk_attributes(chunk : bytes, attributes : dict) -> dict:
+    """
+    Attributes of the persons in a chunk, found by scanning (without parsing) the chunk.
+    """
+    if not attributes:
+        return {}
+    offsets = {}
+    _scan_persons(chunk, 0, offsets)
+    return {pid: attributes[pid] for pid in offsets if pid in attributes}
+
+
+def _parse_matsim_chunk(chunk : bytes, **kwargs) -> list:
+    records = []
+    for person_xml in utils.parse_elems(BytesIO(chunk), "person"):
+        person = parse_matsim_person(person_xml, **kwargs)
+        records.append(None if person is None else person_record(person))
+    return records
+
+
+def _complete_chunk(records, attributes, vehicles, int_times):
+    builder = _HouseholdBuilder(int_times)  # points are shared within a chunk
+    for record in records:
+        person = None if record is None else builder.person(record)
+        if person is not None:
+            if attributes:
+                person.attributes = attributes.get(person.pid, {})
+            vehicle = vehicles.get(person.pid)
+            if vehicle is not None:
+                person.assign_vehicle(vehicle)
         yield person
 
 
+def read_matsim_persons(
+    plans_path,
+    pids : list,
+    index : Optional[PersonIndex] = None,
+    save_index : bool = False,
+    attributes = {},
+    vehicles = {},
+    weight : int = 100,
+    version : int = 12,
+    simplify_pt_trips : bool = False,
+    autocomplete : bool = True,
+    crop : bool = False,
+    keep_non_selected : bool = False,
+    leg_attributes : bool = True,
+    leg_route : bool = True,
+    fields : Optional[Iterable[str]] = None,
+    int_times : bool = False,
+    ) -> list:
+    """
+    Read selected persons from a MATSim format population without scanning the whole file.
+    Persons are located using an index (see pam.read.index.PersonIndex), which is loaded from alongside
+    the plans (eg plans.xml.gz.idx) if saved there, otherwise (or if the plans changed) built.
+    Only the requested persons are parsed. Compressed plans are decompressed from the nearest gzip member
+    (see PersonIndex), or from the start for single stream (eg MATSim gzip) inputs.
+    :param plans_path: path to matsim format xml
+    :param pids: list of person ids
+    :param index: optional PersonIndex, otherwise loaded (or built) from alongside the plans
+    :param save_index: bool, save a newly built index alongside the plans for later reads, default False
+    :param attributes: {}, map of person attributes, only required for v11
+    :param vehicles: {}, map of vehciles
+    :param weight: int
+    :param version: int {11,12}, default = 12
+    :param simplify_pt_trips: bool, simplify legs in multi-leg trips, default = True
+    :param autocomplete: bool, fills missing leg and activity attributes, default = True
+    :param crop: bool, crop plans that go beyond 24 hours, default = False
+    :param keep_non_selected: Whether to parse non-selected plans (storing them in person.plans_non_selected).
+    :param leg_attributes: Parse leg attributes such as routing mode, default = True
+    :param leg_route: Parse leg route, default = True
+    :param fields: optional subset of MATSIM_FIELDS to parse, see stream_matsim_persons
+    :param int_times: bool, store plan times as integer seconds, see stream_matsim_persons
+    :return: list of core.Person, in order of given pids
+    """
+    logger = logging.getLogger(__name__)
+
+    if version not in [11, 12]:
+        raise UserWarning("Version must be set to 11 or 12.")
+
+    if fields is not None:
+        fields = validate_fields(fields)
+        leg_attributes = leg_attributes and 'leg_attributes' in fields
+        leg_route = leg_route and 'route' in fields
+
+    if index is None:
+        index = load_or_build_person_index(plans_path, save=save_index)
+
+    persons = {}
+    for pid, person_bytes in index.read(pids):
+        persons[pid] = parse_matsim_person(
+            etree.fromstring(person_bytes),
+            attributes=attributes,
+            vehicles=vehicles,
+            weight=weight,
+            version=version,
+            simplify_pt_trips=simplify_pt_trips,
+            autocomplete=autocomplete,
+            crop=crop,
+            keep_non_selected=keep_non_selected,
+            leg_attributes=leg_attributes,
+            leg_route=leg_route,
+            fields=fields,
+            int_times=int_times,
+        )
+
+    missing = [pid for pid in pids if pid not in persons]
+    if missing:
+        logger.warning(f"{len(missing)} persons not found in {plans_path}: {missing[:10]}")
+
+    return [persons[pid] for pid in pids if pid in persons]
+
+
 def parse_matsim_plan(
     plan_xml,
     person_id : str,
@@ -198,16 +542,26 @@ def parse_matsim_plan(
     autocomplete : bool,
     leg_attributes : bool = True,
     leg_route : bool = True,
+    fields : Optional[set] = None,
+    int_times : bool = False,
     ) -> activity.Plan:
     """
-    Parse a MATSim plan.
+    Parse a MATSim plan. Optionally only parse given fields (see MATSIM_FIELDS) and store times as
+    integer seconds (see activity.PlanComponent.set_int_times).
     """
     logger = logging.getLogger(__name__)
     act_seq = 0
     leg_seq = 0
-    arrival_dt = START_OF_DAY
+    if int_times:
+        parse_time = utils.matsim_time_to_seconds
+        arrival_dt = 0
+    else:
+        parse_time = utils.safe_strptime
+        arrival_dt = START_OF_DAY
     departure_dt = None
     plan = activity.Plan()
+    parse_locs = fields is None or 'loc' in fields
+    parse_links = fields is None or 'link' in fields
 
     for stage in plan_xml:
         """
@@ -218,19 +572,20 @@ def parse_matsim_plan(
             act_type = stage.get('type')
 
             loc = None
-            x, y = stage.get('x'), stage.get('y')
-            if x and y:
-                loc = Point(int(float(x)), int(float(y)))
+            if parse_locs:
+                x, y = stage.get('x'), stage.get('y')
+                if x and y:
+                    loc = Point(int(float(x)), int(float(y)))
 
             if act_type == 'pt interaction':
                 departure = stage.get('end_time')
                 if departure is not None:
-                    departure_dt = utils.safe_strptime(departure)
+                    departure_dt = parse_time(departure)
                 else:
-                    departure_dt = arrival_dt + timedelta(seconds=0.)
+                    departure_dt = arrival_dt
 
             else:
-                departure_dt = utils.safe_strptime(
+                departure_dt = parse_time(
                     stage.get('end_time', '24:00:00')
                 )
 
@@ -240,9 +595,9 @@ def parse_matsim_plan(
             plan.add(
                 activity.Activity(
                     seq=act_seq,
-                    act=act_type,
+                    act=_intern(act_type),
                     loc=loc,
-                    link=stage.get('link'),
+                    link=stage.get('link') if parse_links else None,
                     start_time=arrival_dt,
                     end_time=departure_dt
                 )
@@ -250,16 +605,24 @@ def parse_matsim_plan(
 
         if stage.tag == 'leg':
 
-            mode, route, attributes = unpack_leg(stage, version)
-            if not leg_attributes:
-                attributes = {}
+            if leg_route and leg_attributes:
+                mode, route, attributes = unpack_leg(stage, version)
+            else:  # avoid building unused routes and attributes
+                mode = stage.get("mode")
+                route = unpack_route(stage, version) if leg_route else None
+                attributes = get_attributes_from_legs(stage) if leg_attributes and version == 12 else None
+            mode = _intern(mode)
+            attributes = attributes or None  # legs without attributes share the empty default
 
             leg_seq += 1
             trav_time = stage.get('trav_time')
             if trav_time is not None:
-                h, m, s = trav_time.split(":")
-                leg_duration = timedelta(hours=int(h), minutes=int(m), seconds=int(s))
-                arrival_dt = departure_dt + leg_duration
+                if int_times:
+                    arrival_dt = departure_dt + utils.matsim_time_to_seconds(trav_time)
+                else:
+                    h, m, s = trav_time.split(":")
+                    leg_duration = timedelta(hours=int(h), minutes=int(m), seconds=int(s))
+                    arrival_dt = departure_dt + leg_duration
             else:
                 arrival_dt = departure_dt  # todo this assumes 0 duration unless known
 
@@ -280,8 +643,8 @@ def parse_matsim_plan(
                     activity.Leg(
                         seq=leg_seq,
                         mode=mode,
-                        start_link = route.get('start_link'),
-                        end_link = route.get('end_link'),
+                        start_link = route.start_link,
+                        end_link = route.end_link,
                         start_time = departure_dt,
                         end_time = arrival_dt,
                         distance = route.distance,
@@ -304,6 +667,8 @@ def parse_matsim_plan(
         plan.crop()
     if autocomplete:
         plan.autocomplete_matsim()
+    if int_times:
+        plan.set_int_times()  # components added by simplifying, cropping or autocompleting
 
     return plan
 
@@ -314,6 +679,15 @@ def unpack_leg(leg, version):
     return unpack_route_v11(leg)
 
 
+def unpack_route(leg, version):
+    route_xml = leg.xpath("route")
+    if not route_xml:
+        return activity.EMPTY_ROUTE
+    if version == 12:
+        return Route(route_xml)
+    return RouteV11(route_xml)
+
+
 def unpack_route_v11(leg):
     """
     Extract mode, network route and transit route as available.
@@ -325,7 +699,7 @@ def unpack_route_v11(leg):
         (xml_elem, string, list, dict, dict): (route, mode, network route, transit route, attributes)
     """
     mode = leg.get("mode")
-    route = RouteV11(leg.xpath("route"))
+    route = unpack_route(leg, version=11)
     return mode, route, {}
 
 
@@ -405,7 +779,7 @@ def unpack_leg_v12(leg):
         mode (str), route (pam.activity.Route), attributes (dict)
     """
     mode = leg.get("mode")
-    route = Route(leg.xpath("route"))
+    route = unpack_route(leg, version=12)
     attributes = get_attributes_from_legs(leg)
     return mode, route, attributes
 
@@ -469,29 +843,74 @@ def read_vehicles(all_vehicles_path, electric_vehicles_path=None):
     :param electric_vehicles_path: path to matsim electric_vehicles xml (optional)
     :return: dictionary of all vehicles: {ID: pam.vehicle.Vehicle or pam.vehicle.ElectricVehicle class object}
     """
-    vehicles = read_all_vehicles_file(all_vehicles_path)
+    return {vehicle.id: vehicle for vehicle in stream_vehicles(all_vehicles_path, electric_vehicles_path)}
+
+
+def stream_vehicles(all_vehicles_path, electric_vehicles_path=None) -> Iterator[Vehicle]:
+    """
+    Stream vehicles from an all_vehicles file (and optional electric_vehicles file), in a single pass
+    of the all_vehicles file, without holding all vehicles in memory. Vehicles listed in the electric
+    vehicles file are returned as ElectricVehicles, followed by any electric vehicles missing from the
+    all_vehicles file (see read_vehicles).
+    :param all_vehicles_path: path to matsim all_vehicles xml file
+    :param electric_vehicles_path: path to matsim electric_vehicles xml (optional)
+    :return: pam.vehicle.Vehicle or pam.vehicle.ElectricVehicle generator
+    """
+    electric = {}
     if electric_vehicles_path:
-        vehicles = read_electric_vehicles_file(electric_vehicles_path, vehicles)
-    return vehicles
+        electric = {
+            elem.get('id'): _electric_vehicle_attributes(elem)
+            for elem in utils.get_elems(electric_vehicles_path, "vehicle")
+        }
+    vehicle_types = {}
+    for definition in _vehicle_definitions(all_vehicles_path, vehicle_types):
+        if isinstance(definition, VehicleType):
+            continue
+        if definition.id in electric:
+            yield _electric_vehicle(definition.id, electric.pop(definition.id), definition.vehicle_type)
+        else:
+            yield definition
+    for id, attribs in electric.items():
+        yield ElectricVehicle(id=id, vehicle_type=VehicleType(id=attribs.pop('vehicle_type')), **attribs)
 
 
-def read_all_vehicles_file(path):
+def stream_electric_vehicles(path, vehicle_types: Optional[dict] = None) -> Iterator[ElectricVehicle]:
     """
-    Reads all_vehicles file following format https://www.matsim.org/files/dtd/vehicleDefinitions_v2.0.xsd
+    Stream electric vehicles from an electric_vehicles file following format
+    https://www.matsim.org/files/dtd/electric_vehicles_v1.dtd
+    :param path: path to matsim electric_vehicles xml
+    :param vehicle_types: optional dictionary of {ID: pam.vehicle.VehicleType} (see read_vehicle_types), vehicle
+        types not included default to the VehicleType defaults
+    :return: pam.vehicle.ElectricVehicle generator
+    """
+    vehicle_types = vehicle_types or {}
+    for elem in utils.get_elems(path, "vehicle"):
+        attribs = _electric_vehicle_attributes(elem)
+        type_id = attribs.pop('vehicle_type')
+        vehicle_type = vehicle_types.get(type_id) or VehicleType(id=type_id)
+        yield ElectricVehicle(id=elem.get('id'), vehicle_type=vehicle_type, **attribs)
+
+
+def read_vehicle_types(path) -> dict:
+    """
+    Reads the vehicle types of an all_vehicles file, stopping at the first vehicle.
     :param path: path to matsim all_vehicles xml file
-    :return: dictionary of all vehicles: {ID: pam.vehicle.Vehicle class object}
+    :return: dictionary of vehicle types: {ID: pam.vehicle.VehicleType}
     """
-    vehicles = {}
     vehicle_types = {}
+    for definition in _vehicle_definitions(path, vehicle_types):
+        if not isinstance(definition, VehicleType):
+            break
+    return vehicle_types
 
-    for vehicle_type_elem in utils.get_elems(path, "vehicleType"):
-        vehicle_types[vehicle_type_elem.get('id')] = VehicleType.from_xml_elem(vehicle_type_elem)
 
-    for vehicle_elem in utils.get_elems(path, "vehicle"):
-        vehicles[vehicle_elem.get('id')] = Vehicle(id=vehicle_elem.get('id'),
-                                                   vehicle_type=vehicle_types[vehicle_elem.get('type')])
-
-    return vehicles
+def read_all_vehicles_file(path):
+    """
+    Reads all_vehicles file following format https://www.matsim.org/files/dtd/vehicleDefinitions_v2.0.xsd
+    :param path: path to matsim all_vehicles xml file
+    :return: dictionary of all vehicles: {ID: pam.vehicle.Vehicle class object}
+    """
+    return {vehicle.id: vehicle for vehicle in stream_vehicles(path)}
 
 
 def read_electric_vehicles_file(path, vehicles: dict = None):
@@ -507,18 +926,41 @@ def read_electric_vehicles_file(path, vehicles: dict = None):
         logging.warning('All Vehicles dictionary was not passed. This will result in defaults for Vehicle Types'
                         'Definitions assumed by the Electric Vehicles')
         vehicles = {}
-    for vehicle_elem in utils.get_elems(path, "vehicle"):
-        attribs = dict(vehicle_elem.attrib)
-        id = attribs.pop('id')
-        attribs['battery_capacity'] = float(attribs['battery_capacity'])
-        attribs['initial_soc'] = float(attribs['initial_soc'])
+    for elem in utils.get_elems(path, "vehicle"):
+        id = elem.get('id')
+        attribs = _electric_vehicle_attributes(elem)
         if id in vehicles:
-            elem_vehicle_type = attribs.pop('vehicle_type')
-            vehicle_type = vehicles[id].vehicle_type
-            if elem_vehicle_type != vehicle_type.id:
-                raise RuntimeError(f'Electric vehicle: {id} has mis-matched vehicle type '
-                                   f'defined: {elem_vehicle_type} != {vehicle_type.id}')
+            vehicles[id] = _electric_vehicle(id, attribs, vehicles[id].vehicle_type)
         else:
-            vehicle_type = VehicleType(id=attribs.pop('vehicle_type'))
-        vehicles[id] = ElectricVehicle(id=id, vehicle_type=vehicle_type, **attribs)
+            vehicles[id] = ElectricVehicle(id=id, vehicle_type=VehicleType(id=attribs.pop('vehicle_type')), **attribs)
     return vehicles
+
+
+def _vehicle_definitions(path, vehicle_types: dict) -> Iterator[Union[VehicleType, Vehicle]]:
+    """
+    Stream vehicle types and vehicles of an all_vehicles file in file order, adding vehicle types
+    to the vehicle_types dictionary.
+    """
+    for elem in utils.get_elems(path, ["vehicleType", "vehicle"]):
+        if etree.QName(elem).localname == "vehicleType":
+            vehicle_type = VehicleType.from_xml_elem(elem)
+            vehicle_types[vehicle_type.id] = vehicle_type
+            yield vehicle_type
+        else:
+            yield Vehicle(id=elem.get('id'), vehicle_type=vehicle_types[elem.get('type')])
+
+
+def _electric_vehicle_attributes(elem) -> dict:
+    attribs = dict(elem.attrib)
+    attribs.pop('id')
+    attribs['battery_capacity'] = float(attribs['battery_capacity'])
+    attribs['initial_soc'] = float(attribs['initial_soc'])
+    return attribs
+
+
+def _electric_vehicle(id, attribs: dict, vehicle_type: VehicleType) -> ElectricVehicle:
+    elem_vehicle_type = attribs.pop('vehicle_type')
+    if elem_vehicle_type != vehicle_type.id:
+        raise RuntimeError(f'Electric vehicle: {id} has mis-matched vehicle type '
+                           f'defined: {elem_vehicle_type} != {vehicle_type.id}')
+    return ElectricVehicle(id=id, vehicle_type=vehicle_type, **attribs)
@@ -0,0 +1,150 @@
+import json
+import os
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+import pam.core as core
+from pam.activity import Route, RouteV11
+from pam.frame import PopulationFrame, CATEGORICAL_COLUMNS, LEG_COLUMNS, _objects
+from pam.vehicle import CapacityType, ElectricVehicle, Vehicle, VehicleType
+from pam.utils import import_pyarrow
+from pam.write.parquet import PARQUET_FORMAT_VERSION, PARQUET_METADATA
+
+
+def read_parquet(dir: str, int_times: bool = False) -> core.Population:
+    """
+    Read a population written by pam.write.to_parquet.
+    :param dir: str, path to population directory
+    :param int_times: bool, store plan times as integer seconds, default False
+    :return: core.Population
+    """
+    metadata = read_parquet_metadata(dir)
+    population = core.Population(name=metadata['name'])
+    for frame in stream_parquet_frames(dir):
+        frame.to_population(int_times=int_times, population=population)
+    return population
+
+
+def stream_parquet_persons(dir: str, int_times: bool = False) -> Iterator[core.Person]:
+    """
+    Stream persons from a population written by pam.write.to_parquet, reading one part
+    (batch of households) at a time.
+    :param dir: str, path to population directory
+    :param int_times: bool, store plan times as integer seconds, default False
+    :return: core.Person generator
+    """
+    for frame in stream_parquet_frames(dir):
+        for _, _, person in frame.to_population(int_times=int_times).people():
+            yield person
+
+
+def stream_parquet_frames(dir: str) -> Iterator[PopulationFrame]:
+    """
+    Stream parts (batches of households) of a population written by pam.write.to_parquet as
+    frame.PopulationFrames.
+    :param dir: str, path to population directory
+    :return: frame.PopulationFrame generator
+    """
+    _, pq = import_pyarrow()
+    metadata = read_parquet_metadata(dir)
+    vehicles = _VehicleDecoder()
+    for part in range(metadata['parts']):
+        tables = {
+            name: _read_table(pq, os.path.join(dir, name, f"part-{part:05d}.parquet"))
+            for name in ['households', 'persons', 'activities', 'legs']
+        }
+        households, persons, legs = tables['households'], tables['persons'], tables['legs']
+        households['attributes'] = _decode_json(households.attributes)
+        persons['attributes'] = _decode_json(persons.attributes)
+        persons['vehicle'] = [vehicles(v) for v in persons.vehicle]
+        legs['attributes'] = _decode_json(legs.attributes, empty=None)
+        route = np.full(len(legs), None, dtype=object)
+        if metadata['routes']:
+            routes = _read_table(pq, os.path.join(dir, "routes", f"part-{part:05d}.parquet"))
+            route[routes.leg.to_numpy()] = _decode_routes(routes)
+        legs['route'] = route
+        yield PopulationFrame(
+            households=households,
+            persons=persons,
+            activities=tables['activities'],
+            legs=legs[LEG_COLUMNS],
+            name=metadata['name'],
+        )
+
+
+def read_parquet_metadata(dir: str) -> dict:
+    path = os.path.join(dir, PARQUET_METADATA)
+    if not os.path.exists(path):
+        raise UserWarning(f"Cannot find Parquet population metadata at {path}.")
+    with open(path) as f:
+        metadata = json.load(f)
+    if metadata.get('version') != PARQUET_FORMAT_VERSION:
+        raise UserWarning(
+            f"Unsupported Parquet population version {metadata.get('version')}, "
+            f"expected {PARQUET_FORMAT_VERSION}."
+        )
+    return metadata
+
+
+def _read_table(pq, path: str) -> pd.DataFrame:
+    df = pq.read_table(path).to_pandas()
+    for name in df.columns:
+        if name in CATEGORICAL_COLUMNS:
+            continue
+        dtype = df[name].dtype
+        # missing strings, json and lists may be read as NaN or pd.NA, decode them as None
+        # (as an object column, pandas would otherwise infer a string dtype again)
+        if isinstance(dtype, pd.CategoricalDtype) or not (
+            pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)
+        ):
+            df[name] = pd.Series(_objects(df[name]), index=df.index, dtype=object)
+    return df
+
+
+def _decode_json(values: pd.Series, empty=dict) -> list:
+    return [json.loads(value) if value is not None else (empty() if empty else None) for value in values]
+
+
+def _decode_routes(routes: pd.DataFrame) -> list:
+    decoded = []
+    for v11, type, start_link, end_link, trav_time, distance, vehicle_ref_id, extra, links, description in zip(
+        routes.v11, routes['type'], routes.start_link, routes.end_link, routes.trav_time, routes.distance,
+        routes.vehicle_ref_id, routes.extra, routes.links, routes.description
+    ):
+        attributes = {}
+        for key, value in [
+            ('type', type), ('start_link', start_link), ('end_link', end_link), ('trav_time', trav_time),
+            ('distance', distance), ('vehicleRefId', vehicle_ref_id)
+        ]:
+            if value is not None:
+                attributes[key] = value
+        if extra is not None:
+            attributes.update(json.loads(extra))
+        route = RouteV11() if v11 else Route()
+        route.set(attributes, " ".join(links) if links is not None else description)
+        decoded.append(route)
+    return decoded
+
+
+class _VehicleDecoder:
+    """
+    Decode json vehicles, sharing vehicle types between vehicles.
+    """
+
+    def __init__(self) -> None:
+        self.vehicle_types = {}
+
+    def __call__(self, value):
+        if value is None:
+            return None
+        data = json.loads(value)
+        vehicle_type = data.pop('vehicle_type')
+        key = json.dumps(vehicle_type, sort_keys=True)
+        if key not in self.vehicle_types:
+            capacity = CapacityType(**vehicle_type.pop('capacity'))
+            self.vehicle_types[key] = VehicleType(capacity=capacity, **vehicle_type)
+        if data.pop('electric'):
+            return ElectricVehicle(vehicle_type=self.vehicle_types[key], **data)
+        return Vehicle(vehicle_type=self.vehicle_types[key], **data)
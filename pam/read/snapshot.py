@@ -0,0 +1,165 @@
+import json
+import pickle
+import zlib
+from typing import Iterator, Optional
+
+import pam.core as core
+from pam.activity import Activity, Leg, Plan, Route, RouteV11
+from pam.frame import _Points, _time
+from pam.location import Location
+from pam.read.parquet import _VehicleDecoder
+import pam.utils as utils
+from pam.write.snapshot import FRAME_HEADER, SNAPSHOT_FORMAT_VERSION, SNAPSHOT_MAGIC, import_compression
+
+
+def load_snapshot(path: str, int_times: bool = False) -> core.Population:
+    """
+    Read a population snapshot written by pam.write.save_snapshot.
+    :param path: str, path to snapshot
+    :param int_times: bool, store plan times as integer seconds, default False
+    :return: core.Population
+    """
+    population = core.Population(name=read_snapshot_header(path)['name'])
+    for household in iter_snapshot_households(path, int_times=int_times):
+        population.add(household)
+    return population
+
+
+def iter_snapshot_households(path: str, int_times: bool = False) -> Iterator[core.Household]:
+    """
+    Stream households from a snapshot written by pam.write.save_snapshot, unpickling one household
+    at a time rather than the whole population.
+    :param path: str, path to snapshot
+    :param int_times: bool, store plan times as integer seconds, default False
+    :return: core.Household generator
+    """
+    with open(path, "rb") as file:
+        header = _read_header(file, path)
+        decompress = decompressor(header['compression'])
+        builder = _HouseholdBuilder(int_times)
+        while True:
+            size = _read(file, FRAME_HEADER.size, path)
+            size, = FRAME_HEADER.unpack(size)
+            if not size:
+                return
+            yield builder(pickle.loads(decompress(_read(file, size, path))))
+
+
+def read_snapshot_header(path: str) -> dict:
+    """
+    Read snapshot format version, population name and compression.
+    :param path: str, path to snapshot
+    :return: dict
+    """
+    with open(path, "rb") as file:
+        return _read_header(file, path)
+
+
+def decompressor(compression: Optional[str]):
+    """
+    Return function decompressing bytes (see pam.write.snapshot.compressor).
+    :param compression: {None, 'zlib', 'zstd', 'lz4'}
+    """
+    if compression is None:
+        return lambda data: data
+    if compression == 'zlib':
+        return zlib.decompress
+    if compression == 'zstd':
+        return import_compression('zstandard').ZstdDecompressor().decompress
+    if compression == 'lz4':
+        return import_compression('lz4.frame').decompress
+    raise UserWarning(f"Unknown snapshot compression: {compression}.")
+
+
+def _read_header(file, path: str) -> dict:
+    if file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        raise UserWarning(f"{path} is not a pam snapshot.")
+    size, = FRAME_HEADER.unpack(_read(file, FRAME_HEADER.size, path))
+    header = json.loads(_read(file, size, path))
+    if header.get('version') != SNAPSHOT_FORMAT_VERSION:
+        raise UserWarning(
+            f"Unsupported snapshot version {header.get('version')}, expected {SNAPSHOT_FORMAT_VERSION}."
+        )
+    return header
+
+
+def _read(file, size: int, path: str) -> bytes:
+    data = file.read(size)
+    if len(data) != size:
+        raise UserWarning(f"Snapshot {path} is truncated.")
+    return data
+
+
+class _HouseholdBuilder:
+    """
+    Build households from snapshot records (see pam.write.snapshot.household_record), sharing
+    vehicle types, and points within a household (so that memory does not grow with the number of
+    households streamed).
+    """
+
+    def __init__(self, int_times: bool) -> None:
+        self.point = _Points()
+        self.vehicles = _VehicleDecoder()
+        self.to_time = (lambda s: s) if int_times else utils.seconds_to_datetime
+
+    def __call__(self, record: tuple) -> core.Household:
+        hid, hh_freq, attributes, location, persons = record
+        self.point = _Points()
+        household = core.Household(hid, attributes=attributes, freq=hh_freq, location=self.location(location))
+        for person in persons:
+            household.add(self.person(person))
+        return household
+
+    def person(self, record: tuple) -> core.Person:
+        pid, person_freq, attributes, home, vehicle, plan, plans_non_selected = record
+        person = core.Person(pid, freq=person_freq, attributes=attributes, home_location=self.location(home))
+        person.vehicle = self.vehicles(vehicle)
+        person.plan = self.plan(plan, person)
+        person.plans_non_selected = [self.plan(p, person) for p in plans_non_selected]
+        return person
+
+    def plan(self, record: tuple, person: core.Person) -> Plan:
+        score, plan_freq, home, components = record
+        plan = Plan(
+            home_location=person.home_location if home is None else self.location(home[0]), freq=plan_freq
+        )
+        plan.score = score
+        to_time = self.to_time
+        for component in components:
+            if len(component) == 6:
+                seq, act, location, start_s, end_s, freq = component
+                area, link, loc = self.location_values(location)
+                plan.day.append(Activity(
+                    seq=seq, act=act, area=area, link=link, loc=loc, start_time=_time(start_s, to_time),
+                    end_time=_time(end_s, to_time), freq=freq,
+                ))
+            else:
+                seq, mode, purp, start, end, start_s, end_s, distance, freq, attributes, route = component
+                start_area, start_link, start_loc = self.location_values(start)
+                end_area, end_link, end_loc = self.location_values(end)
+                plan.day.append(Leg(
+                    seq=seq, mode=mode, purp=purp, start_area=start_area, end_area=end_area,
+                    start_link=start_link, end_link=end_link, start_loc=start_loc, end_loc=end_loc,
+                    start_time=_time(start_s, to_time), end_time=_time(end_s, to_time), distance=distance,
+                    freq=freq, attributes=attributes, route=_route(route),
+                ))
+        return plan
+
+    def location(self, record: Optional[tuple]) -> Location:
+        area, link, loc = self.location_values(record)
+        return Location(loc=loc, link=link, area=area)
+
+    def location_values(self, record: Optional[tuple]) -> tuple:
+        if record is None:
+            return None, None, None
+        area, link, xy = record
+        return area, link, None if xy is None else self.point(*xy)
+
+
+def _route(record: Optional[tuple]) -> Optional[Route]:
+    if record is None:
+        return None
+    v11, attributes, text = record
+    route = RouteV11() if v11 else Route()
+    route.set(attributes, text)
+    return route
@@ -3,6 +3,7 @@ from prettytable import PrettyTable
 from enum import Enum
 
 from pam.core import Population
+from pam.frame import PopulationFrame
 
 
 class TEXT(Enum):
@@ -177,6 +178,8 @@ def activities_summary(population: Population, key="subpopulation") -> PrettyTab
 
 
 def count_activites(population: Population, key=None, value=None) -> dict:
+    if isinstance(population, PopulationFrame):
+        return population.activity_counts(key, value)
     classes = population.activity_classes
     summary = {a: 0 for a in classes}
     for _, _, person in population.people():
@@ -216,6 +219,8 @@ def modes_summary(population: Population, key="subpopulation") -> PrettyTable:
 
 
 def count_modes(population: Population, key=None, value=None) -> dict:
+    if isinstance(population, PopulationFrame):
+        return population.mode_counts(key, value)
     modes = population.mode_classes
     summary = {m: 0 for m in modes}
     for _, _, person in population.people():
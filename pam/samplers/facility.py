@@ -7,7 +7,7 @@ from lxml import etree as et
 import logging
 
 from pam.samplers.spatial import RandomPointSampler
-from pam.utils import DEFAULT_GZIP_COMPRESSION, create_crs_attribute, create_local_dir, is_gzip
+from pam.utils import create_crs_attribute, create_local_dir, xml_output
 from pam import variables
 
 import pandas as pd
@@ -53,6 +53,7 @@ class FacilitySampler:
 
         # Fix random seed
         self.seed = seed
+        self.rng = np.random.default_rng(seed)
 
         if activities is None:
             self.activities = list(set(facilities.activity))
@@ -141,7 +142,7 @@ class FacilitySampler:
             if isinstance(sampler, GeneratorType):
                 return next(sampler)
             else:
-                return next(sampler(mode, previous_duration, previous_loc))
+                return sampler(mode, previous_duration, previous_loc)
 
     def spatial_join(self, facilities, zones):
         """
@@ -200,7 +201,10 @@ class FacilitySampler:
                         # weighted sampler
                         weights = facs[weight_on]
                         transit_distance = facs['transit'] if max_walk is not None else None
-                        sampler_dict[zone][act] = inf_yielder(points, weights, transit_distance, max_walk, self.TRANSIT_MODES, self.EXPECTED_EUCLIDEAN_SPEEDS, seed=self.seed)
+                        sampler_dict[zone][act] = WeightedSampler(
+                            points, weights, transit_distance, max_walk, self.TRANSIT_MODES,
+                            self.EXPECTED_EUCLIDEAN_SPEEDS, rng=self.rng
+                            )
                     else:
                         # simple sampler
                         sampler_dict[zone][act] = inf_yielder(points,seed=self.seed)
@@ -208,12 +212,20 @@ class FacilitySampler:
                     sampler_dict[zone][act] = None
         return sampler_dict
 
-    def write_facilities_xml(self, path, comment=None, coordinate_reference_system=None):
-
+    def write_facilities_xml(
+        self, path, comment=None, coordinate_reference_system=None, compression='infer', compression_level=None
+    ):
+        """
+        Write sampled facilities to MATSim facilities xml.
+        :param path: output path, compression is inferred from its suffix (.gz or .zst) unless given
+        :param comment: {str, None}, default None, optionally add a comment string to the xml output
+        :param coordinate_reference_system: {str, None}, default None, optionally add CRS attribute
+        :param compression: {'infer', None, 'gzip', 'pgzip', 'zstd'}, default 'infer' (see pam.utils.open_output)
+        :param compression_level: {int, None}, default None (compression default)
+        """
         create_local_dir(os.path.dirname(path))
-    
-        compression = DEFAULT_GZIP_COMPRESSION if is_gzip(path) else 0
-        with et.xmlfile(path, encoding="utf-8", compression=compression) as xf:
+
+        with xml_output(path, compression, compression_level) as xf:
             xf.write_declaration()
             xf.write_doctype(
                 '<!DOCTYPE facilities SYSTEM "http://matsim.org/files/dtd/facilities_v1.dtd">'
@@ -246,6 +258,151 @@ def euclidean_distance(p1, p2):
     return ((p1.x-p2.x)**2 + (p1.y-p2.y)**2)**0.5
 
 
+class AliasTable:
+
+    def __init__(self, weights):
+        """
+        Vose alias table for weighted sampling (with replacement) of indices in O(1) per draw.
+        Zero weighted indices are never drawn.
+        :param weights: array-like of non-negative weights
+        """
+        weights = np.asarray(weights, dtype=float)
+        total = weights.sum()
+        if not len(weights) or not np.isfinite(weights).all() or (weights < 0).any() or not total > 0:
+            raise UserWarning("Alias table weights must be finite, non-negative and sum to a positive value.")
+
+        self.n = len(weights)
+        scaled = (weights * (self.n / total)).tolist()
+        self.prob = [1.0] * self.n
+        self.alias = list(range(self.n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1
+            if scaled[l] < 1:
+                small.append(l)
+            else:
+                large.append(l)
+        # whatever remains is (up to rounding) exactly full
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self, rng):
+        """
+        Draw an index, using a single uniform variate to pick both the column and the coin.
+        :param rng: np.random.Generator
+        :return: int
+        """
+        u = rng.random() * self.n
+        i = int(u)
+        if i == self.n:  # guard against rounding up
+            i -= 1
+        if u - i < self.prob[i]:
+            return i
+        return self.alias[i]
+
+
+class WeightedSampler:
+
+    def __init__(
+        self,
+        candidates,
+        weights,
+        transit_distance=None,
+        max_walk=None,
+        transit_modes=None,
+        expected_euclidean_speeds=None,
+        rng=None
+        ):
+        """
+        Weighted and rule-based facility sampler (with replacement). Alias tables are built once, on
+        first use, for the base weights and for the transit (max walk) adjusted weights. Draws that
+        depend on the previous location are re-weighted by distance and drawn by binary search.
+        :params list candidates: a list of tuples, containing candidate facilities and their index:
+        :params pd.Series weights: sampling weights (ie facility floorspace)
+        :params pd.Series transit_distance: distance of each candidate facility from the closest PT stop
+        :params float max_walk: maximum walking distance from a PT stop
+        :params list transit_modes: a list of PT modes (default variables.TRANSIT_MODES)
+        :params dict expected_euclidean_speeds: the euclidean speed of the various modes in m/s (default variables.EXPECTED_EUCLIDEAN_SPEEDS)
+        :params np.random.Generator rng: random number generator (default None creates an unseeded generator)
+        """
+        self.candidates = candidates
+        self.weights = np.asarray(weights, dtype=float)
+        self.transit_distance = transit_distance
+        self.max_walk = max_walk
+        self.transit_modes = transit_modes if transit_modes is not None else variables.TRANSIT_MODES
+        self.expected_euclidean_speeds = expected_euclidean_speeds if expected_euclidean_speeds is not None else variables.EXPECTED_EUCLIDEAN_SPEEDS
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self._weights = {}
+        self._tables = {}
+        self._xy = None
+
+    def __call__(self, mode=None, previous_duration=None, previous_loc=None):
+        """
+        Sample a candidate.
+        :params str mode: transport mode used to access facility
+        :params pd.Timedelta previous_duration: the time duration of the arriving leg
+        :params shapely.Point previous_loc: the location of the last visited activity
+        """
+        transit = isinstance(self.transit_distance, pd.Series) and mode in self.transit_modes
+
+        if previous_loc is None:
+            table = self._tables.get(transit)
+            if table is None:
+                table = self._tables[transit] = AliasTable(self.mode_weights(transit))
+            return self.candidates[table.sample(self.rng)]
+
+        weights = self.distance_weights(
+            self.mode_weights(transit), mode, previous_duration, previous_loc
+            )
+        cumulative = np.cumsum(weights)
+        i = int(np.searchsorted(cumulative, self.rng.random() * cumulative[-1], side='right'))
+        return self.candidates[min(i, len(self.candidates) - 1)]
+
+    def mode_weights(self, transit):
+        """
+        Base weights, optionally adjusted for access by transit.
+        :params bool transit: if True, replace weights of candidates beyond max walk with a very small value
+        """
+        weights = self._weights.get(transit)
+        if weights is None:
+            weights = self.weights
+            if transit:
+                ## if a transit mode is used and the distance from a stop is longer than the maximum walking distance,
+                ## then replace the weight with a very small value
+                weights = np.where(
+                    self.transit_distance.values > self.max_walk,
+                    weights * variables.SMALL_VALUE, # if no alternative is found within the acceptable range, the initial weights will be used
+                    weights
+                )
+            self._weights[transit] = weights
+        return weights
+
+    def distance_weights(self, weights, mode, previous_duration, previous_loc):
+        """
+        Normalise weights by deviation from the (expected) distance from the last visited location.
+        """
+        if self._xy is None:
+            self._xy = np.array([(c[1].x, c[1].y) for c in self.candidates], dtype=float).reshape(-1, 2)
+
+        # calculate euclidean distance between the last visited location and every candidate location
+        distances = np.hypot(self._xy[:, 0] - previous_loc.x, self._xy[:, 1] - previous_loc.y)
+
+        # calculate deviation from "expected" distance
+        speeds = self.expected_euclidean_speeds
+        speed = speeds[mode] if mode in speeds.keys() else speeds['average']
+        expected_distance = (previous_duration / pd.Timedelta(seconds=1)) * speed  # (in meters)
+        distance_weights = np.abs(distances - expected_distance)
+        distance_weights = np.where(distance_weights==0, variables.SMALL_VALUE, distance_weights) # avoid having zero weights
+
+        return weights / (distance_weights ** 2) # distance decay factor of 2
+
+
 def inf_yielder(candidates, weights = None, transit_distance=None, max_walk=None, transit_modes=None, expected_euclidean_speeds=None, seed:int=None):
     """
     Redirect to the appropriate sampler.
@@ -283,7 +440,7 @@ def inf_yielder_simple(candidates, seed:int = None):
 
 def inf_yielder_weighted(candidates, weights, transit_distance, max_walk, transit_modes, expected_euclidean_speeds, mode, previous_duration, previous_loc, seed:int=None):
     """
-    A more complex sampler, which allows for weighted and rule-based sampling (with replacement).
+    Endlessly yield weighted and rule-based samples (with replacement), see WeightedSampler.
     :params list candidates: a list of tuples, containing candidate facilities and their index:
     :params pd.Series weights: sampling weights (ie facility floorspace)
     :params pd.Series transit_distance: distance of each candidate facility from the closest PT stop
@@ -293,41 +450,9 @@ def inf_yielder_weighted(candidates, weights, transit_distance, max_walk, transi
     :params shapely.Point previous_loc: the location of the last visited activity
     :params int seed: seed of pseudorandom number generator (default None means that the seed remains unfixed)
     """
-    # Fix random seed
-    np.random.seed(seed)
-    if isinstance(weights, pd.Series):
-        # if a series of facility weights is provided, perform weighted sampling with replacement
-        while True:
-
-            ## if a transit mode is used and the distance from a stop is longer than the maximum walking distance,
-            ## then replace the weight with a very small value
-            if isinstance(transit_distance, pd.Series) and mode in transit_modes:
-                weights = np.where(
-                    transit_distance > max_walk,
-                    weights * variables.SMALL_VALUE, # if no alternative is found within the acceptable range, the initial weights will be used
-                    weights
-                )
-            else:
-                weights = weights.values
-
-            # if the last location has been passed to the sampler, normalise by (expected) distance
-            if previous_loc is not None:
-
-                # calculate euclidean distance between the last visited location and every candidate location
-                distances = np.array([euclidean_distance(previous_loc, candidate[1]) for candidate in candidates])
-
-                # calculate deviation from "expected" distance
-                speed = expected_euclidean_speeds[mode] if mode in expected_euclidean_speeds.keys() else expected_euclidean_speeds['average']
-                expected_distance = (previous_duration / pd.Timedelta(seconds=1)) * speed  # (in meters)
-                distance_weights = np.abs(distances - expected_distance)
-                distance_weights = np.where(distance_weights==0, variables.SMALL_VALUE, distance_weights) # avoid having zero weights
-
-                ## normalise weights by distance
-                # weights = weights / np.exp(distance_weights) # exponentiate distances to reduce the effect very small distances
-                # weights = weights / np.exp(distance_weights/distance_weights.max())
-                # weights = weights / (1 + np.exp(1*(distance_weights - distance_weights.mean()))) # alternative formulation: logistic curve
-                # weights = weights / (1 + np.exp((distance_weights))) # alternative formulation: logistic curve
-                weights = weights / (distance_weights ** 2) # distance decay factor of 2
-
-            weights = weights / weights.sum() # probability weights should add up to 1
-            yield candidates[np.random.choice(len(candidates), p = weights)]
+    sampler = WeightedSampler(
+        candidates, weights, transit_distance, max_walk, transit_modes, expected_euclidean_speeds,
+        rng=np.random.default_rng(seed)
+        )
+    while True:
+        yield sampler(mode, previous_duration, previous_loc)
@@ -1,7 +1,6 @@
 from typing import DefaultDict, Optional
 import numpy as np
 from datetime import datetime as dt
-from datetime import timedelta as td
 import logging
 
 from pam.core import Person
@@ -9,6 +8,9 @@ from pam.activity import Activity, Leg, Plan
 from pam.variables import TRANSIT_MODES
 from pam import utils
 
+HOUR = 3600
+DAY = 24 * HOUR
+
 class CharyparNagelPlanScorer:
 
     example_config = {
@@ -163,8 +165,8 @@ class CharyparNagelPlanScorer:
         non_wrapped = activities[1:-1]
         wrapped_act = Activity(
             act=activities[0].act,
-            start_time=activities[-1].start_time,
-            end_time=activities[0].end_time + td(days=1)
+            start_time=activities[-1].start_s,
+            end_time=activities[0].end_s + DAY
         )
         return wrapped_act, non_wrapped
 
@@ -215,30 +217,25 @@ class CharyparNagelPlanScorer:
         performing = cnfg["performing"]
         typical_dur = utils.matsim_duration_to_hours(cnfg[activity.act]["typicalDuration"])
 
+        # times are compared by time of day, ie seconds modulo a day, as per MATSim
+        actual_start_time = activity.start_s
         opening_time = cnfg[activity.act].get("openingTime")
         if opening_time is not None:
-            opening_time = utils.matsim_time_to_datetime(opening_time)
-            if opening_time.time() > activity.start_time.time():
+            opening_time = utils.matsim_time_to_seconds(opening_time)
+            if opening_time % DAY > actual_start_time % DAY:
                 actual_start_time = opening_time
-            else:
-                actual_start_time = activity.start_time
-        else:
-            actual_start_time = activity.start_time
 
+        actual_end_time = activity.end_s
         closing_time = cnfg[activity.act].get("closingTime")
         if closing_time is not None:
-            closing_time = utils.matsim_time_to_datetime(closing_time)
-            if closing_time.time() < activity.end_time.time():
+            closing_time = utils.matsim_time_to_seconds(closing_time)
+            if closing_time % DAY < actual_end_time % DAY:
                 actual_end_time = closing_time
-            else:
-                actual_end_time = activity.end_time
-        else:
-            actual_end_time = activity.end_time
 
-        if actual_end_time < actual_start_time or actual_start_time > actual_end_time:
+        if actual_end_time < actual_start_time:
             duration = 0
         else:
-            duration = (actual_end_time - actual_start_time) / td(hours = 1)
+            duration = (actual_end_time - actual_start_time) / HOUR
 
         if duration < typical_dur / np.e:
             return (duration * np.e - typical_dur) * performing
@@ -252,31 +249,27 @@ class CharyparNagelPlanScorer:
         opening_time = cnfg[activity.act].get("openingTime")
         if opening_time is None:
             return 0.0
-        opening_dt = utils.matsim_time_to_datetime(opening_time)
-        start_dt = activity.start_time
-        if start_dt.time() < opening_dt.time():
-            return waiting * ((opening_dt - start_dt)  / td(hours = 1))
+        opening_s = utils.matsim_time_to_seconds(opening_time)
+        start_s = activity.start_s
+        if start_s % DAY < opening_s % DAY:
+            return waiting * ((opening_s - start_s) / HOUR)
         return 0.0
 
     def late_arrival_score(self, activity, cnfg) -> float:
         if cnfg[activity.act].get("latestStartTime") is not None and cnfg.get("lateArrival"):
-            latest_start_time = utils.matsim_time_to_datetime(
-                cnfg[activity.act]["latestStartTime"]
-                )
-            if activity.start_time.time() > latest_start_time.time():
-                return cnfg["lateArrival"] \
-                    * ((activity.start_time - latest_start_time) / td(hours = 1))
+            latest_start_s = utils.matsim_time_to_seconds(cnfg[activity.act]["latestStartTime"])
+            start_s = activity.start_s
+            if start_s % DAY > latest_start_s % DAY:
+                return cnfg["lateArrival"] * ((start_s - latest_start_s) / HOUR)
         return 0.0
 
     def early_departure_score(self, activity, cnfg) -> float:
         if cnfg[activity.act].get("earliestEndTime") is not None \
         and cnfg.get("earlyDeparture"):
-            earliest_end_time = utils.matsim_time_to_datetime(
-                cnfg[activity.act]["earliestEndTime"]
-                )
-            if activity.end_time.time() < earliest_end_time.time():
-                return cnfg["earlyDeparture"] \
-                    * ((earliest_end_time - activity.end_time) / td(hours = 1))
+            earliest_end_s = utils.matsim_time_to_seconds(cnfg[activity.act]["earliestEndTime"])
+            end_s = activity.end_s
+            if end_s % DAY < earliest_end_s % DAY:
+                return cnfg["earlyDeparture"] * ((earliest_end_s - end_s) / HOUR)
         return 0.0
 
     def too_short_score(self, activity, cnfg) -> float:
@@ -290,9 +283,11 @@ class CharyparNagelPlanScorer:
         return 0.0
 
     def pt_waiting_time_score(self, leg, cnfg):
-        print("BT", leg.boarding_time)
-        if cnfg.get("waitingPt") and leg.boarding_time:
-            waiting = (leg.boarding_time - leg.start_time) / td(hours = 1)
+        if cnfg.get("waitingPt"):
+            boarding_s = leg.boarding_s
+            if boarding_s is None:
+                return 0.0
+            waiting = (boarding_s - leg.start_s) / HOUR
             if waiting > 0:
                 return cnfg["waitingPt"] * waiting
         return 0.0
@@ -302,8 +297,10 @@ class CharyparNagelPlanScorer:
 
     def travel_time_score(self, leg, cnfg) -> float:
         duration = leg.hours
-        if cnfg.get("waitingPt") and leg.boarding_time:
-            duration -= ((leg.boarding_time - leg.start_time) / td(hours = 1))
+        if cnfg.get("waitingPt"):
+            boarding_s = leg.boarding_s
+            if boarding_s is not None:
+                duration -= (boarding_s - leg.start_s) / HOUR
         return duration * cnfg[leg.mode].get("marginalUtilityOfTravelling", 0.0)
 
     def travel_distance_score(self, leg, cnfg) -> float:
@@ -1,9 +1,14 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import numpy as np
 import gzip
+import bz2
 from lxml import etree
-from io import BytesIO
+from io import BytesIO, RawIOBase
 import os
+import re
 from shapely.geometry import Point, LineString
 from s2sphere import CellId
 from pathlib import Path
@@ -13,6 +18,20 @@ from pam.variables import START_OF_DAY
 
 # according to gzip manpage
 DEFAULT_GZIP_COMPRESSION = 6
+# according to zstd manpage
+DEFAULT_ZSTD_COMPRESSION = 3
+# output compression backends, see open_output, 'pgzip' is multi-threaded gzip
+OUTPUT_COMPRESSION = [None, 'gzip', 'pgzip', 'zstd']
+# size in (uncompressed) bytes of blocks compressed as independent gzip members by pgzip
+PGZIP_BLOCK_SIZE = 1024 * 1024
+# bytes read from the start of xml inputs when checking for namespaces
+XML_HEAD_SIZE = 16 * 1024
+# approximate size in (uncompressed) bytes of xml chunks for parallel parsing
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+# formats of tabular (travel diary) inputs and outputs
+TABLE_FORMATS = ['csv', 'parquet']
+# start tag of a non selected plan in raw MATSim plans xml
+NON_SELECTED_PLAN = re.compile(rb"""<plan\s(?:[^>]*\s)?selected\s*=\s*(["'])no\1""")
 
 def parse_time(time):
     if isinstance(time, int) or isinstance(time, np.int64):
@@ -93,6 +112,39 @@ def td_to_s(td):
     return (td.days * 86400) + td.seconds
 
 
+def datetime_to_seconds(dt):
+    """
+    Convert datetime to integer seconds since START_OF_DAY. Unlike dt_to_s, days beyond the first
+    are included, eg 1900-01-02 01:00:00 is converted to 90000.
+    """
+    td = dt - START_OF_DAY
+    return (td.days * 86400) + td.seconds
+
+
+def seconds_to_datetime(seconds):
+    """
+    Convert integer seconds since START_OF_DAY to datetime.
+    """
+    return START_OF_DAY + timedelta(seconds=int(seconds))
+
+
+def matsim_time_to_seconds(mt):
+    """
+    Convert matsim format time (08:27:33) to integer seconds since START_OF_DAY, hh can be > 23.
+    """
+    h, m, s = mt.split(":")
+    return (int(h) * 60 + int(m)) * 60 + int(s)
+
+
+def seconds_to_matsim_time(seconds):
+    """
+    Convert integer seconds to matsim string format (00:00:00).
+    """
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+
 def safe_strptime(mt):
     """
     safely parse string into datetime, can cope with time strings in format hh:mm:ss
@@ -130,17 +182,142 @@ def get_linestring(from_point, to_point):
     return LineString([from_point, to_point])
 
 
+def compression_of(path):
+    """
+    Detect compression of file at given path from its magic number rather than its suffix.
+    :param path: path string
+    :return: {'gzip', 'bz2', 'zstd', None}
+    """
+    with open(path, 'rb') as file:
+        magic = file.read(4)
+    if magic[:2] == b'\x1f\x8b':
+        return 'gzip'
+    if magic[:3] == b'BZh':
+        return 'bz2'
+    if magic == b'\x28\xb5\x2f\xfd':
+        return 'zstd'
+    return None
+
+
+def open_xml(path):
+    """
+    Open xml at given path as a binary stream of uncompressed bytes. The file is decompressed as
+    it is read, not up front. Compression (gzip, bz2 or zstd) is detected from
+    the file's magic number. Reading zstd requires the zstandard package.
+    :param path: xml path string
+    :return: binary file object
+    """
+    compression = compression_of(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'bz2':
+        return bz2.open(path, 'rb')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"Reading zstd compressed {path} requires the zstandard package.")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def split_elems(path, tag, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Split xml at given path into chunks of complete elements of the given tag, without parsing.
+    Chunks are cut at the start of a tag, so each chunk is a well formed xml document of
+    roughly chunk_size bytes, wrapping a sequence of elements in a dummy root. Anything before
+    the first element (declaration, doctype, root attributes) and the closing root tag are dropped.
+    Elements are assumed to be siblings, ie not nested within each other.
+    :param path: xml path string
+    :param tag: The tag type to split on, e.g. 'person'
+    :param chunk_size: int, approximate size of chunks in (uncompressed) bytes
+    :return: Generator of bytes
+    """
+    opener = b'<' + tag.encode()
+    buffer = b''
+    started = False
+    with open_xml(path) as stream:
+        while True:
+            block = stream.read(chunk_size)
+            buffer += block
+            if not started:
+                idx = _find_tag(buffer, opener, 0, len(buffer), last=False)
+                if idx is None:
+                    if not block:
+                        return
+                    buffer = buffer[-len(opener):]  # keep tail in case tag is split between blocks
+                    continue
+                buffer = buffer[idx:]
+                started = True
+            if not block:
+                break
+            if len(buffer) >= chunk_size:
+                idx = _find_tag(buffer, opener, 1, len(buffer), last=True)
+                if idx is not None:
+                    yield b'<chunk>' + buffer[:idx] + b'</chunk>'
+                    buffer = buffer[idx:]
+    if started:
+        yield b'<chunk>' + buffer[:buffer.rfind(b'</')] + b'</chunk>'
+
+
+def _find_tag(buffer, opener, start, end, last):
+    """
+    Find index of first (or last) complete occurrence of opener tag in buffer, ignoring tags
+    that only share a prefix (eg '<personAttributes') or that are not yet fully read.
+    """
+    while True:
+        if last:
+            idx = buffer.rfind(opener, start, end)
+        else:
+            idx = buffer.find(opener, start, end)
+        if idx < 0:
+            return None
+        following = idx + len(opener)
+        if following < len(buffer) and buffer[following:following + 1] in (b' ', b'>', b'/', b'\n', b'\t', b'\r'):
+            return idx
+        if last:
+            end = idx
+        else:
+            start = idx + 1
+
+
 def get_elems(path, tag):
     """
-    Wrapper for unzipping and dealing with xml namespaces
+    Wrapper for streaming (optionally compressed) xml and dealing with xml namespaces.
+    The namespace is checked from the head of the document, which is then replayed to the parser,
+    so the input is only read (and decompressed) once.
     :param path: xml path string
-    :param tag: The tag type to extract , e.g. 'link'
+    :param tag: The tag type to extract , e.g. 'link', or list of tag types
     :return: Generator of elements
     """
-    target = try_unzip(path)
-    tag = get_tag(target, tag)
-    target = try_unzip(path)  # need to repeat :(
-    return parse_elems(target, tag)
+    with open_xml(path) as stream:
+        head = stream.read(XML_HEAD_SIZE)
+        if isinstance(tag, list):
+            tag = [get_tag(BytesIO(head), t) for t in tag]
+        else:
+            tag = get_tag(BytesIO(head), tag)
+        yield from parse_elems(PrefixedStream(head, stream), tag)
+
+
+class PrefixedStream:
+    """
+    Read only file-like object that returns prefix bytes before continuing to read from stream.
+    """
+
+    def __init__(self, prefix: bytes, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data = self.prefix + self.stream.read()
+            self.prefix = b''
+            return data
+        data = self.prefix[:size]
+        self.prefix = self.prefix[size:]
+        return data
 
 
 def parse_elems(target, tag):
@@ -183,14 +360,17 @@ def get_tag(target, tag):
     nsmap = {}
     doc = etree.iterparse(target, events=('end', 'start-ns',))
     count = 0
-    for event, element in doc:
-        count += 1
-        if event == 'start-ns':
-            nsmap[element[0]] = element[1]
-        if count == 10:  # assume namespace declared at top so can break early
-            del doc
-            break
-    if not nsmap:
+    try:
+        for event, element in doc:
+            count += 1
+            if event == 'start-ns':
+                nsmap[element[0]] = element[1]
+            if count == 10:  # assume namespace declared at top so can break early
+                break
+    except etree.XMLSyntaxError:
+        pass  # target may only be the head of a document
+    del doc
+    if not nsmap or '' not in nsmap:
         return tag
     else:
         tag = '{' + nsmap[''] + '}' + tag
@@ -214,6 +394,15 @@ def strip_namespace(elem):
         strip_namespace(child)
 
 
+def has_non_selected_plan(source: bytes) -> bool:
+    """
+    Check if the raw (unparsed) xml of a MATSim person includes a non selected plan.
+    :param source: bytes, xml of person element
+    :return: bool
+    """
+    return NON_SELECTED_PLAN.search(source) is not None
+
+
 def create_crs_attribute(coordinate_reference_system):
     """Create a CRS attribute as expected by MATSim's ProjectionUtils.getCRS"""
     attributes_element = et.Element('attributes')
@@ -231,6 +420,158 @@ def is_gzip(location):
     return suffix == ".gz" or suffix == ".gzip"
 
 
+def is_zstd(location):
+    suffix = Path(location).suffix.lower()
+    return suffix == ".zst" or suffix == ".zstd"
+
+
+def output_compression(path, compression='infer', level=None):
+    """
+    Resolve the compression of an output, inferred from the suffix of path (.gz or .gzip for gzip,
+    .zst or .zstd for zstd, otherwise uncompressed) unless given explicitly.
+    :param path: output path string, or (uncompressed) stream
+    :param compression: {'infer', None, 'gzip', 'pgzip', 'zstd'}, default 'infer'
+    :param level: {int, None}, compression level to check, gzip and pgzip levels must be 1 to 9
+    :return: {None, 'gzip', 'pgzip', 'zstd'}
+    """
+    if compression == 'infer':
+        if not isinstance(path, (str, os.PathLike)):
+            compression = None
+        elif is_gzip(path):
+            compression = 'gzip'
+        elif is_zstd(path):
+            compression = 'zstd'
+        else:
+            compression = None
+    elif compression not in OUTPUT_COMPRESSION:
+        raise UserWarning(f"Unknown output compression: {compression}, expected one of {OUTPUT_COMPRESSION}.")
+    if compression in ('gzip', 'pgzip') and level is not None and not 1 <= level <= 9:
+        raise UserWarning(f"Unsupported {compression} compression level: {level}, expected 1 to 9.")
+    return compression
+
+
+def open_output(path, compression='infer', level=None, threads=None):
+    """
+    Open output at given path as a binary stream, compressing as it is written. Outputs can be read
+    back using open_xml (or any gzip or zstd tool).
+    - gzip: single threaded gzip, level 1 (fastest) to 9 (smallest), default 6
+    - pgzip: multi-threaded gzip, blocks are compressed in a thread pool as independent gzip members,
+    which together form a single valid gzip file (and act as seek points for pam.read.index.PersonIndex)
+    - zstd: requires the zstandard package, level 1 to 22, default 3
+    :param path: output path string
+    :param compression: {'infer', None, 'gzip', 'pgzip', 'zstd'}, default 'infer' (see output_compression)
+    :param level: {int, None}, compression level, default None (backend default)
+    :param threads: {int, None}, pgzip threads, default None (number of cpus)
+    :return: binary file object
+    """
+    compression = output_compression(path, compression, level)
+    if compression is None:
+        return open(path, 'wb')
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=DEFAULT_GZIP_COMPRESSION if level is None else level)
+    if compression == 'pgzip':
+        return ParallelGzipWriter(open(path, 'wb'), level=level, threads=threads)
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(f"Writing zstd compressed {path} requires the zstandard package.")
+    compressor = zstandard.ZstdCompressor(level=DEFAULT_ZSTD_COMPRESSION if level is None else level)
+    return compressor.stream_writer(open(path, 'wb'), closefd=True)
+
+
+@contextmanager
+def xml_output(path, compression='infer', level=None):
+    """
+    Incremental lxml xml writer (lxml.etree.xmlfile) for output at given path, compressed as in
+    open_output. gzip outputs are compressed by lxml, level is ignored for uncompressed outputs.
+    :param path: output path string, or (uncompressed) stream
+    :param compression: {'infer', None, 'gzip', 'pgzip', 'zstd'}, default 'infer' (see output_compression)
+    :param level: {int, None}, compression level, default None (backend default)
+    """
+    compression = output_compression(path, compression, level)
+    if compression is None or compression == 'gzip':
+        if compression == 'gzip':
+            level = DEFAULT_GZIP_COMPRESSION if level is None else level
+        else:
+            level = 0
+        with et.xmlfile(path, encoding="utf-8", compression=level) as xf:
+            yield xf
+        return
+    with open_output(path, compression, level) as stream:
+        with et.xmlfile(stream, encoding="utf-8") as xf:
+            yield xf
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Reading or writing Parquet requires the pyarrow package.")
+    return pyarrow, pyarrow.parquet
+
+
+def gzip_member(data: bytes, level: int = DEFAULT_GZIP_COMPRESSION) -> bytes:
+    """
+    Compress data as a single, independent gzip member with a fixed (zero) modification time, so that
+    members can be concatenated into a valid gzip file and output is reproducible.
+    :param data: bytes, uncompressed data
+    :param level: int, gzip compression level 1 (fastest) to 9 (smallest), default 6
+    :return: bytes
+    """
+    buffer = BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=level, mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+class ParallelGzipWriter(RawIOBase):
+    """
+    Write only binary stream compressing blocks (of PGZIP_BLOCK_SIZE bytes) as independent gzip
+    members in a thread pool (zlib releases the GIL), written in order. At most 2 * threads blocks
+    are held in memory at a time. Members do not share a dictionary, so output is marginally larger
+    than single threaded gzip.
+    """
+
+    def __init__(self, file, level=None, threads=None, block_size=PGZIP_BLOCK_SIZE):
+        self.file = file
+        self.level = DEFAULT_GZIP_COMPRESSION if level is None else level
+        self.threads = threads or os.cpu_count() or 1
+        self.block_size = block_size
+        self.buffer = bytearray()
+        self.pending = deque()
+        self.members = 0
+        self.executor = ThreadPoolExecutor(max_workers=self.threads)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def _submit(self, block):
+        self.pending.append(self.executor.submit(gzip_member, block, self.level))
+        self.members += 1
+        while len(self.pending) >= 2 * self.threads:
+            self.file.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        if self.buffer or not self.members:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        while self.pending:
+            self.file.write(self.pending.popleft().result())
+        self.executor.shutdown()
+        self.file.close()
+        super().close()
+
+
 def create_local_dir(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
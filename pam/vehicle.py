@@ -87,3 +87,48 @@ class ElectricVehicle(Vehicle):
                         'vehicle_type': str(self.vehicle_type.id)}
                        )
         )
+
+
+class VehicleRegistry:
+    """
+    Counts of the vehicles, electric vehicles and vehicle types assigned to the persons of a
+    population, maintained as persons are added and vehicles assigned (see core.Population.vehicle_registry),
+    so that checking for vehicles or vehicle types does not require scanning the population.
+    """
+
+    def __init__(self) -> None:
+        self.num_vehicles = 0
+        self.num_electric_vehicles = 0
+        self.type_counts = {}
+
+    def add(self, vehicle: Vehicle) -> None:
+        if vehicle is None:
+            return
+        self.num_vehicles += 1
+        if isinstance(vehicle, ElectricVehicle):
+            self.num_electric_vehicles += 1
+        self.type_counts[vehicle.vehicle_type] = self.type_counts.get(vehicle.vehicle_type, 0) + 1
+
+    def remove(self, vehicle: Vehicle) -> None:
+        if vehicle is None:
+            return
+        self.num_vehicles -= 1
+        if isinstance(vehicle, ElectricVehicle):
+            self.num_electric_vehicles -= 1
+        count = self.type_counts[vehicle.vehicle_type] - 1
+        if count:
+            self.type_counts[vehicle.vehicle_type] = count
+        else:
+            del self.type_counts[vehicle.vehicle_type]
+
+    def replace(self, old: Vehicle, new: Vehicle) -> None:
+        self.remove(old)
+        self.add(new)
+
+    @property
+    def vehicle_types(self) -> set:
+        return set(self.type_counts)
+
+    @property
+    def has_uniquely_indexed_vehicle_types(self) -> bool:
+        return len({vehicle_type.id for vehicle_type in self.type_counts}) == len(self.type_counts)
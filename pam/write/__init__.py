@@ -1,3 +1,6 @@
 from pam.write.diary import *
+from pam.write.mapped import *
 from pam.write.matrices import *
 from pam.write.matsim import *
+from pam.write.parquet import *
+from pam.write.snapshot import *
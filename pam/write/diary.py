@@ -1,18 +1,27 @@
 import os
+import numbers
+from datetime import datetime
+import numpy as np
 import pandas as pd
 import geopandas as gp
 from shapely.geometry import LineString
-from typing import Optional
+from typing import Iterable, Optional
 
+import pam.core as core
 from pam.activity import Activity, Leg
-from pam.utils import create_local_dir
+from pam.utils import create_local_dir, import_pyarrow, TABLE_FORMATS
+
+
+# households written per chunk by to_tables
+DEFAULT_TABLE_CHUNK_SIZE = 10000
 
 
 def to_csv(
     population,
     dir : str,
     crs : Optional[str] = None,
-    to_crs : Optional[str] = "EPSG:4326"
+    to_crs : Optional[str] = "EPSG:4326",
+    chunk_size : Optional[int] = None,
     ) -> None:
     """
     Write a population to disk as tabular data in csv format. Outputs are:
@@ -25,7 +34,12 @@ def to_csv(
     :param dir: str, path to output directory
     :param crs: str, population coordinate system (generally we use local grid systems)
     :param to_crs: str, default 'EPSG:4326', output crs, defaults for use in kepler
+    :param chunk_size: {int, None}, optionally write chunks of this many households at a time, with
+        geometries as FlatGeobuf rather than geojson (see to_tables), default None
     """
+    if chunk_size is not None:
+        to_tables(population, dir, crs=crs, to_crs=to_crs, chunk_size=chunk_size, format='csv')
+        return
 
     create_local_dir(dir)
 
@@ -35,72 +49,11 @@ def to_csv(
     legs = []
 
     for hid, hh in population.households.items():
-        hh_data = {
-            'hid': hid,
-            'freq': hh.freq,
-            'hzone': hh.location.area,
-        }
-        if isinstance(hh.attributes, dict):
-            hh_data.update(hh.attributes)
-        # if hh.location.area is not None:
-        #     hh_data['area'] = hh.location.area
-        if hh.location.loc is not None:
-            hh_data['geometry'] = hh.location.loc
-
+        hh_data, people_data, legs_data, acts_data = household_records(hid, hh)
         hhs.append(hh_data)
-
-        for pid, person in hh.people.items():
-            people_data = {
-                'pid': pid,
-                'hid': hid,
-                'freq': person.freq,
-                'hzone': hh.location.area,
-            }
-            if isinstance(person.attributes, dict):
-                people_data.update(person.attributes)
-            if hh.location.loc is not None:
-                people_data['geometry'] = hh.location.loc
-
-            people.append(people_data)
-
-            for seq, component in enumerate(person.plan):
-                if isinstance(component, Leg):
-                    leg_data = {
-                        'pid': pid,
-                        'hid': hid,
-                        'freq': component.freq,
-                        'ozone': component.start_location.area,
-                        'dzone': component.end_location.area,
-                        'purp': component.purp,
-                        'origin activity': person.plan[seq-1].act,
-                        'destination activity': person.plan[seq+1].act,
-                        'mode': component.mode,
-                        'seq': component.seq,
-                        'tst': component.start_time,
-                        'tet': component.end_time,
-                        'duration': str(component.duration),
-                    }
-                    if component.start_location.loc is not None and component.end_location.loc is not None:
-                        leg_data['geometry'] = LineString((component.start_location.loc, component.end_location.loc))
-
-                    legs.append(leg_data)
-
-                if isinstance(component, Activity):
-                    act_data = {
-                        'pid': pid,
-                        'hid': hid,
-                        'freq': component.freq,
-                        'activity': component.act,
-                        'seq': component.seq,
-                        'start time': component.start_time,
-                        'end time': component.end_time,
-                        'duration': str(component.duration),
-                        'zone': component.location.area,
-                    }
-                    if component.location.loc is not None:
-                        act_data['geometry'] = component.location.loc
-
-                    acts.append(act_data)
+        people.extend(people_data)
+        legs.extend(legs_data)
+        acts.extend(acts_data)
 
     hhs = pd.DataFrame(hhs).set_index('hid')
     save_geojson(hhs, crs, to_crs, os.path.join(dir, 'households.geojson'))
@@ -120,6 +73,327 @@ def to_csv(
 
 
 
+def to_tables(
+    population,
+    dir : str,
+    crs : Optional[str] = None,
+    to_crs : Optional[str] = "EPSG:4326",
+    chunk_size : int = DEFAULT_TABLE_CHUNK_SIZE,
+    format : str = 'csv',
+    geometry : bool = True,
+    household_key : Optional[str] = None,
+    ) -> None:
+    """
+    Write a population to disk as tabular data (as per to_csv), one chunk of households at a
+    time. Outputs are households, people, legs and
+    activities tables in csv or parquet format. If geometry is True and activity locs are
+    available, geometries are also written as FlatGeobuf (.fgb) files.
+    The population may be a core.Population or an iterable of core.Person, such as
+    pam.read.stream_matsim_persons, so that plans can be converted to tables without reading a
+    population. As per pam.read.read_matsim, streamed persons are given their own household,
+    or are grouped into households using the household_key attribute (consecutive persons only).
+    The columns (and parquet types) of each table are gathered from the whole population before
+    writing. For streamed persons they are set by the first chunk, and columns that first appear in
+    later chunks raise a UserWarning. Parquet columns are written as booleans, integers, floats or
+    times where all values allow (missing values are null), otherwise as strings. Parquet requires
+    pyarrow.
+    :param population: {core.Population, iterable of core.Person}
+    :param dir: str, path to output directory
+    :param crs: str, population coordinate system (generally we use local grid systems)
+    :param to_crs: str, default 'EPSG:4326', output crs, defaults for use in kepler
+    :param chunk_size: int, number of households per chunk, default 10000
+    :param format: str, 'csv' or 'parquet', default 'csv'
+    :param geometry: bool, write FlatGeobuf geometries, default True
+    :param household_key: {str, None}, person attribute used to group streamed persons into households
+    """
+    if format not in TABLE_FORMATS:
+        raise UserWarning(f"Unknown table format '{format}', expected one of {TABLE_FORMATS}.")
+    create_local_dir(dir)
+    names = ['households', 'people', 'legs', 'activities']
+    columns = dict(zip(names, _table_columns(population))) if hasattr(population, 'households') else {}
+    writers = {
+        name: _ChunkedTableWriter(
+            dir, name, index, format=format, geometry=geometry, crs=crs, to_crs=to_crs,
+            columns=columns.get(name)
+        )
+        for name, index in zip(names, ['hid', 'pid', None, None])
+    }
+    chunk = {name: [] for name in writers}
+    num_households = 0
+    for hid, hh in _households(population, household_key):
+        hh_data, people_data, legs_data, acts_data = household_records(hid, hh, geometry=geometry)
+        chunk['households'].append(hh_data)
+        chunk['people'].extend(people_data)
+        chunk['legs'].extend(legs_data)
+        chunk['activities'].extend(acts_data)
+        num_households += 1
+        if num_households % chunk_size == 0:
+            for name, writer in writers.items():
+                writer.write(chunk[name])
+            chunk = {name: [] for name in writers}
+    for name, writer in writers.items():
+        writer.write(chunk[name])
+        writer.close()
+
+
+def _households(population, household_key: Optional[str]) -> Iterable[tuple]:
+    """
+    Iterate households (hid, household) of a population, or group a stream of persons into households.
+    """
+    if hasattr(population, 'households'):
+        yield from population.households.items()
+        return
+    household = None
+    for person in population:
+        hid = person.pid
+        if household_key and person.attributes.get(household_key):
+            hid = person.attributes[household_key]
+        if household is None or household.hid != hid:
+            if household is not None:
+                yield household.hid, household
+            household = core.Household(hid)
+        household.add(person)
+    if household is not None:
+        yield household.hid, household
+
+
+def _table_columns(population) -> tuple:
+    """
+    Columns of the households, people, legs and activities tables of a population, see _Columns.
+    """
+    tables = (_Columns(), _Columns(), _Columns(), _Columns())
+    for hid, hh in population.households.items():
+        for columns, records in zip(tables, household_records(hid, hh, geometry=False)):
+            columns.add(records if isinstance(records, list) else [records])
+    return tables
+
+
+class _Columns(dict):
+    """
+    Table columns (in order of first appearance, excluding geometries) mapped to the set of kinds
+    of their values, including 'missing' for missing (or absent) values.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.rows = 0
+        self.present = {}
+
+    def add(self, records: list) -> None:
+        for record in records:
+            for column, value in record.items():
+                if column != 'geometry':
+                    kinds = self.setdefault(column, set())
+                    kinds.add('missing' if _is_missing(value) else _value_kind(value))
+                    self.present[column] = self.present.get(column, 0) + 1
+        self.rows += len(records)
+        for column, count in self.present.items():
+            if count < self.rows:
+                self[column].add('missing')
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, numbers.Real) and value != value)
+
+
+def _value_kind(value) -> str:
+    if isinstance(value, (bool, np.bool_)):
+        return 'bool'
+    if isinstance(value, numbers.Integral):
+        return 'int'
+    if isinstance(value, numbers.Real):
+        return 'float'
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return 'datetime'
+    return 'string'
+
+
+def _arrow_type(pa, kinds: set):
+    """
+    Parquet column type of values of given kinds, strings unless all values allow otherwise.
+    """
+    kinds = kinds - {'missing'}
+    if kinds == {'bool'}:
+        return pa.bool_()
+    if kinds == {'int'}:
+        return pa.int64()
+    if kinds and kinds <= {'int', 'float'}:
+        return pa.float64()
+    if kinds == {'datetime'}:
+        return pa.timestamp('us')
+    return pa.string()
+
+
+class _ChunkedTableWriter:
+    """
+    Append chunks of records to a csv or parquet table, and optionally their geometries to a
+    FlatGeobuf file. Columns (mapped to the kinds of their values) are given, or set by the first
+    (non empty) chunk, in which case columns first appearing in later chunks raise a UserWarning.
+    """
+
+    def __init__(self, dir, name, index, format, geometry, crs, to_crs, columns=None) -> None:
+        self.path = os.path.join(dir, f"{name}.{format}")
+        self.geometry_path = os.path.join(dir, f"{name}.fgb")
+        self.index = index
+        self.format = format
+        self.geometry = geometry
+        self.crs = crs
+        self.to_crs = to_crs
+        self.columns = columns or None
+        self.rows = 0
+        self.has_geometries = False
+        self.parquet_writer = None
+
+    def write(self, records: list) -> None:
+        if not records:
+            return
+        columns = _Columns()
+        columns.add(records)
+        if self.columns is None:
+            self.columns = columns
+        else:
+            new = set(columns) - set(self.columns)
+            if new:
+                raise UserWarning(
+                    f"Columns {sorted(new)} of {self.path} first appear after the first chunk, write "
+                    "a core.Population (rather than streamed persons) or a larger chunk_size."
+                )
+        if self.format == 'parquet':
+            self._write_parquet(records)
+
+        df = pd.DataFrame(records)
+        if self.index is not None:
+            df = df.set_index(self.index)
+        else:
+            df.index = pd.RangeIndex(self.rows, self.rows + len(df))
+        if self.geometry and 'geometry' in df.columns and df['geometry'].notna().any():
+            self._write_geometries(df.reindex(columns=self._table_columns() + ['geometry']))
+        if self.format == 'csv':
+            df = df.reindex(columns=self._table_columns())
+            for column in df.columns:
+                kinds = self.columns[column]
+                if 'int' in kinds and kinds <= {'int', 'float', 'missing'} and len(kinds) > 1:
+                    df[column] = df[column].astype(float)  # as in a single table with missing values
+            df.to_csv(self.path, mode='a' if self.rows else 'w', header=not self.rows)
+        self.rows += len(records)
+
+    def close(self) -> None:
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+        elif not self.rows and self.format == 'csv':
+            open(self.path, 'w').close()
+
+    def _table_columns(self) -> list:
+        return [column for column in self.columns if column != self.index]
+
+    def _write_geometries(self, df: pd.DataFrame) -> None:
+        gdf = gp.GeoDataFrame(df[df['geometry'].notna()], geometry='geometry')
+        if self.crs is not None:
+            gdf.crs = self.crs
+            gdf.to_crs(self.to_crs, inplace=True)
+        gdf.to_file(self.geometry_path, driver='FlatGeobuf', mode='a' if self.has_geometries else 'w')
+        self.has_geometries = True
+
+    def _write_parquet(self, records: list) -> None:
+        pa, pq = import_pyarrow()
+        if self.parquet_writer is None:
+            schema = pa.schema([pa.field(column, _arrow_type(pa, kinds)) for column, kinds in self.columns.items()])
+            self.parquet_writer = pq.ParquetWriter(self.path, schema)
+        arrays = []
+        for field in self.parquet_writer.schema:
+            values = [None if _is_missing(v) else v for v in (record.get(field.name) for record in records)]
+            if pa.types.is_string(field.type):
+                values = [None if v is None else str(v) for v in values]
+            try:
+                arrays.append(pa.array(values, type=field.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                raise UserWarning(
+                    f"Values of column '{field.name}' of {self.path} do not match its type {field.type} "
+                    "set by the first chunk, write a core.Population (rather than streamed persons)."
+                )
+        self.parquet_writer.write_table(pa.Table.from_arrays(arrays, schema=self.parquet_writer.schema))
+
+
+def household_records(hid, hh, geometry: bool = True) -> tuple:
+    """
+    Tabular records of a household, its people and their legs and activities, as written by to_csv.
+    :param hid: household id
+    :param hh: core.Household
+    :param geometry: bool, include geometries (of known locations), default True
+    :return: tuple of household record and lists of people, leg and activity records
+    """
+    people = []
+    acts = []
+    legs = []
+
+    hh_data = {
+        'hid': hid,
+        'freq': hh.freq,
+        'hzone': hh.location.area,
+    }
+    if isinstance(hh.attributes, dict):
+        hh_data.update(hh.attributes)
+    # if hh.location.area is not None:
+    #     hh_data['area'] = hh.location.area
+    if geometry and hh.location.loc is not None:
+        hh_data['geometry'] = hh.location.loc
+
+    for pid, person in hh.people.items():
+        people_data = {
+            'pid': pid,
+            'hid': hid,
+            'freq': person.freq,
+            'hzone': hh.location.area,
+        }
+        if isinstance(person.attributes, dict):
+            people_data.update(person.attributes)
+        if geometry and hh.location.loc is not None:
+            people_data['geometry'] = hh.location.loc
+
+        people.append(people_data)
+
+        for seq, component in enumerate(person.plan):
+            if isinstance(component, Leg):
+                leg_data = {
+                    'pid': pid,
+                    'hid': hid,
+                    'freq': component.freq,
+                    'ozone': component.start_location.area,
+                    'dzone': component.end_location.area,
+                    'purp': component.purp,
+                    'origin activity': person.plan[seq-1].act,
+                    'destination activity': person.plan[seq+1].act,
+                    'mode': component.mode,
+                    'seq': component.seq,
+                    'tst': component.start_time,
+                    'tet': component.end_time,
+                    'duration': str(component.duration),
+                }
+                if geometry and component.start_location.loc is not None and component.end_location.loc is not None:
+                    leg_data['geometry'] = LineString((component.start_location.loc, component.end_location.loc))
+
+                legs.append(leg_data)
+
+            if isinstance(component, Activity):
+                act_data = {
+                    'pid': pid,
+                    'hid': hid,
+                    'freq': component.freq,
+                    'activity': component.act,
+                    'seq': component.seq,
+                    'start time': component.start_time,
+                    'end time': component.end_time,
+                    'duration': str(component.duration),
+                    'zone': component.location.area,
+                }
+                if geometry and component.location.loc is not None:
+                    act_data['geometry'] = component.location.loc
+
+                acts.append(act_data)
+
+    return hh_data, people, legs, acts
+
+
 def dump(
     population,
     dir : str,
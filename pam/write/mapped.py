@@ -0,0 +1,115 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from pam.activity import RouteV11
+from pam.utils import create_local_dir
+from pam.write.parquet import _json_default, _vehicle_json
+
+
+MAPPED_FORMAT_VERSION = 2
+MAPPED_METADATA = "pam.json"
+# household positions sorted by (json encoded) hid, to look up households by binary search
+MAPPED_HID_ORDER = "hid_order.npy"
+MAPPED_TABLES = ['households', 'persons', 'activities', 'legs']
+# row offsets of the persons of each household, and of the activities and legs of each person
+MAPPED_OFFSETS = ['person_offsets', 'activity_offsets', 'leg_offsets']
+
+
+def to_mapped(population, dir: str) -> None:
+    """
+    Write the selected plans of a population to disk as fixed width arrays (.npy files) that can be
+    memory mapped by pam.read.MappedPopulation, so that many processes can share a single (page
+    cache) copy of a population. Outputs are:
+    - households/, persons/, activities/, legs/: one array per column (see pam.frame)
+    - person_offsets.npy, activity_offsets.npy, leg_offsets.npy: row index of each household and person
+    - strings.npy, string_offsets.npy: table of json encoded ids, activity types, modes, attributes,
+      vehicles and routes, referenced by integer codes (-1 for None)
+    - hid_order.npy: household positions sorted by json encoded hid
+    - pam.json: format version, population name and column kinds
+    :param population: {core.Population, frame.PopulationFrame}
+    :param dir: str, path to output directory
+    """
+    from pam.frame import PopulationFrame  # pam.core imports pam.write
+
+    if not isinstance(population, PopulationFrame):
+        population = PopulationFrame.from_population(population)
+    frame = population
+
+    strings = _StringTable()
+    kinds = {}
+    for name in MAPPED_TABLES:
+        table = getattr(frame, name)
+        create_local_dir(os.path.join(dir, name))
+        kinds[name] = {}
+        for column in table.columns:
+            kind, array = _encode_column(table[column], column, strings)
+            kinds[name][column] = kind
+            np.save(os.path.join(dir, name, f"{column}.npy"), array)
+            if name == 'households' and column == 'hid':
+                hid_codes = array
+
+    person_offsets = np.zeros(len(frame.households) + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(frame.persons.household.to_numpy(), minlength=len(frame.households)),
+        out=person_offsets[1:]
+    )
+    for name, offsets in zip(MAPPED_OFFSETS, [person_offsets, frame.activity_offsets, frame.leg_offsets]):
+        np.save(os.path.join(dir, f"{name}.npy"), offsets)
+    strings.save(dir)
+    encoded = list(strings.codes)
+    hids = [encoded[code].encode("utf-8") for code in hid_codes.tolist()]
+    np.save(os.path.join(dir, MAPPED_HID_ORDER), np.array(sorted(range(len(hids)), key=hids.__getitem__), dtype=np.int64))
+
+    with open(os.path.join(dir, MAPPED_METADATA), "w") as f:
+        json.dump({'version': MAPPED_FORMAT_VERSION, 'name': frame.name, 'columns': kinds}, f)
+
+
+def _encode_column(values: pd.Series, column: str, strings: "_StringTable"):
+    """
+    Return column kind ('int', 'float', 'value', 'vehicle' or 'route') and fixed width array.
+    """
+    if values.dtype.kind == 'i':
+        return 'int', values.to_numpy(dtype=np.int64)
+    if values.dtype.kind == 'f':
+        return 'float', values.to_numpy(dtype=np.float64)
+    if column == 'vehicle':
+        kind, encoded = 'vehicle', [_vehicle_json(v) for v in values]
+    elif column == 'route':
+        kind, encoded = 'route', [_route_json(v) for v in values]
+    else:
+        kind = 'value'
+        encoded = [
+            json.dumps(v, default=_json_default) if v is not None else None
+            for v in values.astype(object).where(values.notna(), None)
+        ]
+    return kind, np.array([strings.code(v) for v in encoded], dtype=np.int32)
+
+
+def _route_json(route):
+    if route is None or not route.exists:
+        return None
+    return json.dumps({'v11': isinstance(route, RouteV11), 'attrib': route.attrib, 'text': route.text})
+
+
+class _StringTable:
+
+    def __init__(self) -> None:
+        self.codes = {}
+
+    def code(self, value) -> int:
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.codes)
+        return code
+
+    def save(self, dir: str) -> None:
+        encoded = [s.encode("utf-8") for s in self.codes]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in encoded], out=offsets[1:])
+        np.save(os.path.join(dir, "strings.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        np.save(os.path.join(dir, "string_offsets.npy"), offsets)
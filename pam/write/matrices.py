@@ -1,9 +1,14 @@
 import os
+import numpy as np
 import pandas as pd
-from typing import Tuple, Optional, List
+from typing import Tuple, Optional, List, Union
 
-from pam.utils import minutes_to_datetime as mtdt
-from pam.utils import create_local_dir
+from pam.utils import create_local_dir, import_pyarrow
+
+
+# segmentation dimensions taken from legs, any other dimension is taken from person attributes
+LEG_DIMENSIONS = ['mode', 'purpose', 'time']
+TOTAL_SEGMENTATION = 'total'
 
 
 def write_od_matrices(
@@ -11,79 +16,348 @@ def write_od_matrices(
         path : str,
         leg_filter : Optional[str] = None,
         person_filter : Optional[str] = None,
-        time_minutes_filter : Optional[List[Tuple[int]]] = None
+        time_minutes_filter : Optional[List[Tuple[int]]] = None,
+        weighted : bool = False,
         ) -> None:
 
     """
     Write a core population object to tabular O-D weighted matrices.
     Optionally segment matrices by leg attributes(mode/ purpose), person attributes or specific time periods.
-    A single filter can be applied each time.
-    TODO include freq (assume hh)
+    A single filter can be applied each time, see od_matrices for building many segmentations at once.
 
-    :param population: core.Population
+    :param population: core.Population or frame.PopulationFrame
     :param path: directory to write OD matrix files
     :param leg_filter: select between 'Mode', 'Purpose'
     :param person_filter: select between given attribute categories (column names) from person attribute data
     :param time_minutes_filter: a list of tuples to slice times,
     e.g. [(start_of_slicer_1, end_of_slicer_1), (start_of_slicer_2, end_of_slicer_2), ... ]
+    :param weighted: bool, weight legs by household freq rather than counting them, default False
     """
     create_local_dir(path)
 
-    legs = []
-
-    for hid, household in population.households.items():
-        for pid, person in household.people.items():
-            for leg in person.legs:
-                data = {
-                    'Household ID': hid,
-                    'Person ID': pid,
-                    'Origin':leg.start_location.area,
-                    'Destination': leg.end_location.area,
-                    'Purpose': leg.purp,
-                    'Mode': leg.mode,
-                    'Sequence': leg.seq,
-                    'Start time': leg.start_time,
-                    'End time': leg.end_time,
-                    'Freq': household.freq,
-                    }
-                if person_filter:
-                    legs.append({**data, **person.attributes})
-                else:
-                    legs.append(data)
-
-    df_total = pd.DataFrame(data=legs, columns = ['Origin','Destination']).set_index('Origin')
-    matrix = df_total.pivot_table(values='Destination', index='Origin', columns='Destination', fill_value=0, aggfunc=len)
-    matrix.to_csv(os.path.join(path, 'total_od.csv'))
-
-    data_legs = pd.DataFrame(data=legs)
-
+    keys = None
     if leg_filter:
-        data_legs_grouped=data_legs.groupby(leg_filter)
-        for filter, leg in data_legs_grouped:
-            df = pd.DataFrame(data=leg, columns = ['Origin','Destination']).set_index('Origin')
-            matrix = df.pivot_table(values='Destination', index='Origin', columns='Destination', fill_value=0, aggfunc=len)
-            matrix.to_csv(os.path.join(path, filter+'_od.csv'))
-        return None
-
+        segment = leg_filter.lower()
     elif person_filter:
-        data_legs_grouped=data_legs.groupby(person_filter)
-        for filter, leg in data_legs_grouped:
-            df = pd.DataFrame(data=leg, columns = ['Origin','Destination']).set_index('Origin')
-            matrix = df.pivot_table(values='Destination', index='Origin', columns='Destination', fill_value=0, aggfunc=len)
-            matrix.to_csv(os.path.join(path, filter+'_od.csv'))
-        return None
-
+        segment = person_filter
     elif time_minutes_filter:
-        periods = []
-        for time in time_minutes_filter:
-            periods.append(time)
-        for start_time, end_time in periods:
-            file_name = str(start_time) +'_to_'+ str(end_time)
-            start_time = mtdt(start_time)
-            end_time = mtdt(end_time)
-            data_time = data_legs[(data_legs['Start time']>= start_time)&(data_legs['Start time']< end_time)]
-            df = pd.DataFrame(data=data_time, columns = ['Origin','Destination']).set_index('Origin')
-            matrix = df.pivot_table(values='Destination', index='Origin', columns='Destination', fill_value=0, aggfunc=len)
-            matrix.to_csv(os.path.join(path, 'time_'+file_name+'_od.csv'))
-        return None
+        segment = 'time'
+        keys = _time_band_labels(time_minutes_filter)  # including periods without legs
+    else:
+        segment = None
+
+    matrices = od_matrices(
+        population, segments=[segment] if segment else [], time_bands=time_minutes_filter, weighted=weighted
+    )
+    matrices.to_csv(path)
+    if segment:
+        matrices.to_csv(path, segmentation=segment, keys=keys)
+
+
+def od_matrices(
+        population,
+        segments : Optional[List[Union[str, Tuple[str]]]] = None,
+        time_bands : Optional[List[Tuple[int]]] = None,
+        weighted : bool = True,
+        ) -> "ODMatrices":
+    """
+    Build sparse O-D matrices of legs, for many segmentations at once. Zones and segment values are
+    indexed once, then legs are aggregated per segmentation with a single sort and np.bincount,
+    rather than grouping and pivoting a table of legs per segment.
+
+    For example:
+    `matrices = od_matrices(population, segments=['mode', ('mode', 'purpose'), 'time', 'occ'],
+        time_bands=[(420, 600), (960, 1140)])
+    matrices.matrix('mode', 'car')
+    matrices.to_npz(PATH)
+    `
+
+    :param population: core.Population or frame.PopulationFrame
+    :param segments: list of segmentations, each a dimension or tuple of (crossed) dimensions. Dimensions
+    are 'mode', 'purpose', 'time' (see time_bands) or otherwise a person attribute. The total is always included.
+    :param time_bands: a list of tuples of (start, end) minutes, e.g. [(420, 600), (960, 1140)], legs are
+    assigned to every band containing their start time
+    :param weighted: bool, weight legs by household freq (1 if unknown), else count legs, default True
+    :return: ODMatrices
+    """
+    segmentations = [(segment,) if isinstance(segment, str) else tuple(segment) for segment in segments or []]
+    if any('time' in dimensions for dimensions in segmentations) and not time_bands:
+        raise UserWarning("Segmenting by 'time' requires time_bands.")
+    names = {name for dimensions in segmentations for name in dimensions}
+    legs = _od_legs(population, sorted(names - set(LEG_DIMENSIONS)))
+
+    num_legs = len(legs['origin'])
+    codes, zones = _factorize(np.concatenate([legs['origin'], legs['destination']]))
+    origin, destination = codes[:num_legs], codes[num_legs:]
+    weight = legs['weight'] if weighted else None
+
+    dimensions, time_rows = {}, None
+    for name in names:
+        if name == 'time':
+            time_rows, *dimensions[name] = _time_bands(legs['start_s'], time_bands)
+        else:
+            dimensions[name] = _factorize(legs[name])
+
+    tables = {TOTAL_SEGMENTATION: _aggregate(origin, destination, weight, (), [], [], len(zones))}
+    for segmentation in segmentations:
+        rows = time_rows if 'time' in segmentation else np.arange(num_legs)
+        codes = [dimensions[name][0] if name == 'time' else dimensions[name][0][rows] for name in segmentation]
+        labels = [dimensions[name][1] for name in segmentation]
+        tables[_segmentation_name(segmentation)] = _aggregate(
+            origin[rows], destination[rows], None if weight is None else weight[rows], segmentation, codes,
+            labels, len(zones)
+        )
+    return ODMatrices(zones, tables, {_segmentation_name(s): s for s in segmentations})
+
+
+class ODMatrices:
+    """
+    Sparse O-D matrices for one or more segmentations of a population's legs (see od_matrices).
+    Each segmentation is held as a long (COO) table of non zero cells, with a column for each
+    segmentation dimension and integer origin and destination indices into zones.
+    """
+
+    def __init__(self, zones: np.ndarray, tables: dict, segmentations: dict) -> None:
+        self.zones = zones
+        self.tables = {name: table for name, (table, _) in tables.items()}
+        self.segments = {name: segments for name, (_, segments) in tables.items()}
+        self.segmentations = {TOTAL_SEGMENTATION: (), **segmentations}
+
+    def __str__(self):
+        return f"ODMatrices: {len(self.zones)} zones, segmentations: {list(self.segmentations)}."
+
+    def keys(self, segmentation: Union[str, Tuple[str]] = TOTAL_SEGMENTATION) -> list:
+        """
+        Segment keys of a segmentation (all segment values of legs, including legs without zones),
+        eg ['car', 'walk'] for 'mode' or [('car', 'work'), ...] for ('mode', 'purpose').
+        :param segmentation: {str, tuple}, segmentation, default 'total'
+        :return: list
+        """
+        segments = self.segments[_segmentation_name(segmentation)]
+        if len(segments.columns) == 1:
+            return segments.iloc[:, 0].tolist()
+        return list(segments.itertuples(index=False, name=None))
+
+    def table(self, segmentation: Union[str, Tuple[str]] = TOTAL_SEGMENTATION) -> pd.DataFrame:
+        """
+        Long table of non zero cells, with origin and destination zone labels.
+        :param segmentation: {str, tuple}, segmentation, eg 'mode' or ('mode', 'purpose'), default 'total'
+        :return: pd.DataFrame
+        """
+        table = self.tables[_segmentation_name(segmentation)].copy()
+        table['origin'] = self.zones[table.origin.to_numpy()]
+        table['destination'] = self.zones[table.destination.to_numpy()]
+        return table
+
+    def matrix(
+            self, segmentation: Union[str, Tuple[str]] = TOTAL_SEGMENTATION, *key, compact: bool = False
+            ) -> pd.DataFrame:
+        """
+        Dense matrix of a segment, eg matrix('mode', 'car') or matrix(('mode', 'purpose'), 'car', 'work').
+        :param segmentation: {str, tuple}, segmentation, default 'total'
+        :param key: segment values
+        :param compact: bool, only include zones that are an origin (rows) or destination (columns)
+        in this segment, else all zones, default False
+        :return: pd.DataFrame
+        """
+        name = _segmentation_name(segmentation)
+        return self._dense(self._segment(name, key), compact)
+
+    def to_csv(
+            self, path: str, segmentation: Union[str, Tuple[str]] = TOTAL_SEGMENTATION, keys: Optional[list] = None
+            ) -> None:
+        """
+        Write compact dense matrices of each segment of a segmentation as {key}_od.csv, eg car_od.csv
+        or time_420_to_600_od.csv, or total_od.csv for the total.
+        :param path: directory to write OD matrix files
+        :param segmentation: {str, tuple}, segmentation, default 'total'
+        :param keys: optional list of segment keys to write, default all (see keys)
+        """
+        create_local_dir(path)
+        name = _segmentation_name(segmentation)
+        dimensions = self.segmentations[name]
+        if not dimensions:
+            self._dense(self.tables[name], compact=True).to_csv(os.path.join(path, f'{TOTAL_SEGMENTATION}_od.csv'))
+            return None
+        for key in self.keys(name) if keys is None else keys:
+            key = key if isinstance(key, tuple) else (key,)
+            file_name = '_'.join(
+                f'time_{value}' if dimension == 'time' else str(value) for dimension, value in zip(dimensions, key)
+            )
+            self._dense(self._segment(name, key), compact=True).to_csv(os.path.join(path, f'{file_name}_od.csv'))
+
+    def to_npz(self, path: str) -> None:
+        """
+        Write each segmentation as compressed numpy arrays {segmentation}_od.npz: 'zones' (zone
+        labels as strings), 'origin' and 'destination' (indices into zones), 'value' and segment
+        values ('segment_{dimension}') of each non zero cell. A segment can be loaded as a
+        scipy.sparse matrix by coo_matrix((value, (origin, destination)), shape=(len(zones), len(zones))).
+        :param path: directory to write OD matrix files
+        """
+        create_local_dir(path)
+        for name, table in self.tables.items():
+            arrays = {column: table[column].to_numpy() for column in ['origin', 'destination', 'value']}
+            for dimension in self.segmentations[name]:
+                arrays[f'segment_{dimension}'] = table[dimension].to_numpy().astype(str)
+            np.savez_compressed(os.path.join(path, f'{name}_od.npz'), zones=self.zones.astype(str), **arrays)
 
+    def to_parquet(self, path: str, compression: Optional[str] = "zstd") -> None:
+        """
+        Write each segmentation as a long Parquet table {segmentation}_od.parquet of non zero cells,
+        with segment values, origin and destination zone labels and value. Requires pyarrow.
+        :param path: directory to write OD matrix files
+        :param compression: {str, None}, Parquet compression codec, default 'zstd'
+        """
+        pa, pq = import_pyarrow()
+        create_local_dir(path)
+        for name, table in self.tables.items():
+            table = table.assign(
+                origin=pd.Categorical.from_codes(table.origin.to_numpy(), self.zones),
+                destination=pd.Categorical.from_codes(table.destination.to_numpy(), self.zones),
+            )
+            pq.write_table(
+                pa.Table.from_pandas(table, preserve_index=False),
+                os.path.join(path, f'{name}_od.parquet'),
+                compression=compression,
+            )
+
+    def _segment(self, name: str, key: tuple) -> pd.DataFrame:
+        table = self.tables[name]
+        if not len(key) == len(self.segmentations[name]):
+            raise UserWarning(f"Segmentation '{name}' requires values for {self.segmentations[name]}.")
+        selected = np.ones(len(table), dtype=bool)
+        for dimension, value in zip(self.segmentations[name], key):
+            selected &= (table[dimension] == value).to_numpy()
+        return table[selected]
+
+    def _dense(self, table: pd.DataFrame, compact: bool) -> pd.DataFrame:
+        origin, destination = table.origin.to_numpy(), table.destination.to_numpy()
+        if compact:
+            rows, origin = np.unique(origin, return_inverse=True)
+            columns, destination = np.unique(destination, return_inverse=True)
+        else:
+            rows = columns = np.arange(len(self.zones))
+        matrix = np.zeros((len(rows), len(columns)), dtype=table.value.dtype)
+        matrix[origin, destination] = table.value.to_numpy()
+        return pd.DataFrame(
+            matrix,
+            index=pd.Index(self.zones[rows], name='Origin'),
+            columns=pd.Index(self.zones[columns], name='Destination'),
+        )
+
+
+def _segmentation_name(segmentation: Union[str, Tuple[str]]) -> str:
+    if isinstance(segmentation, str):
+        return segmentation
+    return '_'.join(segmentation)
+
+
+def _time_band_labels(time_bands: List[Tuple[int]]) -> list:
+    return [f'{start}_to_{end}' for start, end in time_bands]
+
+
+def _od_legs(population, attributes: list) -> dict:
+    """
+    Leg origin and destination areas, modes, purposes, start times (seconds), household freq
+    weights and person attributes as arrays.
+    """
+    if hasattr(population, "od_legs_df"):  # pam.frame.PopulationFrame, not imported to avoid a cycle
+        legs = population.legs
+        person = legs.person.to_numpy()
+        weight = population.households.freq.to_numpy(dtype=float)[population.persons.household.to_numpy()]
+        data = {
+            'origin': legs.start_area.to_numpy(dtype=object),
+            'destination': legs.end_area.to_numpy(dtype=object),
+            'mode': legs['mode'].to_numpy(dtype=object),
+            'purpose': legs.purp.to_numpy(dtype=object),
+            'start_s': legs.start_s.to_numpy(dtype=float),
+            'weight': weight[person],
+        }
+        for name in attributes:
+            values = np.array([a.get(name) for a in population.persons.attributes], dtype=object)
+            data[name] = values[person]
+    else:
+        data = {k: [] for k in ['origin', 'destination', 'mode', 'purpose', 'start_s', 'weight'] + attributes}
+        for household in population.households.values():
+            freq = household.freq
+            for person in household.people.values():
+                values = [person.attributes.get(name) for name in attributes]
+                for leg in person.legs:
+                    data['origin'].append(leg.start_location.area)
+                    data['destination'].append(leg.end_location.area)
+                    data['mode'].append(leg.mode)
+                    data['purpose'].append(leg.purp)
+                    data['start_s'].append(leg.start_s)
+                    data['weight'].append(freq)
+                    for name, value in zip(attributes, values):
+                        data[name].append(value)
+        data = {k: np.array(v, dtype=float if k in ['start_s', 'weight'] else object) for k, v in data.items()}
+    data['weight'] = np.where(np.isnan(data['weight']), 1.0, data['weight'])
+    return data
+
+
+def _factorize(values: np.ndarray) -> tuple:
+    """
+    Integer codes (-1 for missing) and sorted unique values (unsorted if not comparable).
+    """
+    try:
+        codes, uniques = pd.factorize(values, sort=True)
+    except TypeError:
+        codes, uniques = pd.factorize(values)
+    return codes.astype(np.int64), np.asarray(uniques, dtype=object)
+
+
+def _time_bands(start_s: np.ndarray, time_bands: List[Tuple[int]]) -> tuple:
+    """
+    Leg rows, time band codes and labels, legs are repeated for each (possibly overlapping) band they start in.
+    """
+    rows, codes = [], []
+    for code, (start, end) in enumerate(time_bands):
+        selected = np.flatnonzero((start_s >= start * 60) & (start_s < end * 60))
+        rows.append(selected)
+        codes.append(np.full(len(selected), code, dtype=np.int64))
+    return np.concatenate(rows), np.concatenate(codes), np.array(_time_band_labels(time_bands), dtype=object)
+
+
+def _aggregate(
+        origin: np.ndarray,
+        destination: np.ndarray,
+        weight: Optional[np.ndarray],
+        dimensions: tuple,
+        codes: list,
+        labels: list,
+        num_zones: int,
+        ) -> tuple:
+    """
+    Sum leg weights (or count legs) by segment, origin and destination, as a long table of non zero
+    cells, dropping legs with an unknown origin, destination or segment value. Also returns the
+    table of segments (of all legs with known segment values).
+    """
+    group = np.zeros(len(origin), dtype=np.int64)
+    segmented = np.ones(len(origin), dtype=bool)
+    for dimension_codes, uniques in zip(codes, labels):
+        group = group * len(uniques) + dimension_codes
+        segmented &= dimension_codes >= 0
+    keep = segmented & (origin >= 0) & (destination >= 0)
+    cells = (group[keep] * num_zones + origin[keep]) * num_zones + destination[keep]
+    cells, inverse = np.unique(cells, return_inverse=True)
+    values = np.bincount(inverse, weights=None if weight is None else weight[keep], minlength=len(cells))
+
+    cell_group, cells = np.divmod(cells, num_zones * num_zones)
+    table = _decode_segments(cell_group, dimensions, labels)
+    table['origin'], table['destination'] = np.divmod(cells, num_zones)
+    table['value'] = values
+    columns = list(dimensions) + ['origin', 'destination', 'value']
+    segments = pd.DataFrame(_decode_segments(np.unique(group[segmented]), dimensions, labels), columns=dimensions)
+    return pd.DataFrame(table, columns=columns), segments
+
+
+def _decode_segments(group: np.ndarray, dimensions: tuple, labels: list) -> dict:
+    """
+    Segment values of each dimension from (mixed radix) group codes.
+    """
+    segments = {}
+    for dimension, uniques in reversed(list(zip(dimensions, labels))):
+        group, code = np.divmod(group, len(uniques))
+        segments[dimension] = uniques[code]
+    return {dimension: segments[dimension] for dimension in dimensions}
@@ -1,15 +1,27 @@
 from __future__ import annotations
 import os
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from io import BufferedWriter, BytesIO
 import logging
 from lxml import etree as et
-from typing import Optional, Set
+from typing import Iterable, Optional, Set
 
 from pam.activity import Plan, Activity, Leg
 from pam.vehicle import Vehicle, ElectricVehicle, VehicleType
 from pam.utils import create_crs_attribute, datetime_to_matsim_time as dttm
 from pam.utils import timedelta_to_matsim_time as tdtm
-from pam.utils import create_local_dir, is_gzip, DEFAULT_GZIP_COMPRESSION
+from pam.utils import seconds_to_matsim_time as stm
+from pam.utils import create_local_dir, output_compression, open_output, xml_output, gzip_member
+from pam.utils import has_non_selected_plan
+from pam.utils import DEFAULT_GZIP_COMPRESSION
+
+# buffer size in bytes of fast (text) population writers
+WRITE_BUFFER_SIZE = 1024 * 1024
+# approximate number of persons serialised per shard (and gzip member) when writing in parallel
+DEFAULT_SHARD_SIZE = 5000
 
 
 def write_matsim(
@@ -22,6 +34,10 @@ def write_matsim(
     household_key: Optional[str] = 'hid',
     keep_non_selected: bool = False,
     coordinate_reference_system: str = None,
+    workers: int = 1,
+    fast: bool = False,
+    compression: Optional[str] = 'infer',
+    compression_level: Optional[int] = None,
 ) -> None:
     """
     Write a core population to matsim population v6 xml format.
@@ -36,6 +52,12 @@ def write_matsim(
     :param household_key: {str, None}, optionally add household id to person attributes, default 'hid'
     :param keep_non_selected: bool, default False
     :param coordinate_reference_system: {str, None}, default None, optionally add CRS attribute to xml outputs
+    :param workers: int, number of threads used to compress gzip plans, default = 1 (no multithreading).
+    Other outputs are written with a single worker (with a warning)
+    :param fast: bool, default False, serialise persons directly to text rather than via lxml elements
+    :param compression: {'infer', None, 'gzip', 'pgzip', 'zstd'}, plans compression, default 'infer' from
+    plans_path suffix (see pam.utils.open_output)
+    :param compression_level: {int, None}, default None (compression default)
     :return: None
     """
 
@@ -53,6 +75,10 @@ def write_matsim(
         household_key=household_key,
         keep_non_selected=keep_non_selected,
         coordinate_reference_system=coordinate_reference_system,
+        workers=workers,
+        fast=fast,
+        compression=compression,
+        compression_level=compression_level,
     )
 
     # write vehicles
@@ -80,6 +106,20 @@ class Writer:
             pam.samplers.time.apply_jitter_to_plan(person.plan)
             writer.add_person(household)
     `
+    With fast=True persons are serialised directly to text (see person_xml_bytes) and written to a
+    buffered stream, rather than building and pretty printing an lxml element per person. The
+    output is the same.
+    Output compression is inferred from the path suffix (.gz or .zst), or set using compression
+    ('gzip', 'pgzip' for multi-threaded gzip, 'zstd' or None) and compression_level, see
+    pam.utils.open_output.
+    With pass_through=True (requires fast=True), persons read with their source (see pam.read.matsim.stream_matsim_persons
+    keep_source) that have not been modified (see core.Person.dirty) are written by copying their
+    source, eg:
+    `with pam.write.matsim.Writer(OUT_PATH, household_key=None, fast=True, pass_through=True) as writer:
+        for person in pam.read.matsim.stream_matsim_persons(IN_PATH, keep_source=True):
+            change(person)
+            writer.add_person(person)
+    `
     """
 
     def __init__(
@@ -88,25 +128,38 @@ class Writer:
         household_key: Optional[str] = 'hid',
         comment: Optional[str] = None,
         keep_non_selected: bool = False,
-        coordinate_reference_system: str = None
+        coordinate_reference_system: str = None,
+        fast: bool = False,
+        compression: Optional[str] = 'infer',
+        compression_level: Optional[int] = None,
+        pass_through: bool = False,
     ) -> None:
 
-        if os.path.dirname(path):
+        if pass_through and not fast:
+            raise UserWarning("Writing persons by copying their source (pass_through) requires fast=True.")
+        is_file_path = isinstance(path, (str, os.PathLike))
+        if is_file_path and os.path.dirname(path):
             create_local_dir(os.path.dirname(path))
         self.path = path
         self.household_key = household_key
         self.comment = comment
         self.keep_non_selected = keep_non_selected
         self.coordinate_reference_system = coordinate_reference_system
-        self.compression = DEFAULT_GZIP_COMPRESSION if is_gzip(path) else 0
+        self.compression = output_compression(path, compression, compression_level) if is_file_path else None
+        self.compression_level = compression_level
+        self.fast = fast
+        self.pass_through = pass_through
+        self.is_file_path = is_file_path
         self.xmlfile = None
         self.writer = None
         self.population_writer = None
+        self.stream = None
+        self.footer = None
 
     def __enter__(self) -> Writer:
-        self.xmlfile = et.xmlfile(
-            self.path, encoding="utf-8", compression=self.compression
-        )
+        if self.fast:
+            return self._enter_fast()
+        self.xmlfile = xml_output(self.path, self.compression, self.compression_level)
         self.writer = self.xmlfile.__enter__()  # enter into lxml file writer
         self.writer.write_declaration()
         self.writer.write_doctype(
@@ -125,6 +178,22 @@ class Writer:
                 self.coordinate_reference_system), pretty_print=True)
         return self
 
+    def _enter_fast(self) -> Writer:
+        header, self.footer = _population_v6_header_footer(
+            self.comment, self.coordinate_reference_system
+        )
+        if not self.is_file_path:
+            self.stream = self.path
+        elif self.compression:
+            self.stream = BufferedWriter(
+                open_output(self.path, self.compression, self.compression_level),
+                buffer_size=WRITE_BUFFER_SIZE
+            )
+        else:
+            self.stream = open(self.path, "wb", buffering=WRITE_BUFFER_SIZE)
+        self.stream.write(header)
+        return self
+
     def add_hh(self, household) -> None:
         for _, person in household:
             if self.household_key is not None:
@@ -134,10 +203,45 @@ class Writer:
             self.add_person(person)
 
     def add_person(self, person) -> None:
+        source = self._source(person)
+        if source is not None:
+            self.add_source(source)
+            return
+        if self.fast:
+            self.stream.write(person_xml_bytes(person.pid, person, self.keep_non_selected))
+            return
         e = create_person_element(person.pid, person, self.keep_non_selected)
         self.writer.write(e, pretty_print=True)
 
+    def add_source(self, source: bytes) -> None:
+        """
+        Write the original xml of a person (see pam.read.index.stream_person_sources) as is.
+        Requires fast=True.
+        :param source: bytes, xml of person element
+        """
+        if not self.fast:
+            raise UserWarning("Writing the source of a person requires fast=True.")
+        self.stream.write(source + b"\n")
+
+    def _source(self, person) -> Optional[bytes]:
+        """
+        Source of an unmodified person, unless it includes non selected plans that should not be kept.
+        """
+        source = person.source
+        if not self.pass_through or source is None or person.dirty:
+            return None
+        if not self.keep_non_selected and has_non_selected_plan(source):
+            return None
+        return source
+
     def __exit__(self, exc_type, exc_value, traceback):
+        if self.fast:
+            self.stream.write(self.footer)
+            if self.is_file_path:
+                self.stream.close()
+            else:
+                self.stream.flush()
+            return
         self.population_writer.__exit__(exc_type, exc_value, traceback)
         self.xmlfile.__exit__(exc_type, exc_value, traceback)
 
@@ -149,6 +253,10 @@ def write_matsim_population_v6(
     comment: Optional[str] = None,
     keep_non_selected: bool = False,
     coordinate_reference_system: str = None,
+    workers: int = 1,
+    fast: bool = False,
+    compression: Optional[str] = 'infer',
+    compression_level: Optional[int] = None,
 ) -> None:
     """
     Write matsim population v6 xml (persons plans and attributes combined).
@@ -157,7 +265,31 @@ def write_matsim_population_v6(
     :param comment: {str, None}, default None, optionally add a comment string to the xml outputs
     :param household_key: {str, None}, default 'hid'
     :param keep_non_selected: bool, default False
+    :param workers: int, number of threads used to compress gzip plans, default = 1 (no multithreading).
+    Other outputs are written with a single worker (with a warning)
+    :param fast: bool, default False, serialise persons directly to text rather than via lxml elements
+    :param compression: {'infer', None, 'gzip', 'pgzip', 'zstd'}, default 'infer' from path suffix (see
+    pam.utils.open_output)
+    :param compression_level: {int, None}, default None (compression default)
     """
+    if workers > 1 and output_compression(path, compression, compression_level) not in ('gzip', 'pgzip'):
+        logging.warning(
+            f'parameter "workers" only parallelises gzip compression, writing {path} with a single worker')
+        workers = 1
+    if workers > 1:
+        _write_matsim_population_v6_parallel(
+            population=population,
+            path=path,
+            household_key=household_key,
+            comment=comment,
+            keep_non_selected=keep_non_selected,
+            coordinate_reference_system=coordinate_reference_system,
+            workers=workers,
+            fast=fast,
+            compression=compression,
+            compression_level=compression_level,
+        )
+        return
 
     with Writer(
         path=path,
@@ -165,11 +297,101 @@ def write_matsim_population_v6(
         comment=comment,
         keep_non_selected=keep_non_selected,
         coordinate_reference_system=coordinate_reference_system,
+        fast=fast,
+        compression=compression,
+        compression_level=compression_level,
     ) as writer:
         for _, household in population:
             writer.add_hh(household)
 
 
+def _write_matsim_population_v6_parallel(
+    population,
+    path: str,
+    household_key: Optional[str],
+    comment: Optional[str],
+    keep_non_selected: bool,
+    coordinate_reference_system: str,
+    workers: int,
+    fast: bool,
+    compression: Optional[str] = 'infer',
+    compression_level: Optional[int] = None,
+) -> None:
+    """
+    Serialise shards of households in the main process and, for gzip outputs, compress each shard
+    as an independent gzip member in a pool of worker threads (zlib releases the GIL), written in
+    household order between the header and footer of the serial Writer. Workers only receive
+    serialised bytes, persons are not pickled. Concatenated gzip members form a single valid gzip
+    file, so that the decompressed output is identical to that of the serial writer, with a seek point
+    per shard (see pam.read.index.PersonIndex). At most 2 * workers shards are held in memory at a
+    time.
+    """
+    if os.path.dirname(path):
+        create_local_dir(os.path.dirname(path))
+    compression = output_compression(path, compression, compression_level)
+    header, footer = _population_v6_header_footer(comment, coordinate_reference_system)
+    shards = (
+        _serialise_persons(shard, keep_non_selected, fast)
+        for shard in _shard_persons(population, household_key)
+    )
+
+    level = DEFAULT_GZIP_COMPRESSION if compression_level is None else compression_level
+    pending = deque()
+    with open(path, "wb") as f, ThreadPoolExecutor(max_workers=workers) as executor:
+        f.write(gzip_member(header, level))
+        for data in shards:
+            pending.append(executor.submit(gzip_member, data, level))
+            if len(pending) >= 2 * workers:
+                f.write(pending.popleft().result())
+        while pending:
+            f.write(pending.popleft().result())
+        f.write(gzip_member(footer, level))
+
+
+def _population_v6_header_footer(
+    comment: Optional[str], coordinate_reference_system: str
+) -> tuple:
+    """
+    Return the population v6 xml written by Writer before and after the persons.
+    """
+    buffer = BytesIO()
+    with Writer(
+        path=buffer, comment=comment, coordinate_reference_system=coordinate_reference_system
+    ) as writer:
+        writer.writer.flush()
+        header = buffer.getvalue()
+    return header, buffer.getvalue()[len(header):]
+
+
+def _shard_persons(population, household_key: Optional[str]):
+    shard = []
+    for _, household in population:
+        for _, person in household:
+            if household_key is not None:
+                person.attributes[household_key] = household.hid  # force add hid as an attribute
+            shard.append(person)
+        if len(shard) >= DEFAULT_SHARD_SIZE:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def _serialise_persons(persons: list, keep_non_selected: bool, fast: bool) -> bytes:
+    if fast:
+        return b"".join(
+            person_xml_bytes(person.pid, person, keep_non_selected) for person in persons
+        )
+    return b"".join(
+        et.tostring(
+            create_person_element(person.pid, person, keep_non_selected),
+            encoding="utf-8",
+            pretty_print=True,
+        )
+        for person in persons
+    )
+
+
 def create_person_element(pid, person, keep_non_selected: bool = False):
     person_xml = et.Element('person', {'id': str(pid)})
 
@@ -217,10 +439,16 @@ def write_plan(
             act_data = {
                 'type': component.act,
             }
-            if component.start_time is not None:
-                act_data['start_time'] = dttm(component.start_time)
-            if component.end_time is not None:
-                act_data['end_time'] = dttm(component.end_time)
+            if component.int_times:
+                if component.start_s is not None:
+                    act_data['start_time'] = stm(component.start_s)
+                if component.end_s is not None:
+                    act_data['end_time'] = stm(component.end_s)
+            else:
+                if component.start_time is not None:
+                    act_data['start_time'] = dttm(component.start_time)
+                if component.end_time is not None:
+                    act_data['end_time'] = dttm(component.end_time)
             if component.location.link is not None:
                 act_data['link'] = str(component.location.link)
             if component.location.x is not None:
@@ -232,7 +460,7 @@ def write_plan(
         if isinstance(component, Leg):
             leg = et.SubElement(plan_xml, 'leg', {
                 'mode': component.mode,
-                'trav_time': tdtm(component.duration)})
+                'trav_time': stm(component.duration_s) if component.int_times else tdtm(component.duration)})
 
             if component.attributes:
                 attributes = et.SubElement(leg, 'attributes')
@@ -251,19 +479,134 @@ def write_plan(
 
 
 def add_attribute(attributes, k, v):
+    attribute = et.SubElement(attributes, 'attribute', {
+                              'class': attribute_class(v), 'name': str(k)})
+    attribute.text = str(v)
+
+
+def attribute_class(v) -> str:
+    """
+    MATSim (java) class of an attribute value.
+    """
     if type(v) == bool:
-        attribute = et.SubElement(attributes, 'attribute', {
-                                  'class': 'java.lang.Boolean', 'name': str(k)})
-    elif type(v) == int:
-        attribute = et.SubElement(attributes, 'attribute', {
-                                  'class': 'java.lang.Integer', 'name': str(k)})
-    elif type(v) == float:
-        attribute = et.SubElement(attributes, 'attribute', {
-                                  'class': 'java.lang.Double', 'name': str(k)})
+        return 'java.lang.Boolean'
+    if type(v) == int:
+        return 'java.lang.Integer'
+    if type(v) == float:
+        return 'java.lang.Double'
+    return 'java.lang.String'
+
+
+_ATTRIBUTE_ESCAPES = str.maketrans({
+    '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#9;'
+})
+_TEXT_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '\r': '&#13;'})
+
+
+def person_xml_bytes(pid, person, keep_non_selected: bool = False) -> bytes:
+    """
+    Serialise a person directly to (utf-8) pretty printed xml, without building an element tree.
+    Output is identical to serialising create_person_element with lxml.
+    :param pid: person id
+    :param person: core.Person
+    :param keep_non_selected: bool, default False
+    :return: bytes
+    """
+    parts = [f'<person id="{_escape_attribute(pid)}">\n']
+    if person.attributes:
+        parts.append('  <attributes>\n')
+        for k, v in person.attributes.items():
+            if k == "vehicles":  # todo make something more robust for future 'special' classes
+                _append_attribute(parts, '    ', 'org.matsim.vehicles.PersonVehicles', k, v)
+            else:
+                _append_attribute(parts, '    ', attribute_class(v), k, v)
+        parts.append('  </attributes>\n')
     else:
-        attribute = et.SubElement(attributes, 'attribute', {
-                                  'class': 'java.lang.String', 'name': str(k)})
-    attribute.text = str(v)
+        parts.append('  <attributes/>\n')
+    _append_plan(parts, person.plan, selected=True)
+    if keep_non_selected:
+        for plan in person.plans_non_selected:
+            _append_plan(parts, plan, selected=False)
+    parts.append('</person>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def _append_plan(parts: list, plan: Plan, selected: Optional[bool] = None) -> None:
+    plan_attributes = ''
+    if selected is not None:
+        plan_attributes += ' selected="yes"' if selected else ' selected="no"'
+    if plan.score is not None:
+        plan_attributes += f' score="{_escape_attribute(plan.score)}"'
+    if not plan.day:
+        parts.append(f'  <plan{plan_attributes}/>\n')
+        return
+
+    parts.append(f'  <plan{plan_attributes}>\n')
+    for component in plan:
+        if isinstance(component, Activity):
+            component.validate_matsim()
+            act_data = f' type="{_escape_attribute(component.act)}"'
+            if component.int_times:
+                if component.start_s is not None:
+                    act_data += f' start_time="{stm(component.start_s)}"'
+                if component.end_s is not None:
+                    act_data += f' end_time="{stm(component.end_s)}"'
+            else:
+                if component.start_time is not None:
+                    act_data += f' start_time="{dttm(component.start_time)}"'
+                if component.end_time is not None:
+                    act_data += f' end_time="{dttm(component.end_time)}"'
+            location = component.location
+            if location.link is not None:
+                act_data += f' link="{_escape_attribute(location.link)}"'
+            if location.loc:
+                x, y = location.loc.coords[0][:2]
+                act_data += f' x="{x}" y="{y}"'
+            parts.append(f'    <activity{act_data}/>\n')
+
+        elif isinstance(component, Leg):
+            trav_time = stm(component.duration_s) if component.int_times else tdtm(component.duration)
+            leg_data = f' mode="{_escape_attribute(component.mode)}" trav_time="{trav_time}"'
+            route = component.route
+            if not (component.attributes or route.exists):
+                parts.append(f'    <leg{leg_data}/>\n')
+                continue
+
+            parts.append(f'    <leg{leg_data}>\n')
+            if component.attributes:
+                parts.append('      <attributes>\n')
+                for k, v in component.attributes.items():
+                    if k == 'enterVehicleTime':  # todo make something more robust for future 'special' classes
+                        _append_attribute(parts, '        ', 'java.lang.Double', k, v)
+                    else:
+                        _append_attribute(parts, '        ', attribute_class(v), k, v)
+                parts.append('      </attributes>\n')
+            if route.exists:
+                route_data = ''.join(
+                    f' {k}="{_escape_attribute(v)}"' for k, v in route.attrib.items()
+                )
+                text = route.text
+                if text is None:
+                    parts.append(f'      <route{route_data}/>\n')
+                else:
+                    parts.append(f'      <route{route_data}>{_escape_text(text)}</route>\n')
+            parts.append('    </leg>\n')
+    parts.append('  </plan>\n')
+
+
+def _append_attribute(parts: list, indent: str, attribute_class: str, k, v) -> None:
+    parts.append(
+        f'{indent}<attribute class="{attribute_class}" name="{_escape_attribute(k)}">'
+        f'{_escape_text(v)}</attribute>\n'
+    )
+
+
+def _escape_attribute(value) -> str:
+    return str(value).translate(_ATTRIBUTE_ESCAPES)
+
+
+def _escape_text(value) -> str:
+    return str(value).translate(_TEXT_ESCAPES)
 
 
 def object_attributes_dtd():
@@ -289,7 +632,9 @@ def population_v6_dtd():
 def write_vehicles(output_dir,
                    population,
                    all_vehicles_filename="all_vehicles.xml",
-                   electric_vehicles_filename="electric_vehicles.xml"):
+                   electric_vehicles_filename="electric_vehicles.xml",
+                   compression: Optional[str] = 'infer',
+                   compression_level: Optional[int] = None):
     """
     Writes:
         - all_vehicles file following format https://www.matsim.org/files/dtd/vehicleDefinitions_v2.0.xsd
@@ -299,43 +644,115 @@ def write_vehicles(output_dir,
     :param population: pam.core.Population
     :param all_vehicles_filename: name of output all vehicles file, defaults to 'all_vehicles.xml`
     :param electric_vehicles_filename: name of output electric vehicles file, defaults to 'electric_vehicles.xml`
+    :param compression: {'infer', None, 'gzip', 'pgzip', 'zstd'}, default 'infer' from file name suffix (see
+        pam.utils.open_output)
+    :param compression_level: {int, None}, default None (compression default)
     :return:
     """
-    if population.has_vehicles:
-        if population.has_uniquely_indexed_vehicle_types:
-            write_all_vehicles(
-                output_dir,
-                vehicles=population.vehicles(),
-                vehicle_types=population.vehicle_types(),
-                file_name=all_vehicles_filename)
-            if population.has_electric_vehicles:
-                logging.info('Population includes electric vehicles')
-                electric_vehicles = set(population.electric_vehicles())
-                write_electric_vehicles(
-                    output_dir,
-                    vehicles=electric_vehicles,
-                    file_name=electric_vehicles_filename
-                )
-                electric_vehicle_charger_types = population.electric_vehicle_charger_types()
-                logging.info(f'Found {len(electric_vehicles)} electric vehicles '
-                             f'with unique charger types: {electric_vehicle_charger_types}. '
-                             "Ensure you generate a chargers xml file: https://www.matsim.org/files/dtd/chargers_v1.dtd "
-                             "if you're running a simulation using org.matsim.contrib.ev")
-            else:
-                logging.info(
-                    'Provided population does not have electric vehicles')
-        else:
-            logging.warning('The vehicle types in provided population do not have unique indices. Current Vehicle '
-                            f'Type IDs: {[vt.id for vt in population.vehicle_types()]}')
-    else:
+    if not population.has_vehicles:
         logging.warning('Provided population does not have vehicles')
+        return None
+    if not population.has_uniquely_indexed_vehicle_types:
+        logging.warning('The vehicle types in provided population do not have unique indices. Current Vehicle '
+                        f'Type IDs: {[vt.id for vt in population.vehicle_types()]}')
+        return None
+    with VehiclesWriter(
+        output_dir,
+        vehicle_types=population.vehicle_types(),
+        all_vehicles_filename=all_vehicles_filename,
+        electric_vehicles_filename=electric_vehicles_filename,
+        compression=compression,
+        compression_level=compression_level,
+    ) as writer:
+        for vehicle in sorted(population.vehicles()):
+            writer.add_vehicle(vehicle)
+    if writer.num_electric_vehicles:
+        logging.info('Population includes electric vehicles')
+        logging.info(f'Found {writer.num_electric_vehicles} electric vehicles '
+                     f'with unique charger types: {writer.charger_types}. '
+                     "Ensure you generate a chargers xml file: https://www.matsim.org/files/dtd/chargers_v1.dtd "
+                     "if you're running a simulation using org.matsim.contrib.ev")
+    else:
+        logging.info(
+            'Provided population does not have electric vehicles')
+
+
+class VehiclesWriter:
+    """
+    Context manager for streaming vehicles (in the order given) to an all_vehicles file and, for
+    electric vehicles, an electric_vehicles file (written only if there are electric vehicles), without
+    holding all vehicles in memory. Vehicle types are written first, so must be known in advance.
+    Compression is inferred from the file names, or set using compression and compression_level (see
+    pam.utils.open_output).
+
+    For example:
+    `vehicle_types = pam.read.matsim.read_vehicle_types(IN_PATH)
+    with pam.write.matsim.VehiclesWriter(OUT_DIR, vehicle_types.values()) as writer:
+        for vehicle in pam.read.matsim.stream_vehicles(IN_PATH):
+            writer.add_vehicle(vehicle)
+    `
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        vehicle_types: Iterable[VehicleType],
+        all_vehicles_filename: str = "all_vehicles.xml",
+        electric_vehicles_filename: Optional[str] = "electric_vehicles.xml",
+        compression: Optional[str] = 'infer',
+        compression_level: Optional[int] = None,
+    ) -> None:
+        self.all_vehicles_path = os.path.join(output_dir, all_vehicles_filename)
+        self.electric_vehicles_path = None
+        if electric_vehicles_filename is not None:
+            self.electric_vehicles_path = os.path.join(output_dir, electric_vehicles_filename)
+        self.vehicle_types = set(vehicle_types)
+        self.compression = compression
+        self.compression_level = compression_level
+        self.num_vehicles = 0
+        self.num_electric_vehicles = 0
+        self.charger_types = set()
+        self.stack = None
+        self.all_vehicles = None
+        self.electric_vehicles = None
+
+    def __enter__(self) -> VehiclesWriter:
+        create_local_dir(os.path.dirname(self.all_vehicles_path))
+        self.stack = ExitStack()
+        logging.info(f'Writing all vehicles to {self.all_vehicles_path}')
+        self.all_vehicles = self.stack.enter_context(_all_vehicles_xml(
+            self.all_vehicles_path, self.vehicle_types, self.compression, self.compression_level
+        ))
+        return self
+
+    def add_vehicle(self, vehicle: Vehicle) -> None:
+        if vehicle.vehicle_type not in self.vehicle_types:
+            raise UserWarning(f"Vehicle type {vehicle.vehicle_type.id} of vehicle {vehicle.id} has not been written.")
+        vehicle.to_xml(self.all_vehicles)
+        self.num_vehicles += 1
+        if isinstance(vehicle, ElectricVehicle) and self.electric_vehicles_path is not None:
+            if self.electric_vehicles is None:
+                logging.info(f'Writing electric vehicles to {self.electric_vehicles_path}')
+                self.electric_vehicles = self.stack.enter_context(_electric_vehicles_xml(
+                    self.electric_vehicles_path, self.compression, self.compression_level
+                ))
+            vehicle.to_e_xml(self.electric_vehicles)
+            self.num_electric_vehicles += 1
+            self.charger_types |= set(vehicle.charger_types.split(','))
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stack.__exit__(exc_type, exc_value, traceback)
+        self.all_vehicles = None
+        self.electric_vehicles = None
 
 
 def write_all_vehicles(
         output_dir,
         vehicles: Set[Vehicle],
         vehicle_types: Set[VehicleType],
-        file_name="all_vehicles.xml"):
+        file_name="all_vehicles.xml",
+        compression: Optional[str] = 'infer',
+        compression_level: Optional[int] = None):
     """
     Writes all_vehicles file following format https://www.matsim.org/files/dtd/vehicleDefinitions_v2.0.xsd
     for MATSim
@@ -343,47 +760,69 @@ def write_all_vehicles(
     :param vehicles: collection of vehicles to write
     :param vehicle_types: collection of vehicle types to write
     :param file_name: name of output file, defaults to 'all_vehicles.xml`
+    :param compression: {'infer', None, 'gzip', 'pgzip', 'zstd'}, default 'infer' from file name suffix (see
+        pam.utils.open_output)
+    :param compression_level: {int, None}, default None (compression default)
     :return: None
     """
     path = os.path.join(output_dir, file_name)
     logging.info(f'Writing all vehicles to {path}')
 
-    with et.xmlfile(path, encoding="utf-8") as xf:
-        xf.write_declaration()
-        vehicleDefinitions_attribs = {
-            'xmlns': "http://www.matsim.org/files/dtd",
-            'xmlns:xsi': "http://www.w3.org/2001/XMLSchema-instance",
-            'xsi:schemaLocation': "http://www.matsim.org/files/dtd "
-                                  "http://www.matsim.org/files/dtd/vehicleDefinitions_v2.0.xsd"}
-        with xf.element("vehicleDefinitions", vehicleDefinitions_attribs):
-            for vehicle_type in set(vehicle_types):
-                vehicle_type.to_xml(xf)
-            vehicles = list(vehicles)
-            vehicles.sort()
-            for vehicle in vehicles:
-                vehicle.to_xml(xf)
+    with _all_vehicles_xml(path, set(vehicle_types), compression, compression_level) as xf:
+        vehicles = list(vehicles)
+        vehicles.sort()
+        for vehicle in vehicles:
+            vehicle.to_xml(xf)
 
 
 def write_electric_vehicles(
         output_dir,
         vehicles: Set[ElectricVehicle],
-        file_name="electric_vehicles.xml"):
+        file_name="electric_vehicles.xml",
+        compression: Optional[str] = 'infer',
+        compression_level: Optional[int] = None):
     """
     Writes electric_vehicles file following format https://www.matsim.org/files/dtd/electric_vehicles_v1.dtd
     for MATSim
     :param output_dir: output directory for electric_vehicles file
     :param vehicles: collection of electric vehicles to write
     :param file_name: name of output file, defaults to 'electric_vehicles.xml`
+    :param compression: {'infer', None, 'gzip', 'pgzip', 'zstd'}, default 'infer' from file name suffix (see
+        pam.utils.open_output)
+    :param compression_level: {int, None}, default None (compression default)
     :return: None
     """
     path = os.path.join(output_dir, file_name)
     logging.info(f'Writing electric vehicles to {path}')
 
-    with et.xmlfile(path, encoding="utf-8") as xf:
+    with _electric_vehicles_xml(path, compression, compression_level) as xf:
+        vehicles = list(vehicles)
+        vehicles.sort()
+        for vehicle in vehicles:
+            vehicle.to_e_xml(xf)
+
+
+@contextmanager
+def _all_vehicles_xml(
+    path: str, vehicle_types: Iterable[VehicleType], compression: Optional[str], compression_level: Optional[int]
+):
+    with xml_output(path, compression, compression_level) as xf:
+        xf.write_declaration()
+        vehicleDefinitions_attribs = {
+            'xmlns': "http://www.matsim.org/files/dtd",
+            'xmlns:xsi': "http://www.w3.org/2001/XMLSchema-instance",
+            'xsi:schemaLocation': "http://www.matsim.org/files/dtd "
+                                  "http://www.matsim.org/files/dtd/vehicleDefinitions_v2.0.xsd"}
+        with xf.element("vehicleDefinitions", vehicleDefinitions_attribs):
+            for vehicle_type in vehicle_types:
+                vehicle_type.to_xml(xf)
+            yield xf
+
+
+@contextmanager
+def _electric_vehicles_xml(path: str, compression: Optional[str], compression_level: Optional[int]):
+    with xml_output(path, compression, compression_level) as xf:
         xf.write_declaration(
             doctype='<!DOCTYPE vehicles SYSTEM "http://matsim.org/files/dtd/electric_vehicles_v1.dtd">')
         with xf.element("vehicles"):
-            vehicles = list(vehicles)
-            vehicles.sort()
-            for vehicle in vehicles:
-                vehicle.to_e_xml(xf)
+            yield xf
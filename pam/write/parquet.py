@@ -0,0 +1,165 @@
+import json
+import os
+from dataclasses import asdict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from pam.activity import RouteV11
+from pam.utils import create_local_dir, import_pyarrow
+from pam.vehicle import ElectricVehicle
+
+
+PARQUET_FORMAT_VERSION = 1
+PARQUET_METADATA = "pam.json"
+PARQUET_TABLES = ['households', 'persons', 'activities', 'legs', 'routes']
+ROUTE_COLUMNS = [
+    'leg', 'v11', 'type', 'start_link', 'end_link', 'trav_time', 'distance', 'vehicle_ref_id', 'extra',
+    'links', 'description'
+]
+# string columns stored as (arrow) dictionaries, in addition to categorical activity types, modes and purposes
+DICTIONARY_COLUMNS = [
+    'hid', 'area', 'hzone', 'home_area', 'home_link', 'link', 'start_area', 'end_area', 'start_link',
+    'end_link', 'type'
+]
+# households per part (file) of each table
+DEFAULT_PARQUET_BATCH_SIZE = 100000
+
+
+def to_parquet(
+    population,
+    dir: str,
+    routes: bool = True,
+    batch_size: int = DEFAULT_PARQUET_BATCH_SIZE,
+    compression: Optional[str] = "zstd",
+) -> None:
+    """
+    Write a population to disk as Parquet tables, that can be read back using
+    pam.read.read_parquet. Each table is partitioned into parts of batch_size households:
+    - households/part-00000.parquet: household ids, weights, locations and attributes
+    - persons/part-00000.parquet: person ids, weights, home locations, attributes and vehicles
+    - activities/part-00000.parquet: selected plan activities
+    - legs/part-00000.parquet: selected plan legs
+    - routes/part-00000.parquet: optional leg routes
+    - pam.json: format version, population name and number of parts
+    Activities and legs reference their person (and routes their leg) by row within the part.
+    Locations are stored as x, y columns, times as integer seconds and activity types, modes and
+    purposes (and other string ids) as dictionaries. Household, person and leg attributes, and
+    vehicles, are stored as json. Non-selected plans are not stored. Requires pyarrow.
+    :param population: {core.Population, frame.PopulationFrame}
+    :param dir: str, path to output directory
+    :param routes: bool, write leg routes, default True
+    :param batch_size: int, number of households per part, default 100000
+    :param compression: {str, None}, Parquet compression codec, default 'zstd'
+    """
+    from pam.frame import PopulationFrame  # pam.core imports pam.write
+
+    pa, pq = import_pyarrow()
+    if not isinstance(population, PopulationFrame):
+        population = PopulationFrame.from_population(population)
+    frame = population
+
+    households = frame.households.assign(attributes=_json_column(frame.households.attributes))
+    persons = frame.persons.assign(
+        attributes=_json_column(frame.persons.attributes),
+        vehicle=[_vehicle_json(vehicle) for vehicle in frame.persons.vehicle],
+    )
+    activities = frame.activities
+    legs = frame.legs.drop(columns='route').assign(attributes=_json_column(frame.legs.attributes))
+    tables = {'households': households, 'persons': persons, 'activities': activities, 'legs': legs}
+    if routes:
+        tables['routes'] = _routes_table(frame.legs.route)
+
+    for name in tables:
+        create_local_dir(os.path.join(dir, name))
+    num_parts = 0
+    for part, h0 in enumerate(range(0, len(households), batch_size)):
+        h1 = min(h0 + batch_size, len(households))
+        p0, p1 = np.searchsorted(persons.household.to_numpy(), [h0, h1])
+        l0, l1 = frame.leg_offsets[p0], frame.leg_offsets[p1]
+        rows = {
+            'households': (h0, h1, None, 0),
+            'persons': (p0, p1, 'household', h0),
+            'activities': (frame.activity_offsets[p0], frame.activity_offsets[p1], 'person', p0),
+            'legs': (l0, l1, 'person', p0),
+        }
+        if routes:
+            rows['routes'] = (*np.searchsorted(tables['routes'].leg.to_numpy(), [l0, l1]), 'leg', l0)
+        for name, (start, end, index, offset) in rows.items():
+            df = tables[name].iloc[start:end]
+            if index is not None:  # make row references local to the part
+                df = df.assign(**{index: df[index].to_numpy() - offset})
+            pq.write_table(
+                _to_arrow(pa, df),
+                os.path.join(dir, name, f"part-{part:05d}.parquet"),
+                compression=compression,
+            )
+        num_parts += 1
+
+    with open(os.path.join(dir, PARQUET_METADATA), "w") as f:
+        json.dump(
+            {
+                'version': PARQUET_FORMAT_VERSION,
+                'name': frame.name,
+                'parts': num_parts,
+                'routes': routes,
+            },
+            f,
+        )
+
+
+def _to_arrow(pa, df: pd.DataFrame):
+    arrays = []
+    for name in df.columns:
+        values = df[name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.cat.remove_unused_categories()
+        try:
+            array = pa.array(values, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            raise UserWarning(f"Cannot write column '{name}' to Parquet, values must be of a single type.")
+        if name in DICTIONARY_COLUMNS and pa.types.is_string(array.type):
+            array = array.dictionary_encode()
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=list(df.columns))
+
+
+def _routes_table(routes: pd.Series) -> pd.DataFrame:
+    records = {k: [] for k in ROUTE_COLUMNS}
+    for leg, route in enumerate(routes):
+        if route is None or not route.exists:
+            continue
+        attributes = route.attrib
+        records['leg'].append(leg)
+        records['v11'].append(isinstance(route, RouteV11))
+        for key, attribute in [
+            ('type', 'type'), ('start_link', 'start_link'), ('end_link', 'end_link'),
+            ('trav_time', 'trav_time'), ('distance', 'distance'), ('vehicle_ref_id', 'vehicleRefId')
+        ]:
+            records[key].append(attributes.pop(attribute, None))
+        records['extra'].append(json.dumps(attributes) if attributes else None)
+        records['links'].append(list(route.links) if route.links else None)
+        records['description'].append(route.description)
+    df = pd.DataFrame({k: pd.Series(records[k], dtype=object) for k in ROUTE_COLUMNS})
+    df['leg'] = df['leg'].astype(np.int64)
+    df['v11'] = df['v11'].astype(bool)
+    return df
+
+
+def _json_column(values: pd.Series) -> list:
+    return [json.dumps(value, default=_json_default) if value else None for value in values]
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _vehicle_json(vehicle) -> Optional[str]:
+    if vehicle is None:
+        return None
+    data = asdict(vehicle)
+    data['electric'] = isinstance(vehicle, ElectricVehicle)
+    return json.dumps(data)
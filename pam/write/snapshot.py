@@ -0,0 +1,196 @@
+import importlib
+import json
+import os
+import pickle
+import struct
+import zlib
+from typing import Optional
+
+from pam.activity import Leg, RouteV11
+from pam.write.parquet import _vehicle_json
+
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_MAGIC = b"PAMSNAP\n"
+SNAPSHOT_COMPRESSION = [None, 'zlib', 'zstd', 'lz4']
+# frame lengths, a zero length frame marks the end of the snapshot
+FRAME_HEADER = struct.Struct("<I")
+
+
+def save_snapshot(
+    population,
+    path: str,
+    compression: Optional[str] = 'zlib',
+    level: Optional[int] = None,
+) -> None:
+    """
+    Write a population to a binary snapshot, that can be read back using pam.read.load_snapshot
+    or streamed (household by household) using pam.read.iter_snapshot_households. Unlike
+    Population.pickle, snapshots hold plain records (tuples of ids, numbers, times as integer
+    seconds, etc) rather than pam objects, so are fast to write and read, and readable by later
+    versions of pam. Households are written (and compressed) as separate frames, after a header of
+    format version, population name and compression. Household, person and leg attributes are
+    pickled as is.
+    :param population: core.Population
+    :param path: str, output path
+    :param compression: {None, 'zlib', 'zstd', 'lz4'}, compression of each household, zstd and lz4
+    require the zstandard and lz4 packages, default 'zlib'
+    :param level: {int, None}, compression level, default None (compression default)
+    """
+    with SnapshotWriter(path, name=population.name, compression=compression, level=level) as writer:
+        for _, household in population.households.items():
+            writer.add_hh(household)
+
+
+class SnapshotWriter:
+    """
+    Context manager for writing households to a snapshot one at a time (see save_snapshot).
+
+    For example:
+    `with SnapshotWriter(PATH) as writer:
+        for household in households:
+            writer.add_hh(household)
+    `
+    """
+
+    def __init__(
+        self,
+        path: str,
+        name: Optional[str] = None,
+        compression: Optional[str] = 'zlib',
+        level: Optional[int] = None,
+    ) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.name = name
+        self.compression = compression
+        self.compress = compressor(compression, level)
+        self.file = None
+
+    def __enter__(self) -> "SnapshotWriter":
+        self.file = open(self.path, "wb")
+        header = json.dumps(
+            {'version': SNAPSHOT_FORMAT_VERSION, 'name': self.name, 'compression': self.compression}
+        ).encode("utf-8")
+        self.file.write(SNAPSHOT_MAGIC + FRAME_HEADER.pack(len(header)) + header)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.file.write(FRAME_HEADER.pack(0))
+        self.file.close()
+        self.file = None
+
+    def add_hh(self, household) -> None:
+        """
+        Write a household (and its persons) as a frame.
+        :param household: core.Household
+        """
+        data = self.compress(pickle.dumps(household_record(household), protocol=pickle.HIGHEST_PROTOCOL))
+        self.file.write(FRAME_HEADER.pack(len(data)))
+        self.file.write(data)
+
+
+def compressor(compression: Optional[str], level: Optional[int] = None):
+    """
+    Return function compressing bytes.
+    :param compression: {None, 'zlib', 'zstd', 'lz4'}
+    :param level: {int, None}, compression level, default None (compression default)
+    """
+    if compression not in SNAPSHOT_COMPRESSION:
+        raise UserWarning(f"Unknown snapshot compression: {compression}, expected one of {SNAPSHOT_COMPRESSION}.")
+    if compression is None:
+        return bytes
+    if compression == 'zlib':
+        return lambda data: zlib.compress(data, -1 if level is None else level)
+    if compression == 'zstd':
+        zstandard = import_compression('zstandard')
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress
+    lz4_frame = import_compression('lz4.frame')
+    return lambda data: lz4_frame.compress(data, compression_level=0 if level is None else level)
+
+
+def import_compression(module: str):
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ImportError(f"Snapshot compression requires the {module.split('.')[0]} package.")
+
+
+def household_record(household) -> tuple:
+    """
+    Plain (version independent) record of a household.
+    """
+    from pam.frame import _Coordinates  # pam.core imports pam.write
+
+    location = _Locations(_Coordinates())
+    return (
+        household.hid,
+        household.hh_freq,
+        household.attributes,
+        location(household._location),
+        [_person(person, location) for person in household.people.values()],
+    )
+
+
+def person_record(person) -> tuple:
+    """
+    Plain (version independent) record of a person, see household_record.
+    """
+    from pam.frame import _Coordinates  # pam.core imports pam.write
+
+    return _person(person, _Locations(_Coordinates()))
+
+
+def _person(person, location) -> tuple:
+    return (
+        person.pid,
+        person.person_freq,
+        person.attributes,
+        location(person.home_location),
+        _vehicle_json(person.vehicle),
+        _plan(person.plan, person, location),
+        [_plan(plan, person, location) for plan in person.plans_non_selected],
+    )
+
+
+def _plan(plan, person, location) -> tuple:
+    # plans share their person's home location, unless replaced (as when reading MATSim plans)
+    home = None if plan.home_location is person.home_location else (location(plan.home_location),)
+    components = []
+    for component in plan.day:
+        if isinstance(component, Leg):
+            components.append((
+                component.seq, component.mode, component.purp, location(component.start_location),
+                location(component.end_location), component.start_s, component.end_s,
+                component._distance, component.freq, component.attributes or None, _route(component.route),
+            ))
+        else:
+            components.append((
+                component.seq, component.act, location(component.location), component.start_s,
+                component.end_s, component.freq,
+            ))
+    return plan.score, plan.plan_freq, home, components
+
+
+class _Locations:
+    """
+    Location records of (area, link, (x, y)), or None if unknown.
+    """
+
+    def __init__(self, coords) -> None:
+        self.coords = coords
+
+    def __call__(self, location) -> Optional[tuple]:
+        xy = self.coords(location.loc)
+        xy = None if xy[0] is None else xy
+        if xy is None and location.link is None and location.area is None:
+            return None
+        return location.area, location.link, xy
+
+
+def _route(route) -> Optional[tuple]:
+    if route is None or not route.exists:
+        return None
+    return isinstance(route, RouteV11), route.attrib, route.text
@@ -0,0 +1,72 @@
+import argparse
+import gc
+import pickle
+import time
+
+import pandas as pd
+
+from pam import read
+from pam.read.snapshot import _HouseholdBuilder
+from pam.write.snapshot import household_record
+
+# a process pool reader only pays off if the calling process, which unpickles and rebuilds the
+# results of all workers, spends well under half the serial read time doing so
+MAX_PARENT_SHARE = 0.5
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def parent_costs(population, chunk_size=5000):
+    """
+    Seconds spent by the calling process to unpickle chunks of pickled households, and to unpickle
+    and rebuild chunks of snapshot records of households. The serial population is released first
+    and the results are kept, as when reading a population in parallel.
+    """
+    households = list(population.households.values())
+    chunks = [households[i:i + chunk_size] for i in range(0, len(households), chunk_size)]
+    pickled_objects = [pickle.dumps(chunk, protocol=pickle.HIGHEST_PROTOCOL) for chunk in chunks]
+    pickled_records = [
+        pickle.dumps([household_record(h) for h in chunk], protocol=pickle.HIGHEST_PROTOCOL)
+        for chunk in chunks
+    ]
+    population.households.clear()
+    del households, chunks
+    gc.collect()
+
+    result, objects = timed(lambda: [h for data in pickled_objects for h in pickle.loads(data)])
+    del result
+    gc.collect()
+    builder = _HouseholdBuilder(int_times=False)
+    _, records = timed(lambda: [builder(record) for data in pickled_records for record in pickle.loads(data)])
+    return objects, records
+
+
+def report(name, serial, population):
+    objects, records = parent_costs(population)
+    print("{:<10}{:>10.2f}{:>12.2f}{:>8.2f}{:>12.2f}{:>8.2f}".format(
+        name, serial, objects, objects / serial, records, records / serial))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Compare serial read time with the calling process cost of a process pool reader, '
+                    'for workers returning pickled households or snapshot records')
+    arg_parser.add_argument('-p', '--plans', help='the path to MATSim plans xml')
+    arg_parser.add_argument('-t', '--trips', help='the path to a travel diary csv')
+    arg_parser.add_argument('-a', '--attributes', help='the path to travel diary persons attributes csv')
+    args = vars(arg_parser.parse_args())
+
+    print("parent share of serial read time must be below {}".format(MAX_PARENT_SHARE))
+    print("{:<10}{:>10}{:>12}{:>8}{:>12}{:>8}".format('reader', 'serial', 'objects', 'share', 'records', 'share'))
+    if args['plans']:
+        population, serial = timed(read.read_matsim, args['plans'])
+        report('matsim', serial, population)
+    if args['trips']:
+        trips = pd.read_csv(args['trips'])
+        attributes = pd.read_csv(args['attributes']) if args['attributes'] else None
+        population, serial = timed(read.load_travel_diary, trips, attributes)
+        report('diary', serial, population)
@@ -0,0 +1,35 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+from pam import read
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Report memory held per agent by a PAM population read from MATSim plans')
+    arg_parser.add_argument('-p',
+                            '--plans',
+                            help='the path to the MATSim plans xml',
+                            required=True)
+    arg_parser.add_argument('-v',
+                            '--version',
+                            help='the MATSim plans version (11 or 12)',
+                            type=int,
+                            default=12)
+    args = vars(arg_parser.parse_args())
+    plans = args['plans']
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    population = read.read_matsim(plans, version=args['version'])
+    duration = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    agents = len(population)
+    print("Read {} agents from {} in {:.1f}s".format(agents, plans, duration))
+    print("Retained {:.1f} MB ({:.0f} bytes per agent), peak {:.1f} MB"
+          .format(current / 2**20, current / max(agents, 1), peak / 2**20))
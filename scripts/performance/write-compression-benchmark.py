@@ -0,0 +1,54 @@
+import argparse
+import os
+import tempfile
+import time
+
+from pam import read
+from pam.write import write_matsim
+
+BACKENDS = [
+    ('none', None, None),
+    ('gzip-1', 'gzip', 1),
+    ('gzip-6', 'gzip', 6),
+    ('gzip-9', 'gzip', 9),
+    ('pgzip-1', 'pgzip', 1),
+    ('pgzip-6', 'pgzip', 6),
+    ('zstd-1', 'zstd', 1),
+    ('zstd-3', 'zstd', 3),
+    ('zstd-9', 'zstd', 9),
+]
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Report MATSim plans write throughput and output size per compression backend')
+    arg_parser.add_argument('-p',
+                            '--plans',
+                            help='the path to the reference MATSim plans xml',
+                            required=True)
+    arg_parser.add_argument('-v',
+                            '--version',
+                            help='the MATSim plans version (11 or 12)',
+                            type=int,
+                            default=12)
+    arg_parser.add_argument('--lxml',
+                            help='serialise persons via lxml elements rather than the fast text writer',
+                            action='store_true')
+    args = vars(arg_parser.parse_args())
+
+    population = read.read_matsim(args['plans'], version=args['version'], keep_non_selected=True)
+    print("Writing {} agents from {}".format(len(population), args['plans']))
+    print("{:<10}{:>10}{:>12}{:>12}{:>8}".format('backend', 'seconds', 'MB/s', 'size MB', 'ratio'))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        raw_size = None
+        for name, compression, level in BACKENDS:
+            path = os.path.join(tmp, "plans-{}.xml".format(name))
+            start = time.perf_counter()
+            write_matsim(population, path, keep_non_selected=True, fast=not args['lxml'],
+                         compression=compression, compression_level=level)
+            duration = time.perf_counter() - start
+            size = os.path.getsize(path)
+            if raw_size is None:
+                raw_size = size
+            print("{:<10}{:>10.2f}{:>12.1f}{:>12.1f}{:>8.2f}".format(
+                name, duration, raw_size / 2**20 / duration, size / 2**20, raw_size / size))
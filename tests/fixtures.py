@@ -1,4 +1,6 @@
 from xml.dom import NotFoundErr
+import gzip
+from datetime import datetime
 import pytest
 from shapely.geometry import Point
 
@@ -6,6 +8,7 @@ from pam.activity import Activity, Leg
 from pam.core import Population, Household, Person
 from pam.utils import minutes_to_datetime as mtdt
 from pam.variables import END_OF_DAY
+from pam.vehicle import ElectricVehicle, Vehicle, VehicleType
 
 
 def instantiate_household_with(persons: list, hid=1):
@@ -24,6 +27,46 @@ def assert_correct_activities(person, ordered_activities_list):
     assert person.plan[len(person.plan)-1].end_time == END_OF_DAY
 
 
+def read_without_created_comment(path):
+    """
+    Lines of a (optionally gzipped) xml output, ignoring the timestamped created comment.
+    """
+    data = path.read_bytes()
+    if path.name.endswith(".gz"):
+        data = gzip.decompress(data)
+    return [line for line in data.splitlines() if b"<!--Created" not in line]
+
+
+def population_with_attributes_and_vehicles(**person_attributes):
+    """
+    Single household population with typed attributes, vehicles and located plans, for round trips
+    through population stores. Optionally add person attributes.
+    """
+    population = Population(name="test")
+    household = Household('A', attributes={'income': 'high', 'size': 2}, area='zone', loc=Point(1, 2))
+    vehicle_type = VehicleType(id='small', length=3.0)
+    for pid, vehicle in [('a', Vehicle('a', vehicle_type)), ('b', ElectricVehicle('b', battery_capacity=30))]:
+        person = Person(pid, attributes={'age': 30, 'height': 1.8, 'worker': True, **person_attributes})
+        person.assign_vehicle(vehicle)
+        person.add(Activity(1, 'home', 'zone', loc=Point(1, 2), start_time=datetime(1900, 1, 1, 0),
+                            end_time=datetime(1900, 1, 1, 8)))
+        person.add(Leg(1, 'car', 'zone', 'work_zone', start_loc=Point(1, 2), end_loc=Point(5, 5),
+                       start_time=datetime(1900, 1, 1, 8), end_time=datetime(1900, 1, 1, 9), distance=1000))
+        person.add(Activity(2, 'work', 'work_zone', loc=Point(5, 5), start_time=datetime(1900, 1, 1, 9),
+                            end_time=datetime(1900, 1, 2, 0)))
+        household.add(person)
+    population.add(household)
+    return population
+
+
+def assert_same_routes(population, population2):
+    for (_, _, person), (_, _, person2) in zip(population.people(), population2.people()):
+        for leg, leg2 in zip(person.legs, person2.legs):
+            assert type(leg2.route) == type(leg.route)
+            assert leg2.route.attrib == leg.route.attrib
+            assert leg2.route.text == leg.route.text
+
+
 @pytest.fixture()
 def Steve():
     Steve = Person(1, attributes={'age': 50, 'job': 'work', 'gender': 'male'})
@@ -9,6 +9,9 @@ from pam import utils, plot, read
 from pam.core import Household, Population
 from tests.fixtures import instantiate_household_with
 from datetime import datetime
+from io import BytesIO
+import gzip
+import bz2
 
 test_trips_path = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plans.xml")
@@ -221,3 +224,102 @@ def test_matsim_time_day_three():
     """ Day-three matsim timestamp """
     dt = utils.matsim_time_to_datetime('49:01:02')
     assert dt == datetime(1900, 1, 3, 1, 1, 2)
+
+
+def test_split_elems_yields_all_persons_in_order(tmp_path):
+    path = os.path.join(os.path.dirname(__file__), "test_data/test_matsim_experienced_plans_v12.xml")
+    expected = [elem.get("id") for elem in utils.get_elems(path, "person")]
+    for chunk_size in [1, 100, 10 ** 6]:
+        pids = []
+        for chunk in utils.split_elems(path, "person", chunk_size=chunk_size):
+            pids.extend(elem.get("id") for elem in utils.parse_elems(BytesIO(chunk), "person"))
+        assert pids == expected
+
+
+def test_split_elems_reads_gzip(tmp_path):
+    path = os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml")
+    gz_path = os.path.join(tmp_path, "plans.xml.gz")
+    with open(path, "rb") as f, gzip.open(gz_path, "wb") as g:
+        g.write(f.read())
+    assert list(utils.split_elems(path, "person")) == list(utils.split_elems(gz_path, "person"))
+
+
+@pytest.fixture()
+def plans_bytes():
+    path = os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml")
+    with open(path, "rb") as f:
+        return path, f.read()
+
+
+@pytest.mark.parametrize("suffix,compress", [(".xml.gz", gzip.compress), (".xml.bz2", bz2.compress)])
+def test_get_elems_streams_compressed_xml(tmp_path, plans_bytes, suffix, compress):
+    path, data = plans_bytes
+    compressed_path = os.path.join(tmp_path, "plans" + suffix)
+    with open(compressed_path, "wb") as f:
+        f.write(compress(data))
+    expected = [elem.get("id") for elem in utils.get_elems(path, "person")]
+    assert [elem.get("id") for elem in utils.get_elems(compressed_path, "person")] == expected
+
+
+def test_get_elems_streams_zstd_xml(tmp_path, plans_bytes):
+    zstandard = pytest.importorskip("zstandard")
+    path, data = plans_bytes
+    compressed_path = os.path.join(tmp_path, "plans.xml.zst")
+    with open(compressed_path, "wb") as f:
+        f.write(zstandard.ZstdCompressor().compress(data))
+    expected = [elem.get("id") for elem in utils.get_elems(path, "person")]
+    assert [elem.get("id") for elem in utils.get_elems(compressed_path, "person")] == expected
+
+
+def test_get_elems_finds_namespaced_elements_beyond_head(monkeypatch):
+    monkeypatch.setattr(utils, "XML_HEAD_SIZE", 400)
+    path = os.path.join(os.path.dirname(__file__), "test_data/vehicles/all_vehicles.xml")
+    assert [elem.get("id") for elem in utils.get_elems(path, "vehicle")] == ["Eddy", "Stevie", "Vladya"]
+
+
+def test_prefixed_stream_replays_prefix():
+    stream = utils.PrefixedStream(b"abc", BytesIO(b"defg"))
+    assert stream.read(2) == b"ab"
+    assert stream.read(2) == b"c"
+    assert stream.read() == b"defg"
+
+
+@pytest.mark.parametrize("source,expected", [
+    (b'<person id="a"><plan selected="yes"></plan></person>', False),
+    (b'<person id="a"><plan selected="no"></plan></person>', True),
+    (b"<person id=\"a\"><plan score=\"1\" selected='no'></plan></person>", True),
+    (b'<person id="a"><plan\n  selected = "no" ></plan></person>', True),
+    (b'<person id="a"><plan unselected="no"></plan></person>', False),
+    (b'<person id="a"><attributes><attribute name="selected">no</attribute></attributes></person>', False),
+])
+def test_has_non_selected_plan(source, expected):
+    assert utils.has_non_selected_plan(source) is expected
+
+
+def test_gzip_members_concatenate_reproducibly():
+    members = [utils.gzip_member(b"abc", level=1), utils.gzip_member(b"", level=9), utils.gzip_member(b"def")]
+    assert gzip.decompress(b"".join(members)) == b"abcdef"
+    assert members[0] == utils.gzip_member(b"abc", level=1)
+
+
+def test_parallel_gzip_writer_writes_gzip_members(tmp_path):
+    data = bytes(range(256)) * 1000
+    with utils.ParallelGzipWriter(open(tmp_path / "test.gz", "wb"), threads=2, block_size=10000) as f:
+        f.write(data[:5])
+        f.write(data[5:])
+    assert gzip.decompress((tmp_path / "test.gz").read_bytes()) == data
+    assert utils.compression_of(str(tmp_path / "test.gz")) == 'gzip'
+
+
+def test_parallel_gzip_writer_writes_valid_empty_file(tmp_path):
+    with utils.open_output(str(tmp_path / "test.gz"), compression='pgzip'):
+        pass
+    assert gzip.decompress((tmp_path / "test.gz").read_bytes()) == b""
+
+
+@pytest.mark.parametrize("path,compression", [
+    ("a.xml", None), ("a.xml.gz", 'gzip'), ("a.XML.GZIP", 'gzip'), ("a.xml.zst", 'zstd'), ("a.zstd", 'zstd')
+])
+def test_output_compression_inferred_from_suffix(path, compression):
+    assert utils.output_compression(path) == compression
+    assert utils.output_compression(path, compression='pgzip') == 'pgzip'
@@ -1,7 +1,9 @@
+import pickle
 import pytest
+from copy import deepcopy
 from datetime import timedelta
 
-from pam.activity import Plan, Activity, Leg, Location
+from pam.activity import Plan, Activity, Leg, Location, EMPTY_ROUTE, EMPTY_ATTRIBUTES
 from pam.utils import minutes_to_datetime as mtdt
 from pam.variables import END_OF_DAY
 
@@ -180,4 +182,68 @@ def test_plan_contains_false():
     act = Activity(start_time=0, loc=0)
     plan.add(act)
     act = Activity(start_time=0, loc=1)
-    assert act not in plan
\ No newline at end of file
+    assert act not in plan
+
+def test_components_are_slotted():
+    for component in [Activity(), Leg(), Location()]:
+        assert not hasattr(component, "__dict__")
+        with pytest.raises(AttributeError):
+            component.unknown = None
+
+
+def test_legs_share_empty_route_and_attributes():
+    leg, other = Leg(), Leg()
+    assert leg.route is other.route is EMPTY_ROUTE
+    assert leg.attributes is other.attributes is EMPTY_ATTRIBUTES
+    assert leg.attributes == {}
+    assert not leg.route.exists
+
+
+def test_shared_empty_attributes_are_immutable():
+    leg = Leg()
+    with pytest.raises(TypeError):
+        leg.attributes["routingMode"] = "car"
+    leg.attributes = {"routingMode": "car"}
+    assert Leg().attributes == {}
+
+
+def test_leg_keeps_given_empty_attributes():
+    attributes = {}
+    leg = Leg(attributes=attributes)
+    leg.attributes["routingMode"] = "car"
+    assert attributes == {"routingMode": "car"}
+    assert Leg().attributes == {}
+
+
+def test_copied_legs_keep_shared_sentinels():
+    leg = Leg(1, 'car', start_area=1, end_area=2, start_time=mtdt(900), end_time=mtdt(930))
+    for other in [deepcopy(leg), pickle.loads(pickle.dumps(leg))]:
+        assert other.route is EMPTY_ROUTE
+        assert other.attributes is EMPTY_ATTRIBUTES
+        assert other == leg
+
+
+def test_int_times_components():
+    act = Activity(1, 'home', 1, start_time=0, end_time=90000)
+    assert act.int_times
+    assert act.start_s == 0 and act.end_s == 90000
+    assert act.start_time == mtdt(0)
+    assert act.end_time == mtdt(1500)
+    assert act.duration == timedelta(hours=25)
+    assert act.duration_s == 90000
+    assert act.hours == 25
+    act.end_time = mtdt(60)
+    assert act.end_s == 3600
+
+
+def test_int_times_shift_and_convert():
+    leg = Leg(1, 'car', start_area=1, end_area=2, start_time=mtdt(900), end_time=mtdt(930))
+    assert not leg.int_times
+    assert leg.start_s == 54000
+    leg.set_int_times()
+    assert leg.int_times
+    assert (leg.start_s, leg.end_s) == (54000, 55800)
+    leg.shift_start_time(mtdt(960))
+    assert (leg.start_s, leg.end_s) == (57600, 59400)
+    leg.set_int_times(False)
+    assert (leg.start_time, leg.end_time) == (mtdt(960), mtdt(990))
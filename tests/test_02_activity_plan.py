@@ -2,7 +2,7 @@ import pytest
 from datetime import datetime
 from datetime import timedelta
 
-from pam.activity import Plan, Activity, Leg, Location
+from pam.activity import Plan, Activity, Leg, Location, infer_tour_activities
 from pam.utils import minutes_to_datetime as mtdt
 from .fixtures import person_heh, person_heh_open1, person_hew_open2, person_whw, person_whshw
 from pam.variables import END_OF_DAY
@@ -511,4 +511,26 @@ def test_leg_duration():
 
     plan.mode_shift(3,'rail', mode_speed = {'car':37, 'bus':10, 'walk':4, 'cycle': 14, 'pt':23, 'rail':37}, update_duration=True)
 
-    assert [act.duration for act in plan] == [timedelta(seconds=3603), timedelta(seconds=1800), timedelta(seconds=1800), timedelta(seconds=3600), timedelta(seconds=75597)]
\ No newline at end of file
+    assert [act.duration for act in plan] == [timedelta(seconds=3603), timedelta(seconds=1800), timedelta(seconds=1800), timedelta(seconds=3600), timedelta(seconds=75597)]
+
+def test_infer_tour_activities_long_plan_matches_plan_method():
+    plan = Plan(home_location=Location(area='z0'))
+    zones = ['z0'] + [f"z{(i * 7) % 40}" for i in range(1, 400)] + ['z0']
+    for i, zone in enumerate(zones):
+        plan.day.append(Activity(seq=i, area=zone, start_time=mtdt(3 * i), end_time=mtdt(3 * i + 2)))
+        if i < len(zones) - 1:
+            plan.day.append(Leg(seq=i, purp=['work', 'shop', 'deliver'][i % 3], mode='car', start_area=zone,
+                                end_area=zones[i + 1], start_time=mtdt(3 * i + 2), end_time=mtdt(3 * i + 3)))
+    activities, legs = list(plan.activities), list(plan.legs)
+    acts = infer_tour_activities(
+        acts=[None] * len(activities),
+        purposes=[leg.purp for leg in legs],
+        locations=[act.location for act in activities],
+        leg_locations=[(leg.start_location, leg.end_location) for leg in legs],
+        duration=lambda i: activities[i].duration,
+        home=plan.home,
+    )
+    plan.infer_activities_from_tour_purpose()
+    assert acts == [act.act for act in plan.activities]
+    assert acts[0] == acts[-1] == 'home'
+    assert None not in acts
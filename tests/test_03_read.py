@@ -14,6 +14,13 @@ test_trips_path = os.path.abspath(
 test_attributes_path = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "test_data/simple_persons_data.csv")
 )
+test_hhs_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/simple_hhs_data.csv")
+)
+# simple travel diary population pickled by pam before plan components and locations had __slots__
+test_legacy_pickle_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/legacy_diary_population.pkl")
+)
 
 
 testdata = [
@@ -143,6 +150,20 @@ def test_load_pickle_population(person_crop_last_act, tmpdir):
     assert list(loaded.households['1'].people) == list(population.households['1'].people)
 
 
+def test_load_legacy_pickle_population():
+    loaded = load_pickle(test_legacy_pickle_path)
+    expected = load_travel_diary(
+        pd.read_csv(test_trips_path), pd.read_csv(test_attributes_path), pd.read_csv(test_hhs_path)
+    )
+    assert loaded == expected
+    for (_, _, person), (_, _, expected_person) in zip(loaded.people(), expected.people()):
+        assert person.vehicle == expected_person.vehicle
+        assert [c.start_time for c in person.plan] == [c.start_time for c in expected_person.plan]
+        assert [c.end_s for c in person.plan] == [c.end_s for c in expected_person.plan]
+        assert [c.location.area for c in person.activities] == [c.location.area for c in expected_person.activities]
+        assert not any(leg.route.exists for leg in person.legs)
+
+
 def test_pickle_household(person_crop_last_act, tmpdir):
     hh = Household('1')
     hh.add(person_crop_last_act)
@@ -0,0 +1,131 @@
+import os
+import pickle
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from shapely.geometry import Point
+
+from pam.core import Household, Person, Population
+from pam.read import read_matsim, read_mapped, MappedPopulation
+from pam.vehicle import ElectricVehicle, Vehicle, VehicleType
+from pam.write import to_mapped, write_matsim, Writer
+from .fixtures import population_with_attributes_and_vehicles, read_without_created_comment
+
+
+test_tripsv12_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml")
+)
+
+
+@pytest.fixture
+def mapped_path(tmp_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    to_mapped(population, str(tmp_path / "population"))
+    return str(tmp_path / "population")
+
+
+def count_legs(population, start, stop):
+    return sum(len(list(person.legs)) for _, _, person in population.people(start, stop))
+
+
+def test_mapped_population_to_population_round_trip(mapped_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    mapped = read_mapped(mapped_path)
+    assert isinstance(mapped, MappedPopulation)
+    assert mapped.stats == population.stats
+    assert mapped.to_population() == population
+
+
+def test_mapped_population_writes_identical_matsim(tmp_path, mapped_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    write_matsim(population, str(tmp_path / "expected.xml"))
+    with Writer(str(tmp_path / "result.xml")) as writer:
+        for _, household in read_mapped(mapped_path).households.items():
+            writer.add_hh(household)
+    assert read_without_created_comment(tmp_path / "result.xml") == \
+        read_without_created_comment(tmp_path / "expected.xml")
+
+
+def test_mapped_population_lazy_access(mapped_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    mapped = read_mapped(mapped_path)
+    assert len(mapped) == 5
+    assert list(mapped.households) == list(population.households)
+    assert 'chris' in mapped
+    assert 'nobody' not in mapped
+    assert mapped.get('nobody') is None
+    assert mapped['chris'] == population['chris']
+    assert [pid for _, pid, _ in mapped.people(1, 3)] == [pid for _, pid, _ in population.people()][1:3]
+
+
+def test_mapped_population_returns_new_objects(mapped_path):
+    mapped = read_mapped(mapped_path)
+    person = mapped['chris']['chris']
+    person.attributes['subpopulation'] = 'poor'
+    person.plan[1].attributes['routingMode'] = 'bike'
+    person2 = mapped['chris']['chris']
+    assert person2.attributes['subpopulation'] == 'rich'
+    assert person2.plan[1].attributes['routingMode'] == 'car'
+
+
+def test_mapped_population_int_times(mapped_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    mapped = read_mapped(mapped_path, int_times=True)
+    for (_, _, person), (_, _, person2) in zip(population.people(), mapped.people()):
+        assert all(c.int_times for c in person2.plan)
+        assert [c.start_s for c in person2.plan] == [c.start_s for c in person.plan]
+        assert [c.end_s for c in person2.plan] == [c.end_s for c in person.plan]
+
+
+def test_mapped_population_pickles_path_only(mapped_path):
+    mapped = read_mapped(mapped_path)
+    data = pickle.dumps(mapped)
+    assert len(data) < 500
+    assert pickle.loads(data).to_population() == mapped.to_population()
+
+
+def test_mapped_population_shared_with_worker_processes(mapped_path):
+    mapped = read_mapped(mapped_path)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        counts = list(executor.map(partial(count_legs, mapped), [0, 2, 4], [2, 4, 6]))
+    assert sum(counts) == mapped.stats['num_legs']
+
+
+def test_mapped_population_attributes_and_vehicles(tmp_path):
+    population = population_with_attributes_and_vehicles()
+    to_mapped(population, str(tmp_path / "population"))
+
+    mapped = read_mapped(str(tmp_path / "population"))
+    assert mapped.name == "test"
+    household2 = mapped['A']
+    assert household2.attributes == {'income': 'high', 'size': 2}
+    assert household2.location.loc == Point(1, 2)
+    assert household2['a'].attributes == {'age': 30, 'height': 1.8, 'worker': True}
+    assert household2['a'].vehicle == Vehicle('a', VehicleType(id='small', length=3.0))
+    assert household2['b'].vehicle == ElectricVehicle('b', battery_capacity=30)
+    assert household2['a'].plan[1].distance == 1000
+    assert household2['a'].plan[2].location.loc == Point(5, 5)
+    assert mapped.to_population() == population
+
+
+def test_mapped_population_looks_up_households_by_hid(tmp_path, monkeypatch):
+    population = Population()
+    for hid in [10, 2, 'b', 'a', 1]:
+        household = Household(hid)
+        household.add(Person(f"p{hid}"))
+        population.add(household)
+    to_mapped(population, str(tmp_path / "population"))
+    monkeypatch.setattr("pam.read.mapped.VALUE_CACHE_SIZE", 2)
+    mapped = read_mapped(str(tmp_path / "population"))
+    assert list(mapped.households) == [10, 2, 'b', 'a', 1]
+    for hid in [10, 2, 'b', 'a', 1]:
+        assert hid in mapped
+        assert mapped[hid].hid == hid
+        assert list(mapped[hid].people) == [f"p{hid}"]
+    assert '10' not in mapped and 3 not in mapped and 'c' not in mapped
+    assert mapped._shared_value.cache_info().currsize <= 2
+
+
+def test_read_mapped_without_metadata_raises(tmp_path):
+    with pytest.raises(UserWarning):
+        read_mapped(str(tmp_path))
@@ -1,8 +1,14 @@
+import bz2
+import gzip
 import os
+import pickle
 import pytest
+from lxml import etree
 
-from pam.read import load_attributes_map, read_matsim, stream_matsim_persons
-from pam.activity import Plan
+from pam.read import load_attributes_map, read_matsim, stream_matsim_persons, read_matsim_persons, PersonIndex
+from pam.read import matsim, summarise_matsim_plan, stream_person_sources, parse_matsim_person_source
+from pam.activity import Plan, Route
+from pam import utils
 
 
 test_trips_path = os.path.abspath(
@@ -182,4 +188,355 @@ def test_stream_transit_v12_matsim():
     assert legs[1].route.transit.get("transitRouteId") == 'work_bound'
     assert legs[1].route.transit.get("accessFacilityId") == 'home_stop_out'
     assert legs[1].route.transit.get("egressFacilityId") == 'work_stop_in'
-    assert legs[1].route.network_route == []
\ No newline at end of file
+    assert legs[1].route.network_route == []
+
+# test parallel read
+
+test_experienced_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/test_matsim_experienced_plans_v12.xml")
+)
+
+
+@pytest.fixture()
+def small_chunks(monkeypatch):
+    # force the plans to be split across many chunks
+    monkeypatch.setattr("pam.utils.DEFAULT_CHUNK_SIZE", 512)
+
+
+def test_parallel_read_matches_serial_v12(small_chunks):
+    serial = read_matsim(test_experienced_path, household_key="hid", keep_non_selected=True)
+    parallel = read_matsim(test_experienced_path, household_key="hid", keep_non_selected=True, workers=2)
+    assert list(serial.households) == list(parallel.households)
+    assert [pid for _, pid, _ in serial.people()] == [pid for _, pid, _ in parallel.people()]
+    assert serial == parallel
+    for (_, _, person), (_, _, other) in zip(serial.people(), parallel.people()):
+        assert person.attributes == other.attributes
+        assert [leg.network_route for leg in person.legs] == [leg.network_route for leg in other.legs]
+        assert [leg.route.transit for leg in person.legs] == [leg.route.transit for leg in other.legs]
+
+
+def test_parallel_read_int_times_matches_serial(small_chunks):
+    serial = read_matsim(test_experienced_path, int_times=True, keep_non_selected=True)
+    parallel = read_matsim(test_experienced_path, int_times=True, keep_non_selected=True, workers=2)
+    assert serial == parallel
+    for (_, _, person), (_, _, other) in zip(serial.people(), parallel.people()):
+        assert all(c.int_times for c in other.plan)
+        assert [c.start_s for c in person.plan] == [c.start_s for c in other.plan]
+        assert [leg.route.matsim_state() for leg in person.legs] == [leg.route.matsim_state() for leg in other.legs]
+
+
+def test_parallel_read_matches_serial_v11(small_chunks):
+    serial = read_matsim(test_trips_path, test_attributes_path, version=11, simplify_pt_trips=True, crop=True)
+    parallel = read_matsim(
+        test_trips_path, test_attributes_path, version=11, simplify_pt_trips=True, crop=True, workers=2
+        )
+    assert list(serial.households) == list(parallel.households)
+    assert serial == parallel
+    assert parallel['census_0']['census_0'].attributes == serial['census_0']['census_0'].attributes
+
+
+def test_parallel_v11_stream_with_restricted_fields_matches_serial(small_chunks):
+    attributes = load_attributes_map(test_attributes_path)
+    for person_filter in [None, is_female]:
+        serial, parallel = [
+            list(stream_matsim_persons(
+                test_trips_path, attributes=attributes, version=11, fields=['loc', 'link'],
+                person_filter=person_filter, workers=workers
+                ))
+            for workers in [1, 2]
+        ]
+        assert serial
+        assert [p.pid for p in parallel] == [p.pid for p in serial]
+        assert all(p.attributes == {} for p in serial + parallel)
+
+
+def test_parallel_stream_matches_serial_without_routes():
+    serial = list(stream_matsim_persons(test_tripsv12_path, leg_route=False, leg_attributes=False))
+    parallel = list(stream_matsim_persons(test_tripsv12_path, leg_route=False, leg_attributes=False, workers=2))
+    assert [p.pid for p in serial] == [p.pid for p in parallel]
+    for person, other in zip(serial, parallel):
+        assert person == other
+
+
+# test random access
+
+def write_compressed(data, path, suffix, members=1):
+    if suffix == ".gz":
+        step = len(data) // members + 1
+        with open(path, "wb") as f:
+            for i in range(0, len(data), step):
+                f.write(gzip.compress(data[i:i + step]))
+    else:
+        with open(path, "wb") as f:
+            f.write(bz2.compress(data))
+
+
+@pytest.fixture(params=[("", 1), (".gz", 1), (".gz", 4), (".bz2", 1)])
+def experienced_plans(request, tmp_path):
+    suffix, members = request.param
+    path = os.path.join(tmp_path, "plans.xml" + suffix)
+    with open(test_experienced_path, "rb") as f:
+        data = f.read()
+    if suffix:
+        write_compressed(data, path, suffix, members)
+    else:
+        with open(path, "wb") as f:
+            f.write(data)
+    return path
+
+
+def test_person_index_maps_all_persons(experienced_plans):
+    index = PersonIndex.build(experienced_plans)
+    expected = [person.pid for person in stream_matsim_persons(test_experienced_path)]
+    assert index.pids == expected
+    for pid, person_bytes in index.read(expected):
+        assert person_bytes.startswith(b"<person")
+        assert person_bytes.endswith(b"</person>")
+
+
+def test_person_index_records_gzip_member_seek_points(tmp_path):
+    path = os.path.join(tmp_path, "plans.xml.gz")
+    with open(test_experienced_path, "rb") as f:
+        write_compressed(f.read(), path, ".gz", members=4)
+    assert len(PersonIndex.build(path).seek_points) == 4
+
+
+def test_read_matsim_persons_matches_stream(experienced_plans):
+    streamed = {person.pid: person for person in stream_matsim_persons(test_experienced_path, keep_non_selected=True)}
+    pids = list(streamed)[::-3] + ["unknown"]
+    persons = read_matsim_persons(experienced_plans, pids, keep_non_selected=True)
+    assert [person.pid for person in persons] == pids[:-1]
+    for person in persons:
+        assert person == streamed[person.pid]
+        assert person.attributes == streamed[person.pid].attributes
+    assert not os.path.exists(experienced_plans + ".idx")
+
+
+def test_read_matsim_persons_saves_index_on_request(experienced_plans):
+    read_matsim_persons(experienced_plans, ["chris"], save_index=True)
+    assert not PersonIndex.load(experienced_plans).is_stale
+
+
+def test_person_index_save_load_round_trip(experienced_plans):
+    index = PersonIndex.build(experienced_plans)
+    path = index.save()
+    loaded = PersonIndex.load(experienced_plans, path)
+    assert loaded.offsets == index.offsets
+    assert loaded.seek_points == index.seek_points
+    assert loaded.compression == index.compression
+    assert not loaded.is_stale
+
+
+def test_stale_person_index_is_rebuilt(tmp_path):
+    path = os.path.join(tmp_path, "plans.xml")
+    with open(test_tripsv12_path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data)
+    PersonIndex.build(path).save()
+    with open(path, "wb") as f:
+        f.write(data.replace(b'<person id="chris">', b'<person id="christopher">'))
+    assert PersonIndex.load(path).is_stale
+    assert [p.pid for p in read_matsim_persons(path, ["christopher"])] == ["christopher"]
+
+
+# test filters
+
+def is_rich(pid, attributes):
+    return attributes.get("subpopulation") == "rich"
+
+
+def has_bus_leg(plan):
+    return "bus" in plan.modes
+
+
+def test_summarise_matsim_plan():
+    plan_xml = next(utils.get_elems(test_tripsv12_path, "plan"))
+    summary = summarise_matsim_plan(plan_xml)
+    assert summary.selected
+    assert summary.activities == ["home", "work", "home"]
+    assert summary.modes == ["car", "car"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_stream_with_person_filter_skips_persons(workers):
+    stats = {}
+    persons = list(stream_matsim_persons(test_tripsv12_path, person_filter=is_rich, workers=workers, stats=stats))
+    assert [p.attributes["subpopulation"] for p in persons] == ["rich"] * len(persons)
+    assert stats["skipped"] == stats["persons"] - len(persons)
+    assert stats["skipped"] > 0
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_stream_with_plan_filter_skips_persons(workers):
+    stats = {}
+    persons = list(stream_matsim_persons(test_tripsv12_path, plan_filter=has_bus_leg, workers=workers, stats=stats))
+    assert [p.pid for p in persons] == ["fred"]
+    assert stats == {"persons": 5, "skipped": 4}
+
+
+def test_v11_stream_with_person_filter_uses_attributes_map():
+    attributes = load_attributes_map(test_attributes_path)
+    persons = list(stream_matsim_persons(
+        test_trips_path,
+        attributes=attributes,
+        version=11,
+        person_filter=lambda pid, attributes: attributes.get("gender") == "female",
+        ))
+    assert persons
+    assert all(p.attributes["gender"] == "female" for p in persons)
+
+
+def is_female(pid, attributes):
+    return attributes.get("gender") == "female"
+
+
+def test_parallel_v11_stream_with_person_filter_matches_serial(small_chunks, mocker):
+    attributes = load_attributes_map(test_attributes_path)
+    serial = list(stream_matsim_persons(test_trips_path, attributes=attributes, version=11, person_filter=is_female))
+    sent = []
+    chunk_attributes = matsim._chunk_attributes
+    mocker.patch.object(
+        matsim, "_chunk_attributes", side_effect=lambda *args: sent.append(chunk_attributes(*args)) or sent[-1]
+        )
+    parallel = list(stream_matsim_persons(
+        test_trips_path, attributes=attributes, version=11, person_filter=is_female, workers=2
+        ))
+    assert serial
+    assert [p.pid for p in parallel] == [p.pid for p in serial]
+    assert [p.attributes for p in parallel] == [p.attributes for p in serial]
+    assert len(sent) > 1
+    assert all(len(chunk) < len(attributes) for chunk in sent)
+
+
+def test_filtered_persons_are_not_parsed(mocker):
+    parse = mocker.spy(matsim, "parse_matsim_plan")
+    list(stream_matsim_persons(test_tripsv12_path, plan_filter=has_bus_leg))
+    assert parse.call_count == 1
+
+
+# test field projection
+
+def test_read_without_optional_fields():
+    population = read_matsim(test_tripsv12_path, fields=[])
+    person = population['chris']['chris']
+    assert person.attributes == {}
+    assert [a.act for a in person.activities] == ["home", "work", "home"]
+    assert all(a.location.loc is None and a.location.link is None for a in person.activities)
+    legs = list(person.legs)
+    assert [leg.mode for leg in legs] == ["car", "car"]
+    assert not any(leg.route.exists for leg in legs)
+    assert all(leg.attributes == {} for leg in legs)
+    assert person.plan.valid_time_sequence
+    assert legs[0].duration == read_matsim(test_tripsv12_path)['chris']['chris'].plan[1].duration
+
+
+def test_read_loc_field_only():
+    population = read_matsim(test_tripsv12_path, fields=["loc"])
+    full = read_matsim(test_tripsv12_path)
+    for (_, _, person), (_, _, other) in zip(population.people(), full.people()):
+        assert [a.location.loc for a in person.activities] == [a.location.loc for a in other.activities]
+        assert [a.start_time for a in person.activities] == [a.start_time for a in other.activities]
+        assert all(a.location.link is None for a in person.activities)
+
+
+def test_read_all_fields_matches_default():
+    population = read_matsim(test_tripsv12_path, household_key="hid", fields=matsim.MATSIM_FIELDS)
+    full = read_matsim(test_tripsv12_path, household_key="hid")
+    assert population == full
+    assert population['A']['chris'].attributes == full['A']['chris'].attributes
+    assert list(population['A']['chris'].legs)[1].network_route == ['3-4', '4-3', '3-2', '2-1', '1-2']
+
+
+def test_read_unknown_field_fails():
+    with pytest.raises(UserWarning):
+        read_matsim(test_tripsv12_path, fields=["geometry"])
+
+
+def test_read_households_without_attributes_field_fails():
+    with pytest.raises(UserWarning):
+        read_matsim(test_tripsv12_path, household_key="hid", fields=["loc"])
+
+
+# test routes
+
+def test_routes_are_detached_from_xml():
+    population = read_matsim(test_experienced_path)
+    for _, _, person in population.people():
+        for leg in person.legs:
+            assert not any(isinstance(getattr(leg.route, k), etree._Element) for k in Route.__slots__)
+
+
+def test_route_regenerates_original_xml():
+    originals = [(dict(elem.attrib), elem.text) for elem in utils.get_elems(test_tripsv12_path, "route")]
+    routes = []
+    for person in stream_matsim_persons(test_tripsv12_path, keep_non_selected=True):
+        for plan in [person.plan] + person.plans_non_selected:
+            routes.extend(leg.route for leg in plan.legs if leg.route.exists)
+    assert len(routes) == len(originals)
+    for route, (attrib, text) in zip(routes, originals):
+        assert route.xml.attrib == attrib
+        assert route.xml.text == text
+        assert route.get("start_link") == attrib.get("start_link")
+
+
+def test_routes_pickle():
+    person = read_matsim(test_tripsv12_path)['chris']['chris']
+    leg = pickle.loads(pickle.dumps(person)).plan[3]
+    assert leg.route.network_route == ['3-4', '4-3', '3-2', '2-1', '1-2']
+    assert leg.route.distance == 10300
+
+
+def test_cleared_route_behaves_as_empty():
+    person = read_matsim(test_tripsv12_path)['fred']['fred']
+    route = list(person.legs)[1].route
+    assert route.transit
+    route.clear()
+    assert not route.exists
+    assert route.xml == {}
+    assert route.get("start_link") is None
+    assert route.transit == {}
+    assert route.distance is None
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"simplify_pt_trips": True, "crop": True}])
+def test_read_int_times_matches_datetimes(kwargs):
+    population = read_matsim(test_tripsv12_path, **kwargs)
+    int_population = read_matsim(test_tripsv12_path, int_times=True, **kwargs)
+    for hid, pid, person in population.people():
+        int_plan = int_population[hid][pid].plan
+        assert all(component.int_times for component in int_plan)
+        assert [(c.start_time, c.end_time) for c in person.plan] \
+            == [(c.start_time, c.end_time) for c in int_plan]
+    assert population == int_population
+
+
+def test_stream_person_sources_yields_person_elements():
+    sources = list(stream_person_sources(test_tripsv12_path))
+    assert [pid for pid, _ in sources] == [person.pid for person in stream_matsim_persons(test_tripsv12_path)]
+    for pid, source in sources:
+        assert etree.fromstring(source).get("id") == pid
+
+
+def test_parse_matsim_person_source_matches_stream():
+    persons = list(stream_matsim_persons(test_tripsv12_path, keep_non_selected=True))
+    for person, (_, source) in zip(persons, stream_person_sources(test_tripsv12_path)):
+        parsed = parse_matsim_person_source(source, keep_non_selected=True)
+        assert parsed == person
+        assert parsed.source == source
+        assert not parsed.dirty
+
+
+def test_keep_source_requires_serial_v12_stream():
+    with pytest.raises(UserWarning):
+        list(stream_matsim_persons(test_tripsv12_path, keep_source=True, workers=2))
+
+
+def test_read_matsim_interns_activity_types_and_modes():
+    population = read_matsim(test_experienced_path, version=12)
+    strings = {}
+    for _, _, person in population.people():
+        for component in person.plan:
+            for value in (getattr(component, 'act'), getattr(component, 'mode', None)):
+                if value is not None:
+                    assert strings.setdefault(value, value) is value
@@ -0,0 +1,102 @@
+import os
+import pytest
+from shapely.geometry import Point
+
+from pam.activity import RouteV11
+from pam.core import Population
+from pam.read import read_matsim, read_parquet, stream_parquet_persons, read_parquet_metadata
+from pam.vehicle import ElectricVehicle, Vehicle, VehicleType
+from pam.write import to_parquet, write_matsim
+from .fixtures import assert_same_routes, population_with_attributes_and_vehicles, read_without_created_comment
+
+pytest.importorskip("pyarrow")
+
+
+test_trips_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plans.xml")
+)
+test_tripsv12_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml")
+)
+test_attributes_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/test_matsim_attributes.xml")
+)
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 100])
+def test_parquet_round_trip_writes_identical_matsim(tmp_path, batch_size):
+    population = read_matsim(test_tripsv12_path, version=12)
+    to_parquet(population, str(tmp_path / "population"), batch_size=batch_size)
+    population2 = read_parquet(str(tmp_path / "population"))
+    assert population2 == population
+
+    write_matsim(population, str(tmp_path / "expected.xml"))
+    write_matsim(population2, str(tmp_path / "result.xml"))
+    assert read_without_created_comment(tmp_path / "result.xml") == \
+        read_without_created_comment(tmp_path / "expected.xml")
+
+
+def test_parquet_round_trip_v11_routes(tmp_path):
+    population = read_matsim(test_trips_path, test_attributes_path, version=11)
+    to_parquet(population, str(tmp_path / "population"))
+    population2 = read_parquet(str(tmp_path / "population"))
+    assert population2 == population
+    assert_same_routes(population, population2)
+    assert any(isinstance(leg.route, RouteV11) for _, _, p in population2.people() for leg in p.legs)
+
+
+def test_parquet_round_trip_without_routes(tmp_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    to_parquet(population, str(tmp_path / "population"), routes=False)
+    assert not os.path.exists(tmp_path / "population" / "routes")
+    population2 = read_parquet(str(tmp_path / "population"))
+    assert population2 == population
+    assert not any(leg.route.exists for _, _, p in population2.people() for leg in p.legs)
+
+
+def test_parquet_round_trip_attributes_and_vehicles(tmp_path):
+    population = population_with_attributes_and_vehicles(job='work')
+    vehicle_type = VehicleType(id='small', length=3.0)
+
+    to_parquet(population, str(tmp_path / "population"))
+    population2 = read_parquet(str(tmp_path / "population"))
+    assert population2.name == "test"
+    household2 = population2['A']
+    assert household2.attributes == {'income': 'high', 'size': 2}
+    assert household2.location.area == 'zone'
+    assert household2.location.loc == Point(1, 2)
+    assert household2['a'].attributes == {'age': 30, 'height': 1.8, 'worker': True, 'job': 'work'}
+    assert household2['a'].vehicle == Vehicle('a', vehicle_type)
+    assert household2['b'].vehicle == ElectricVehicle('b', battery_capacity=30)
+    assert household2['a'].plan[1].distance == 1000
+    assert household2['a'].plan[2].location.loc == Point(5, 5)
+    assert population2.activity_classes == {'home', 'work'}
+
+
+def test_read_parquet_int_times(tmp_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    to_parquet(population, str(tmp_path / "population"))
+    population2 = read_parquet(str(tmp_path / "population"), int_times=True)
+    for (_, _, person), (_, _, person2) in zip(population.people(), population2.people()):
+        assert all(c.int_times for c in person2.plan)
+        assert [c.start_s for c in person2.plan] == [c.start_s for c in person.plan]
+        assert [c.end_s for c in person2.plan] == [c.end_s for c in person.plan]
+
+
+def test_stream_parquet_persons_in_order(tmp_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    to_parquet(population, str(tmp_path / "population"), batch_size=2)
+    assert read_parquet_metadata(str(tmp_path / "population"))['parts'] == 3
+    persons = list(stream_parquet_persons(str(tmp_path / "population")))
+    assert [p.pid for p in persons] == [pid for _, pid, _ in population.people()]
+    assert [p.plan for p in persons] == [p.plan for _, _, p in population.people()]
+
+
+def test_parquet_round_trip_empty_population(tmp_path):
+    to_parquet(Population(), str(tmp_path / "population"))
+    assert read_parquet(str(tmp_path / "population")).stats['num_households'] == 0
+
+
+def test_read_parquet_without_metadata_raises(tmp_path):
+    with pytest.raises(UserWarning):
+        read_parquet(str(tmp_path))
@@ -0,0 +1,127 @@
+import os
+import pytest
+from datetime import datetime
+from shapely.geometry import Point
+
+from pam.activity import RouteV11
+from pam.core import Household, Person, Population
+from pam.location import Location
+from pam.read import read_matsim, load_snapshot, iter_snapshot_households, read_snapshot_header
+from pam.vehicle import ElectricVehicle, Vehicle, VehicleType
+from pam.write import save_snapshot, write_matsim, SnapshotWriter
+from .fixtures import assert_same_routes, population_with_attributes_and_vehicles, read_without_created_comment
+
+
+test_trips_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plans.xml")
+)
+test_tripsv12_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml")
+)
+test_attributes_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/test_matsim_attributes.xml")
+)
+
+
+@pytest.mark.parametrize("compression", [None, 'zlib', 'zstd'])
+def test_snapshot_round_trip_writes_identical_matsim(tmp_path, compression):
+    if compression == 'zstd':
+        pytest.importorskip("zstandard")
+    population = read_matsim(test_tripsv12_path, version=12, keep_non_selected=True)
+    save_snapshot(population, str(tmp_path / "population.snap"), compression=compression)
+    assert read_snapshot_header(str(tmp_path / "population.snap"))['compression'] == compression
+    population2 = load_snapshot(str(tmp_path / "population.snap"))
+    assert population2 == population
+
+    write_matsim(population, str(tmp_path / "expected.xml"), keep_non_selected=True)
+    write_matsim(population2, str(tmp_path / "result.xml"), keep_non_selected=True)
+    assert read_without_created_comment(tmp_path / "result.xml") == \
+        read_without_created_comment(tmp_path / "expected.xml")
+
+
+def test_snapshot_round_trip_v11_routes(tmp_path):
+    population = read_matsim(test_trips_path, test_attributes_path, version=11)
+    population.save_snapshot(str(tmp_path / "population.snap"))
+    population2 = load_snapshot(str(tmp_path / "population.snap"))
+    assert population2 == population
+    assert_same_routes(population, population2)
+    assert any(isinstance(leg.route, RouteV11) for _, _, p in population2.people() for leg in p.legs)
+
+
+def test_snapshot_round_trip_attributes_and_vehicles(tmp_path):
+    population = population_with_attributes_and_vehicles(start=datetime(2020, 1, 1))
+    vehicle_type = VehicleType(id='small', length=3.0)
+
+    save_snapshot(population, str(tmp_path / "population.snap"))
+    population2 = load_snapshot(str(tmp_path / "population.snap"))
+    assert population2.name == "test"
+    household2 = population2['A']
+    assert household2.attributes == {'income': 'high', 'size': 2}
+    assert household2.location.area == 'zone'
+    assert household2.location.loc == Point(1, 2)
+    assert household2['a'].attributes == {'age': 30, 'height': 1.8, 'worker': True, 'start': datetime(2020, 1, 1)}
+    assert household2['a'].vehicle == Vehicle('a', vehicle_type)
+    assert household2['b'].vehicle == ElectricVehicle('b', battery_capacity=30)
+    assert household2['a'].plan[1].distance == 1000
+    assert household2['a'].plan.home_location is household2['a'].home_location
+    assert population2.activity_classes == {'home', 'work'}
+
+
+def test_load_snapshot_int_times(tmp_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    save_snapshot(population, str(tmp_path / "population.snap"))
+    population2 = load_snapshot(str(tmp_path / "population.snap"), int_times=True)
+    for (_, _, person), (_, _, person2) in zip(population.people(), population2.people()):
+        assert all(c.int_times for c in person2.plan)
+        assert [c.start_s for c in person2.plan] == [c.start_s for c in person.plan]
+        assert [c.end_s for c in person2.plan] == [c.end_s for c in person.plan]
+
+
+def test_snapshot_writer_streams_households_in_order(tmp_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    with SnapshotWriter(str(tmp_path / "population.snap")) as writer:
+        for _, household in population.households.items():
+            writer.add_hh(household)
+    households = list(iter_snapshot_households(str(tmp_path / "population.snap")))
+    assert [h.hid for h in households] == list(population.households)
+    assert households == list(population.households.values())
+
+
+def test_snapshot_points_are_shared_within_households_only(tmp_path):
+    population = Population()
+    for hid in ['A', 'B']:
+        household = Household(hid, location=Location(loc=Point(1, 2)))
+        for pid in ['a', 'b']:
+            household.add(Person(f"{hid}{pid}", home_location=Location(loc=Point(1, 2))))
+        population.add(household)
+    save_snapshot(population, str(tmp_path / "population.snap"))
+    household, other = iter_snapshot_households(str(tmp_path / "population.snap"))
+    assert household['Aa'].home_location.loc is household['Ab'].home_location.loc
+    assert household['Aa'].home_location.loc is not other['Ba'].home_location.loc
+    assert household['Aa'].home_location.loc == other['Ba'].home_location.loc
+
+
+def test_snapshot_round_trip_empty_population(tmp_path):
+    save_snapshot(Population(), str(tmp_path / "population.snap"))
+    assert load_snapshot(str(tmp_path / "population.snap")).stats['num_households'] == 0
+
+
+def test_load_truncated_snapshot_raises(tmp_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    save_snapshot(population, str(tmp_path / "population.snap"))
+    with open(tmp_path / "population.snap", "rb") as f:
+        data = f.read()
+    with open(tmp_path / "truncated.snap", "wb") as f:
+        f.write(data[:-10])
+    with pytest.raises(UserWarning):
+        load_snapshot(str(tmp_path / "truncated.snap"))
+
+
+def test_load_snapshot_of_other_file_raises(tmp_path):
+    with pytest.raises(UserWarning):
+        load_snapshot(test_tripsv12_path)
+
+
+def test_save_snapshot_unknown_compression_raises(tmp_path):
+    with pytest.raises(UserWarning):
+        save_snapshot(Population(), str(tmp_path / "population.snap"), compression='bz2')
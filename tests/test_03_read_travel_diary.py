@@ -1,11 +1,12 @@
 from logging import error
+import logging
 import os
 from io import StringIO
 from pam.core import Person
 import pandas as pd
 import pytest
 
-from pam.read import build_population, load_travel_diary
+from pam.read import build_population, load_travel_diary, stream_travel_diary
 from pam import PAMValidationLocationsError
 
 
@@ -283,6 +284,18 @@ def test_read_trips_without_seq_fail_if_out_of_order(trips):
         population.validate()
 
 
+def test_read_shuffled_trips_with_seq_builds_plans_in_seq_order(trips):
+    population = load_travel_diary(trips=trips.sample(frac=1, random_state=0))
+    plan = population[1][2].plan
+    assert [c.seq for c in plan] == [0, 4, 5, 5, 6, 6, 7]
+    assert [c.act for c in plan.activities] == ['home', 'shop', 'leisure', 'home']
+    assert [(leg.mode, leg.purp, leg.freq) for leg in plan.legs] == \
+        [('pt', 'shop', 5), ('walk', 'leisure', 6), ('pt', 'home', 7)]
+    assert [leg.start_time.hour for leg in plan.legs] == [7, 8, 9]
+    assert plan[0].location.area == 'Islington'
+    population.validate()
+
+
 # use trips input frequencies elsewhere
 
 def test_use_trips_freq_as_persons_freq_overwrite(trips, persons_attributes):
@@ -421,3 +434,57 @@ def test_home_location_consistency_between_hhs_and_persons_when_changing_hh_area
     assert person.home == "Test"
     assert hh.location == person.home
 
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 100])
+def test_stream_trips_csv_matches_load(tmp_path, trips, extra_persons_attributes, hhs_attributes, chunk_size):
+    trips.to_csv(tmp_path / "trips.csv", index=False)
+    expected = load_travel_diary(
+        trips=str(tmp_path / "trips.csv"),
+        persons_attributes=extra_persons_attributes.copy(),
+        hhs_attributes=hhs_attributes.copy()
+        )
+    households = list(stream_travel_diary(
+        str(tmp_path / "trips.csv"),
+        persons_attributes=extra_persons_attributes.copy(),
+        hhs_attributes=hhs_attributes.copy(),
+        chunk_size=chunk_size
+        ))
+    assert [hh.hid for hh in households] == [0, 1]
+    assert households == list(expected.households.values())
+    assert [c.seq for c in households[1][2].plan] == [c.seq for c in expected[1][2].plan]
+    assert len(households[1][3].plan) == 1
+
+
+def test_stream_trips_parquet(tmp_path, trips):
+    pytest.importorskip("pyarrow")
+    trips.to_parquet(tmp_path / "trips.parquet")
+    households = list(stream_travel_diary(str(tmp_path / "trips.parquet"), tour_based=False, chunk_size=3))
+    expected = load_travel_diary(trips=trips, tour_based=False)
+    assert households == list(expected.households.values())
+
+
+def test_stream_yields_attributes_only_households_last(tmp_path, trips, persons_attributes, hhs_attributes):
+    trips[trips.hid == 0].to_csv(tmp_path / "trips.csv", index=False)
+    households = list(stream_travel_diary(
+        str(tmp_path / "trips.csv"),
+        persons_attributes=persons_attributes,
+        hhs_attributes=hhs_attributes,
+        chunk_size=2
+        ))
+    assert [hh.hid for hh in households] == [0, 1]
+    assert households[1].freq == 2
+    assert [act.act for act in households[1][2].activities] == ['home']
+
+
+def test_stream_logs_input_warnings_once(tmp_path, trips, caplog):
+    trips.to_csv(tmp_path / "trips.csv", index=False)
+    with caplog.at_level(logging.WARNING, logger="pam.read.diary"):
+        list(stream_travel_diary(str(tmp_path / "trips.csv"), chunk_size=2))
+    assert [r.message for r in caplog.records].count("Using tour based purpose parser (recommended)") == 1
+
+
+def test_stream_ungrouped_trips_fails(tmp_path, trips):
+    trips.iloc[[0, 4, 1, 2, 3, 5, 6]].to_csv(tmp_path / "trips.csv", index=False)
+    with pytest.raises(UserWarning):
+        list(stream_travel_diary(str(tmp_path / "trips.csv"), chunk_size=2))
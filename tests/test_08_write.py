@@ -1,19 +1,22 @@
 import csv
+import gzip
 import os
 import pytest
-from datetime import datetime
+from datetime import datetime, timedelta
 from shapely.geometry import Point, LineString
 from copy import deepcopy
+from io import BytesIO
+import numpy as np
 import pandas as pd
 import geopandas as gp
 import lxml
 
-from .fixtures import population_heh
-from pam.activity import Activity, Leg
+from .fixtures import population_heh, read_without_created_comment
+from pam.activity import Activity, Leg, Plan, Route
 from pam.core import Household, Person, Population
-from pam import write
-from pam.write import write_matsim, write_matsim_population_v6, write_od_matrices, Writer
-from pam.read import read_matsim
+from pam import write, utils
+from pam.write import write_matsim, write_matsim_population_v6, write_od_matrices, od_matrices, Writer
+from pam.read import read_matsim, stream_matsim_persons
 from pam.utils import minutes_to_datetime as mtdt
 from pam.variables import END_OF_DAY
 
@@ -225,6 +228,318 @@ def test_read_write_consistent(tmp_path):
     assert population == population2
 
 
+def test_write_int_times_matches_datetimes(tmp_path):
+    test_tripsv12_path = os.path.abspath(
+        os.path.join(os.path.dirname(__file__),
+                     "test_data/test_matsim_plansv12.xml")
+    )
+    population = read_matsim(test_tripsv12_path, version=12)
+    write_matsim(population=population, plans_path=str(tmp_path / "datetimes.xml"))
+    population = read_matsim(test_tripsv12_path, version=12, int_times=True)
+    write_matsim(population=population, plans_path=str(tmp_path / "seconds.xml"))
+    outputs = [
+        [line for line in (tmp_path / name).read_text().splitlines() if "<!--Created" not in line]
+        for name in ["datetimes.xml", "seconds.xml"]
+    ]
+    assert outputs[0] == outputs[1]
+
+
+@pytest.mark.parametrize("name", ["test.xml", "test.xml.gz"])
+def test_parallel_write_matches_serial_write(tmp_path, monkeypatch, name):
+    test_tripsv12_path = os.path.abspath(
+        os.path.join(os.path.dirname(__file__),
+                     "test_data/test_matsim_plansv12.xml")
+    )
+    population = read_matsim(test_tripsv12_path, version=12, keep_non_selected=True)
+    monkeypatch.setattr(write.matsim, "DEFAULT_SHARD_SIZE", 1)
+    kwargs = dict(comment="test", keep_non_selected=True, coordinate_reference_system="EPSG:27700")
+    write_matsim(population=population, plans_path=str(tmp_path / "serial" / name), **kwargs)
+    write_matsim(population=population, plans_path=str(tmp_path / "parallel" / name), workers=2, **kwargs)
+
+    outputs = []
+    for directory in ["serial", "parallel"]:
+        data = (tmp_path / directory / name).read_bytes()
+        if name.endswith(".gz"):
+            data = gzip.decompress(data)
+        outputs.append([line for line in data.splitlines() if b"<!--Created" not in line])
+    assert outputs[0] == outputs[1]
+    assert read_matsim(str(tmp_path / "parallel" / name), version=12, keep_non_selected=True) == population
+
+
+def test_parallel_write_empty_population_matches_serial_write(tmp_path):
+    write_matsim(population=Population(), plans_path=str(tmp_path / "serial.xml"))
+    write_matsim(population=Population(), plans_path=str(tmp_path / "parallel.xml"), workers=2)
+    outputs = [
+        [line for line in (tmp_path / name).read_text().splitlines() if "<!--Created" not in line]
+        for name in ["serial.xml", "parallel.xml"]
+    ]
+    assert outputs[0] == outputs[1]
+
+
+@pytest.mark.parametrize("name,compression,warns", [
+    ("test.xml", 'infer', True), ("test.xml.zst", 'infer', True), ("test.xml.gz", 'infer', False),
+    ("test.xml", 'pgzip', False)
+])
+def test_parallel_write_warns_when_workers_have_no_effect(tmp_path, caplog, name, compression, warns):
+    if name.endswith(".zst"):
+        pytest.importorskip("zstandard")
+    population = read_matsim(test_tripsv12_path, version=12)
+    write_matsim(population=population, plans_path=str(tmp_path / name), workers=2, compression=compression)
+    assert ('parameter "workers"' in caplog.text) == warns
+    assert read_matsim(str(tmp_path / name), version=12) == population
+
+
+@pytest.mark.parametrize("name", ["test.xml", "test.xml.gz"])
+@pytest.mark.parametrize(
+    "plans",
+    ["test_matsim_plansv12.xml", "test_matsim_experienced_plans_v12.xml", "test_matsim_population_A.xml"]
+)
+def test_fast_write_matches_lxml_write(tmp_path, plans, name):
+    plans_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "test_data", plans))
+    population = read_matsim(plans_path, version=12, keep_non_selected=True)
+    kwargs = dict(comment="test", keep_non_selected=True, coordinate_reference_system="EPSG:27700")
+    write_matsim(population=population, plans_path=str(tmp_path / "lxml" / name), **kwargs)
+    write_matsim(population=population, plans_path=str(tmp_path / "fast" / name), fast=True, **kwargs)
+    assert read_without_created_comment(tmp_path / "lxml" / name) == \
+        read_without_created_comment(tmp_path / "fast" / name)
+    assert read_matsim(str(tmp_path / "fast" / name), version=12, keep_non_selected=True) == population
+
+
+def test_fast_write_int_times_matches_lxml_write(tmp_path):
+    plans_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml"))
+    population = read_matsim(plans_path, version=12, int_times=True)
+    write_matsim(population=population, plans_path=str(tmp_path / "lxml.xml"))
+    write_matsim(population=population, plans_path=str(tmp_path / "fast.xml"), fast=True)
+    assert read_without_created_comment(tmp_path / "lxml.xml") == \
+        read_without_created_comment(tmp_path / "fast.xml")
+
+
+def test_fast_write_parallel_matches_lxml_write(tmp_path, monkeypatch):
+    plans_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml"))
+    population = read_matsim(plans_path, version=12)
+    monkeypatch.setattr(write.matsim, "DEFAULT_SHARD_SIZE", 2)
+    write_matsim(population=population, plans_path=str(tmp_path / "lxml.xml.gz"))
+    write_matsim(population=population, plans_path=str(tmp_path / "fast.xml.gz"), fast=True, workers=2)
+    assert read_without_created_comment(tmp_path / "lxml.xml.gz") == \
+        read_without_created_comment(tmp_path / "fast.xml.gz")
+
+
+def test_person_xml_bytes_escapes_and_matches_person_element():
+    person = Person('a&<"b">', attributes={
+        'text': 'x & y < z > "w"\n\ttab\r', 'n': 1, 'f': 1.5, 'b': True, 'empty': '', 'é': 'ü'
+    })
+    person.add(Activity(act="home & away", loc=Point((0, 0)), link='1&2', start_time=mtdt(0), end_time=mtdt(60)))
+    leg = Leg(mode='car', start_time=mtdt(60), end_time=mtdt(90))
+    leg.attributes = {'routingMode': 'car', 'enterVehicleTime': 3600, 'n': 2}
+    leg.route = Route(lxml.etree.fromstring(
+        '<leg><route type="generic" start_link="1&amp;2" end_link="3" trav_time="00:30:00" distance="10.0">'
+        '{"a": "&lt;b&gt;"}</route></leg>'
+    ))
+    person.add(leg)
+    person.add(Activity(act="work", link='3', start_time=mtdt(90), end_time=END_OF_DAY))
+    person.plans_non_selected.append(Plan())
+
+    expected = lxml.etree.tostring(
+        write.create_person_element(person.pid, person, keep_non_selected=True),
+        encoding="utf-8", pretty_print=True
+    )
+    assert write.person_xml_bytes(person.pid, person, keep_non_selected=True) == expected
+
+
+def test_person_xml_bytes_without_attributes_or_routes():
+    person = Person('a')
+    person.add(Activity(act="home", link='1', start_time=mtdt(0), end_time=mtdt(60)))
+    person.add(Leg(mode='walk', start_time=mtdt(60), end_time=mtdt(90)))
+    person.add(Activity(act="work", link='2', start_time=mtdt(90), end_time=END_OF_DAY))
+
+    expected = lxml.etree.tostring(write.create_person_element(person.pid, person), encoding="utf-8", pretty_print=True)
+    assert write.person_xml_bytes(person.pid, person) == expected
+
+
+def test_fast_writer_writes_to_stream():
+    person = Person('a', attributes={'1': '1'})
+    person.add(Activity(act="home", link='1', start_time=mtdt(0), end_time=END_OF_DAY))
+    streams = [BytesIO(), BytesIO()]
+    for stream, fast in zip(streams, [False, True]):
+        with Writer(stream, comment="test", fast=fast) as writer:
+            writer.add_person(person)
+    outputs = [
+        [line for line in stream.getvalue().splitlines() if b"<!--Created" not in line]
+        for stream in streams
+    ]
+    assert outputs[0] == outputs[1]
+
+
+
+test_tripsv12_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml")
+)
+
+
+@pytest.mark.parametrize("compression,level", [
+    (None, None), ('gzip', 1), ('gzip', 9), ('pgzip', None), ('zstd', None), ('zstd', 10)
+])
+@pytest.mark.parametrize("fast", [False, True])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_compressed_write_matches_uncompressed_write(tmp_path, compression, level, fast, workers):
+    if compression == 'zstd':
+        pytest.importorskip("zstandard")
+    population = read_matsim(test_tripsv12_path, version=12, keep_non_selected=True)
+    kwargs = dict(comment="test", keep_non_selected=True, fast=fast, workers=workers)
+    write_matsim(population=population, plans_path=str(tmp_path / "expected.xml"), **kwargs)
+    write_matsim(
+        population=population, plans_path=str(tmp_path / "result.xml"), compression=compression,
+        compression_level=level, **kwargs
+    )
+    assert utils.compression_of(str(tmp_path / "result.xml")) == {'pgzip': 'gzip'}.get(compression, compression)
+    with utils.open_xml(str(tmp_path / "result.xml")) as f:
+        result = [line for line in f.read().splitlines() if b"<!--Created" not in line]
+    assert result == read_without_created_comment(tmp_path / "expected.xml")
+
+
+@pytest.mark.parametrize("name,compression", [("test.xml.gz", 'gzip'), ("test.xml.zst", 'zstd'), ("test.xml", None)])
+def test_writer_infers_compression_from_suffix(tmp_path, name, compression):
+    if compression == 'zstd':
+        pytest.importorskip("zstandard")
+    population = read_matsim(test_tripsv12_path, version=12)
+    write_matsim(population=population, plans_path=str(tmp_path / name))
+    assert utils.compression_of(str(tmp_path / name)) == compression
+    assert read_matsim(str(tmp_path / name), version=12) == population
+
+
+def test_writer_unknown_compression_fails(tmp_path):
+    with pytest.raises(UserWarning):
+        Writer(str(tmp_path / "test.xml"), compression='lzma')
+
+
+@pytest.mark.parametrize("name,level,compression", [
+    ("test.xml", None, None), ("test.xml", 6, None), ("test.xml.gz", None, 'gzip'), ("test.xml.gz", 1, 'gzip')
+])
+@pytest.mark.parametrize("fast", [False, True])
+def test_writer_compression_level_does_not_change_compression(tmp_path, name, level, compression, fast):
+    population = read_matsim(test_tripsv12_path, version=12)
+    write_matsim(population=population, plans_path=str(tmp_path / name), fast=fast, compression_level=level)
+    assert utils.compression_of(str(tmp_path / name)) == compression
+    assert read_matsim(str(tmp_path / name), version=12) == population
+
+
+@pytest.mark.parametrize("name,compression,level", [
+    ("test.xml.gz", 'infer', 0), ("test.xml.gz", 'infer', 12), ("test.xml", 'pgzip', 10)
+])
+@pytest.mark.parametrize("fast", [False, True])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_writer_unsupported_gzip_level_fails(tmp_path, name, compression, level, fast, workers):
+    population = read_matsim(test_tripsv12_path, version=12)
+    with pytest.raises(UserWarning):
+        write_matsim(
+            population=population, plans_path=str(tmp_path / name), fast=fast, workers=workers,
+            compression=compression, compression_level=level
+        )
+
+
+def test_persons_read_with_source_are_clean():
+    persons = list(stream_matsim_persons(test_tripsv12_path, keep_non_selected=True, keep_source=True))
+    assert persons
+    assert not any(person.dirty for person in persons)
+    assert all(person.source.startswith(b"<person") for person in persons)
+
+
+def test_persons_without_source_are_dirty():
+    persons = list(stream_matsim_persons(test_tripsv12_path))
+    assert all(person.dirty for person in persons)
+
+
+@pytest.mark.parametrize("modify", [
+    lambda person: person.plan.mode_shift(1),
+    lambda person: person.plan.crop(),
+    lambda person: person.attributes.update({'new': 'value'}),
+    lambda person: setattr(person, 'plan', Plan()),
+    lambda person: setattr(person, 'pid', 'new'),
+    lambda person: person.mark_dirty(),
+    lambda person: setattr(person.plan[1], 'mode', 'bike'),
+    lambda person: setattr(person.plan[0], 'act', 'other'),
+    lambda person: setattr(person.plan[0], 'end_time', person.plan[0].end_time + timedelta(minutes=1)),
+    lambda person: setattr(person.plan[0].location, 'link', None),
+    lambda person: person.plan[1].route.clear(),
+    lambda person: person.plan[1].attributes.update({'routingMode': 'bike'}),
+    lambda person: person.plan.day.pop(),
+    lambda person: setattr(person.plan, 'score', 1.0),
+])
+def test_modified_persons_are_dirty(modify):
+    person = next(stream_matsim_persons(test_tripsv12_path, keep_source=True))
+    modify(person)
+    assert person.dirty
+
+
+def test_writer_copies_clean_persons_and_regenerates_dirty(tmp_path):
+    persons = list(stream_matsim_persons(test_tripsv12_path, keep_non_selected=True, keep_source=True))
+    persons[0].attributes['new'] = 'value'
+    stream = BytesIO()
+    with Writer(stream, household_key=None, keep_non_selected=True, fast=True, pass_through=True) as writer:
+        for person in persons:
+            writer.add_person(person)
+    output = stream.getvalue()
+    assert persons[0].source not in output
+    assert b">value</attribute>" in output
+    for person in persons[1:]:
+        assert person.source in output
+
+    path = str(tmp_path / "test.xml")
+    with Writer(path, household_key=None, keep_non_selected=True, fast=True, pass_through=True) as writer:
+        for person in persons:
+            writer.add_person(person)
+    written = list(stream_matsim_persons(path, keep_non_selected=True))
+    assert [p.pid for p in written] == [p.pid for p in persons]
+    assert written[0].attributes['new'] == 'value'
+
+
+def test_writer_pass_through_requires_fast(tmp_path):
+    with pytest.raises(UserWarning):
+        Writer(str(tmp_path / "test.xml"), pass_through=True)
+    with pytest.raises(UserWarning):
+        with Writer(str(tmp_path / "test.xml")) as writer:
+            writer.add_source(b'<person id="a"/>')
+
+
+def test_writer_regenerates_sources_with_dropped_non_selected_plans():
+    persons = list(stream_matsim_persons(test_tripsv12_path, keep_non_selected=True, keep_source=True))
+    assert any(b'selected="no"' in person.source for person in persons)
+    stream = BytesIO()
+    with Writer(stream, household_key=None, keep_non_selected=False, fast=True, pass_through=True) as writer:
+        for person in persons:
+            writer.add_person(person)
+    assert b'selected="no"' not in stream.getvalue()
+
+
+def test_writer_serialises_persons_read_with_source_by_default():
+    persons = list(stream_matsim_persons(test_tripsv12_path, keep_non_selected=True, keep_source=True))
+    expected = BytesIO()
+    with Writer(expected, household_key=None, keep_non_selected=True, fast=True) as writer:
+        for person in stream_matsim_persons(test_tripsv12_path, keep_non_selected=True):
+            writer.add_person(person)
+    stream = BytesIO()
+    with Writer(stream, household_key=None, keep_non_selected=True, fast=True) as writer:
+        for person in persons:
+            writer.add_person(person)
+    outputs = [
+        [line for line in output.getvalue().splitlines() if b"<!--Created" not in line]
+        for output in (stream, expected)
+    ]
+    assert outputs[0] == outputs[1]
+
+
+def test_writer_pass_through_regenerates_persons_with_modified_components():
+    persons = list(stream_matsim_persons(test_tripsv12_path, keep_non_selected=True, keep_source=True))
+    for leg in persons[0].legs:
+        leg.mode = 'bike'
+    stream = BytesIO()
+    with Writer(stream, household_key=None, keep_non_selected=True, fast=True, pass_through=True) as writer:
+        for person in persons:
+            writer.add_person(person)
+    output = stream.getvalue()
+    assert persons[0].source not in output
+    assert b'mode="bike"' in output
+
 def test_read_write_non_selected_plans_inconsistently(tmp_path):
     test_tripsv12_path = os.path.abspath(
         os.path.join(os.path.dirname(__file__),
@@ -429,6 +744,88 @@ def test_writes_od_matrix_to_expected_file(tmpdir):
             assert od_matrix_csv_string == expected_od_matrix
 
 
+
+def od_population():
+    population = Population()
+    for hid, freq, occ, mode, zones in [
+        ('1', 10, 'white', 'car', ['Barnet', 'Ealing']),
+        ('2', 2, 'blue', 'walk', ['Ealing', 'Ealing']),
+        ('3', None, 'blue', 'car', ['Barnet', None]),
+    ]:
+        household = Household(hid=hid, freq=freq)
+        person = Person(pid=hid, attributes={'occ': occ})
+        person.add(Activity(1, 'home', zones[0], start_time=mtdt(0)))
+        person.add(Leg(1, mode, zones[0], zones[1], start_time=mtdt(420), end_time=mtdt(450), purp='work'))
+        person.add(Activity(2, 'work', zones[1], start_time=mtdt(450)))
+        person.add(Leg(2, mode, zones[1], zones[0], start_time=mtdt(1020), end_time=mtdt(1050), purp='home'))
+        person.add(Activity(3, 'home', zones[0], start_time=mtdt(1050), end_time=mtdt(1439)))
+        household.add(person)
+        population.add(household)
+    return population
+
+
+@pytest.mark.parametrize("to_frame", [False, True])
+def test_od_matrices_weighted_segmentations(to_frame):
+    population = od_population()
+    if to_frame:
+        population = population.to_frame()
+    matrices = od_matrices(
+        population, segments=['mode', ('mode', 'purpose'), 'time', 'occ'], time_bands=[(0, 600), (300, 1440)]
+    )
+    assert list(matrices.zones) == ['Barnet', 'Ealing']
+    assert matrices.matrix().values.tolist() == [[0, 10], [10, 4]]
+    assert matrices.keys('mode') == ['car', 'walk']
+    assert matrices.keys(('mode', 'purpose')) == [('car', 'home'), ('car', 'work'), ('walk', 'home'), ('walk', 'work')]
+    assert matrices.matrix('mode', 'walk').values.tolist() == [[0, 0], [0, 4]]
+    assert matrices.matrix(('mode', 'purpose'), 'car', 'work').values.tolist() == [[0, 10], [0, 0]]
+    assert matrices.matrix('time', '0_to_600').values.tolist() == [[0, 10], [0, 2]]
+    assert matrices.matrix('time', '300_to_1440').values.tolist() == [[0, 10], [10, 4]]
+    assert matrices.matrix('occ', 'blue', compact=True).values.tolist() == [[4]]
+    table = matrices.table('mode')
+    assert table.to_dict('records') == [
+        {'mode': 'car', 'origin': 'Barnet', 'destination': 'Ealing', 'value': 10.0},
+        {'mode': 'car', 'origin': 'Ealing', 'destination': 'Barnet', 'value': 10.0},
+        {'mode': 'walk', 'origin': 'Ealing', 'destination': 'Ealing', 'value': 4.0},
+    ]
+
+
+def test_od_matrices_unweighted_counts_legs():
+    matrices = od_matrices(od_population(), weighted=False)
+    assert matrices.matrix().values.tolist() == [[0, 1], [1, 2]]
+
+
+def test_od_matrices_time_requires_bands():
+    with pytest.raises(UserWarning):
+        od_matrices(od_population(), segments=['time'])
+
+
+def test_od_matrices_to_npz(tmp_path):
+    matrices = od_matrices(od_population(), segments=['mode'])
+    matrices.to_npz(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ['mode_od.npz', 'total_od.npz']
+    data = np.load(str(tmp_path / 'mode_od.npz'))
+    assert data['zones'].tolist() == ['Barnet', 'Ealing']
+    assert data['segment_mode'].tolist() == ['car', 'car', 'walk']
+    assert data['origin'].tolist() == [0, 1, 1]
+    assert data['destination'].tolist() == [1, 0, 1]
+    assert data['value'].tolist() == [10, 10, 4]
+
+
+def test_od_matrices_to_parquet(tmp_path):
+    pytest.importorskip("pyarrow")
+    matrices = od_matrices(od_population(), segments=[('mode', 'purpose')])
+    matrices.to_parquet(str(tmp_path))
+    df = pd.read_parquet(str(tmp_path / 'mode_purpose_od.parquet'))
+    assert df.astype({'origin': str, 'destination': str}).equals(
+        matrices.table(('mode', 'purpose')).astype({'origin': str, 'destination': str})
+    )
+
+
+def test_write_od_matrices_weighted(tmp_path):
+    write_od_matrices(od_population(), str(tmp_path), leg_filter='Mode', weighted=True)
+    assert open(tmp_path / 'walk_od.csv').read() == 'Origin,Ealing\nEaling,4.0\n'
+
+
 def test_write_to_csv_no_locs(population_heh, tmpdir):
     for _, _, person in population_heh.people():
         for act in person.activities:
@@ -665,9 +1062,139 @@ def test_write_to_csv_convert_locs(population_heh, tmpdir):
     assert len(acts_df) == 3
 
 
+@pytest.mark.parametrize("chunk_size", [1, 2, 100])
+def test_write_to_csv_in_chunks_matches_to_csv(tmp_path, chunk_size):
+    population = read_population_without_locs()
+    write.to_csv(population, str(tmp_path / "expected"))
+    write.to_csv(population, str(tmp_path / "chunked"), chunk_size=chunk_size)
+    for name in ['households', 'people', 'legs', 'activities']:
+        assert (tmp_path / "chunked" / f"{name}.csv").read_text() == \
+            (tmp_path / "expected" / f"{name}.csv").read_text()
+
+
+def test_write_tables_from_streamed_persons(tmp_path):
+    test_tripsv12_path = os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml")
+    )
+    population = read_matsim(test_tripsv12_path, version=12)
+    write.to_tables(population, str(tmp_path / "expected"), chunk_size=2, geometry=False)
+    persons = stream_matsim_persons(test_tripsv12_path, version=12)
+    write.to_tables(persons, str(tmp_path / "streamed"), chunk_size=2, geometry=False)
+    for name in ['people', 'legs', 'activities']:
+        assert (tmp_path / "streamed" / f"{name}.csv").read_text() == \
+            (tmp_path / "expected" / f"{name}.csv").read_text()
+    hh_df = pd.read_csv(tmp_path / "streamed" / "households.csv")
+    assert list(hh_df.hid) == ['chris', 'fatema', 'fred', 'gerry', 'nick']
+
+
+def test_write_tables_groups_streamed_persons_by_household_key(tmp_path):
+    persons = [Person('a', attributes={'hid': 'A'}), Person('b', attributes={'hid': 'A'}), Person('c')]
+    for person in persons:
+        person.add(Activity(1, 'home', 'zone', start_time=mtdt(0), end_time=END_OF_DAY))
+    write.to_tables(persons, str(tmp_path), household_key='hid', geometry=False)
+    hh_df = pd.read_csv(tmp_path / "households.csv")
+    assert list(hh_df.hid) == ['A', 'c']
+    people_df = pd.read_csv(tmp_path / "people.csv")
+    assert list(people_df.hid) == ['A', 'A', 'c']
+
+
+def test_write_tables_keeps_columns_not_in_first_chunk(tmp_path):
+    population = read_population_without_locs()
+    population['nick']['nick'].attributes['new'] = 1
+    write.to_csv(population, str(tmp_path / "expected"))
+    write.to_csv(population, str(tmp_path / "chunked"), chunk_size=2)
+    assert (tmp_path / "chunked" / "people.csv").read_text() == (tmp_path / "expected" / "people.csv").read_text()
+    assert 'new' in pd.read_csv(tmp_path / "chunked" / "people.csv").columns
+
+
+def test_write_tables_streamed_columns_not_in_first_chunk_fail(tmp_path):
+    persons = [Person('a'), Person('b', attributes={'new': 1})]
+    for person in persons:
+        person.add(Activity(1, 'home', 'zone', start_time=mtdt(0), end_time=END_OF_DAY))
+    with pytest.raises(UserWarning):
+        write.to_tables(persons, str(tmp_path), chunk_size=1, geometry=False)
+
+
+def test_write_tables_parquet_keeps_types(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    population = read_population_without_locs()
+    population['chris'].attributes = {'size': None, 'flag': True}
+    population['nick'].attributes = {'size': 2, 'flag': False}
+    population['nick']['nick'].attributes['mixed'] = 1.5
+    population['chris']['chris'].attributes['mixed'] = 1
+    write.to_tables(population, str(tmp_path), chunk_size=1, format='parquet')
+    schema = {
+        name: pq.read_schema(tmp_path / f"{name}.parquet")
+        for name in ['households', 'people', 'legs', 'activities']
+    }
+    assert str(schema['households'].field('size').type) == 'int64'
+    assert str(schema['households'].field('flag').type) == 'bool'
+    assert str(schema['people'].field('mixed').type) == 'double'
+    assert str(schema['legs'].field('seq').type) == 'int64'
+    assert str(schema['legs'].field('tst').type) == 'timestamp[us]'
+    assert str(schema['activities'].field('activity').type) == 'string'
+    assert pq.read_table(tmp_path / "households.parquet").column('size').to_pylist() == [None, None, None, None, 2]
+
+
+def test_write_tables_flatgeobuf_in_chunks(tmp_path):
+    population = read_matsim(test_tripsv12_path, version=12)
+    write.to_tables(population, str(tmp_path), crs="EPSG:27700", chunk_size=2)
+    counts = {
+        name: len(gp.read_file(tmp_path / f"{name}.fgb"))
+        for name in ['households', 'people', 'legs', 'activities']
+    }
+    assert counts == {'households': 5, 'people': 5, 'legs': 18, 'activities': 23}
+    legs = gp.read_file(tmp_path / "legs.fgb")
+    assert legs.crs.to_epsg() == 4326
+    assert sorted(legs['mode']) == sorted(leg.mode for _, _, person in population.people() for leg in person.legs)
+
+
+def test_write_tables_unknown_format(tmp_path):
+    with pytest.raises(UserWarning):
+        write.to_tables(Population(), str(tmp_path), format='xlsx')
+
+
+def test_write_tables_empty_population(tmp_path):
+    write.to_tables(Population(), str(tmp_path))
+    for name in ['households', 'people', 'legs', 'activities']:
+        assert (tmp_path / f"{name}.csv").read_text() == ""
+
+
+def test_write_tables_parquet(tmp_path):
+    pytest.importorskip("pyarrow")
+    population = read_population_without_locs()
+    write.to_csv(population, str(tmp_path / "csv"))
+    write.to_tables(population, str(tmp_path / "parquet"), chunk_size=2, format='parquet')
+    for name, index in [('households', 'hid'), ('people', 'pid'), ('legs', None), ('activities', None)]:
+        expected = pd.read_csv(tmp_path / "csv" / f"{name}.csv", index_col=0)
+        df = pd.read_parquet(tmp_path / "parquet" / f"{name}.parquet")
+        if index is not None:
+            df = df.set_index(index)
+        assert list(df.columns) == list(expected.columns)
+        assert list(df.index) == list(expected.index)
+        if name == 'legs':
+            assert list(df['mode']) == list(expected['mode'])
+            assert list(df.seq) == list(expected.seq)
+            assert df.tst.dtype.kind == 'M'
+
+
 ###########################################################
 # helper functions
 ###########################################################
+def read_population_without_locs():
+    test_tripsv12_path = os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml")
+    )
+    population = read_matsim(test_tripsv12_path, version=12)
+    for _, _, person in population.people():
+        for act in person.activities:
+            act.location.loc = None
+        for leg in person.legs:
+            leg.start_location.loc = None
+            leg.end_location.loc = None
+    return population
+
+
 def get_all_people_attributes(population):
     attribute_names = set()
     for hid, pid, person in population.people():
@@ -1,6 +1,7 @@
 import pytest
 import random
 import pandas as pd
+import numpy as np
 import geopandas as gp
 from shapely.geometry import Polygon, Point, LinearRing, LineString, MultiLineString, MultiPolygon, MultiPoint
 from types import GeneratorType
@@ -327,7 +328,30 @@ def test_inf_yield_weighted_random_seed(fixed_seed):
     candidates = [1,2,3]
     weights = pd.Series(data=[0.1,0.2,0.7],index=[1,2,3])
     sampler = facility.inf_yielder(candidates,weights=weights,seed=fixed_seed)
-    assert [next(sampler(None,None,None)) for i in range(3)] == [3, 3, 3]
+    assert [next(sampler(None,None,None)) for i in range(3)] == [2, 2, 2]
+    samples = sampler(None,None,None)
+    samples2 = sampler(None,None,None)
+    assert [next(samples) for i in range(50)] == [next(samples2) for i in range(50)]
+    assert set([next(samples) for i in range(50)]) == set(candidates)
+
+def test_inf_yield_weighted_generator(fixed_seed):
+    candidates = [1,2,3]
+    weights = pd.Series(data=[0.1,0.0,0.9],index=[1,2,3])
+    sampler = facility.inf_yielder_weighted(candidates, weights, None, None, None, None, None, None, None, seed=fixed_seed)
+    assert set([next(sampler) for i in range(50)]) == {1, 3}
+
+def test_alias_table_frequencies():
+    weights = [0.0, 1.0, 2.0, 7.0, 0.0, 10.0]
+    table = facility.AliasTable(weights)
+    rng = np.random.default_rng(1)
+    counts = np.bincount([table.sample(rng) for i in range(20000)], minlength=len(weights))
+    assert counts[0] == counts[4] == 0
+    assert np.allclose(counts / counts.sum(), np.array(weights) / sum(weights), atol=0.01)
+
+@pytest.mark.parametrize("weights", [[], [0, 0], [1, -1], [1, np.nan]])
+def test_alias_table_invalid_weights(weights):
+    with pytest.raises(UserWarning):
+        facility.AliasTable(weights)
 
 def test_facility_dict_build():
 
@@ -457,6 +481,27 @@ def test_facility_sampler_weighted():
     assert sampler.sample(0, 'home') == Point((1.5,1.5))
 
 
+def test_facility_sampler_weighted_fixed_seed(fixed_seed):
+    facility_df = pd.DataFrame({'id':[1,2,3,4], 'activity': ['home','home','home','home'], 'floorspace': [100,200,700,100]})
+    points = [Point((0.5,0.5)), Point((1,1)), Point((1.5,1.5)), Point((3,3))]
+    facility_gdf = gp.GeoDataFrame(facility_df, geometry=points)
+
+    zones_df = pd.DataFrame({'a':[1,2], 'b': [4,5]})
+    polys = [
+        Polygon(((0,0), (0,2), (2,2), (2,0))),
+        Polygon(((2,2), (2,4), (4,4), (4,2))),
+    ]
+    zones_gdf = gp.GeoDataFrame(zones_df, geometry=polys)
+
+    samples = []
+    for i in range(2):
+        sampler = facility.FacilitySampler(facility_gdf, zones_gdf, ['home'], weight_on='floorspace', seed=fixed_seed)
+        samples.append([sampler.sample(0, 'home') for i in range(30)])
+    assert samples[0] == samples[1]
+    # draws are not reseeded
+    assert set((p.x, p.y) for p in samples[0]) == {(0.5,0.5), (1,1), (1.5,1.5)}
+
+
 def test_facility_sampler_weighted_maxwalk():
     # amongst three workplace alternatives, only one is within walking distance from a PT stop:
     facility_df = pd.DataFrame({'id':[1,2,3,4], 'activity': ['work','work','work','education'], 'floorspace': [100000,200000,700,100],
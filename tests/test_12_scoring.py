@@ -147,3 +147,15 @@ def test_scores_experienced(config_complex):
         matsim_score = person.plan.score
         pam_score = scorer.score_person(person)
         assert abs(matsim_score - pam_score) < 0.1
+
+
+def test_scores_int_times(config_complex):
+    population = read_matsim(test_experienced_plans_path, version = 12, crop = False)
+    int_population = read_matsim(test_experienced_plans_path, version = 12, crop = False, int_times = True)
+    scorer = CharyparNagelPlanScorer(config_complex)
+    for hid, pid, person in population.people():
+        int_person = int_population[hid][pid]
+        for p in [person, int_person]:
+            p.attributes.setdefault('subpopulation', 'default')
+        assert all(component.int_times for component in int_person.plan)
+        assert scorer.score_person(int_person) == pytest.approx(scorer.score_person(person))
@@ -506,4 +506,15 @@ def test_plans_to_cat():
         encoded,
         np.array([0]*10 + [1] + [2]*13)
     )
-    assert encoder.get_act(0) == "home"
\ No newline at end of file
+    assert encoder.get_act(0) == "home"
+
+def test_int_times_plan_to_array():
+    plan = Plan()
+    plan.add(Activity(act="home", area="A", start_time=0, end_time=36000))
+    plan.add(Leg(mode="walk", start_area="A", end_area="B", start_time=36000, end_time=43200))
+    plan.add(Activity(act="work", area="B", start_time=43200, end_time=86400))
+    expected = np.array([0] * 10 + [2] * 2 + [1] * 12)
+    encoded = encode.plan_to_one_hot(plan=plan, mapping={"home":0, "work":1, "travel":2})
+    np.testing.assert_array_equal(encoded.argmax(axis=1), expected)
+    plan.set_int_times(False)
+    np.testing.assert_array_equal(encode.plan_to_one_hot(plan=plan, mapping={"home":0, "work":1, "travel":2}), encoded)
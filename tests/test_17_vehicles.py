@@ -1,3 +1,5 @@
+import copy
+import pickle
 import pytest
 import lxml
 import os
@@ -5,8 +7,9 @@ import logging
 from pam.core import Person, Population, Household
 from pam.vehicle import Vehicle, ElectricVehicle, VehicleType
 from pam import PAMVehicleIdError
-from pam.write import write_vehicles, write_all_vehicles, write_electric_vehicles
-from pam.read import read_matsim, read_all_vehicles_file, read_electric_vehicles_file
+from pam.write import write_vehicles, write_all_vehicles, write_electric_vehicles, VehiclesWriter
+from pam.read import read_matsim, read_all_vehicles_file, read_electric_vehicles_file, read_vehicles
+from pam.read import read_vehicle_types, stream_vehicles, stream_electric_vehicles
 
 
 def test_instantiating_vehicle_without_id_fails():
@@ -359,3 +362,72 @@ def test_reading_population_with_all_vehicle_file_defaults_to_vehicle_class(
     )
     for person in ['Eddy', 'Stevie', 'Vladya']:
         pop.get(person).people[person].vehicle = expected_all_vehicle_xml_output[person]
+
+
+def test_vehicle_registry_tracks_assigned_vehicles(population_with_default_vehicles):
+    registry = population_with_default_vehicles.vehicle_registry
+    assert registry.num_vehicles == 2
+    person = population_with_default_vehicles['1']['Bobby']
+    person.assign_vehicle(ElectricVehicle('Bobby'))
+    assert registry.num_vehicles == 3
+    assert population_with_default_vehicles.has_electric_vehicles
+    person.vehicle = None
+    assert registry.num_vehicles == 2
+    assert not population_with_default_vehicles.has_electric_vehicles
+    assert set(population_with_default_vehicles.vehicle_types()) == {VehicleType('defaultVehicleType')}
+
+
+def test_vehicle_registry_tracks_persons_added_to_households(population_without_vehicles, person_with_electric_vehicle):
+    population_without_vehicles['1'].add(person_with_electric_vehicle)
+    assert population_without_vehicles.has_electric_vehicles
+    population_without_vehicles.add(Household(hid='1'))
+    assert not population_without_vehicles.has_vehicles
+    person_with_electric_vehicle.assign_vehicle(ElectricVehicle('Eddy', battery_capacity=10))
+    assert not population_without_vehicles.has_vehicles
+
+
+def test_vehicle_registry_matches_rebuild(population_with_electric_vehicles):
+    population = population_with_electric_vehicles
+    population += copy.deepcopy(population)
+    type_counts = dict(population.vehicle_registry.type_counts)
+    population.rebuild_vehicle_registry()
+    assert population.vehicle_registry.type_counts == type_counts
+    assert population.vehicle_registry.num_vehicles == len(list(population.vehicles()))
+
+
+def test_vehicle_registry_is_rebuilt_after_unpickling(population_with_electric_vehicles):
+    population = pickle.loads(pickle.dumps(population_with_electric_vehicles))
+    assert population.vehicle_registry.num_electric_vehicles == 1
+    population['3']['Eddy'].vehicle = None
+    assert not population.has_electric_vehicles
+
+
+def test_streaming_vehicles_matches_read_vehicles(all_vehicle_xml_path, electric_vehicles_xml_path):
+    vehicles = list(stream_vehicles(all_vehicle_xml_path, electric_vehicles_xml_path))
+    assert {v.id: v for v in vehicles} == read_vehicles(all_vehicle_xml_path, electric_vehicles_xml_path)
+    assert [v.id for v in vehicles] == ['Eddy', 'Stevie', 'Vladya']
+
+
+def test_streaming_electric_vehicles_uses_vehicle_types(all_vehicle_xml_path, electric_vehicles_xml_path):
+    vehicle_types = read_vehicle_types(all_vehicle_xml_path)
+    assert set(vehicle_types) == {'defaultVehicleType', 'defaultElectricVehicleType'}
+    assert list(stream_electric_vehicles(electric_vehicles_xml_path, vehicle_types)) == [
+        ElectricVehicle('Eddy', vehicle_types['defaultElectricVehicleType'])
+    ]
+
+
+def test_vehicles_writer_streams_vehicles_files(tmpdir, all_vehicle_xml_path, electric_vehicles_xml_path):
+    vehicle_types = read_vehicle_types(all_vehicle_xml_path)
+    with VehiclesWriter(tmpdir, vehicle_types.values()) as writer:
+        for vehicle in stream_vehicles(all_vehicle_xml_path, electric_vehicles_xml_path):
+            writer.add_vehicle(vehicle)
+    assert writer.num_vehicles == 3
+    assert writer.num_electric_vehicles == 1
+    assert read_vehicles(os.path.join(tmpdir, 'all_vehicles.xml'), os.path.join(tmpdir, 'electric_vehicles.xml')) == \
+        read_vehicles(all_vehicle_xml_path, electric_vehicles_xml_path)
+
+
+def test_vehicles_writer_without_vehicle_type_fails(tmpdir):
+    with pytest.raises(UserWarning):
+        with VehiclesWriter(tmpdir, [VehicleType('small')]) as writer:
+            writer.add_vehicle(Vehicle('a'))
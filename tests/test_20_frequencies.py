@@ -0,0 +1,169 @@
+import copy
+import os
+import pickle
+
+import pandas as pd
+import pytest
+
+from pam.activity import Activity, Leg
+from pam.core import Household, Person, Population
+from pam.frequencies import FrequencyTables
+from pam.read import load_travel_diary, read_matsim
+from pam.utils import minutes_to_datetime as mtdt
+
+test_plans = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml")
+)
+test_trips = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/simple_travel_diaries.csv")
+)
+
+
+def make_person(pid, act, mode):
+    person = Person(pid)
+    person.add(Activity(1, 'home', 'a', start_time=mtdt(0), end_time=mtdt(60)))
+    person.add(Leg(1, mode, 'a', 'b', start_time=mtdt(60), end_time=mtdt(90), purp=act))
+    person.add(Activity(2, act, 'b', start_time=mtdt(90), end_time=mtdt(120)))
+    person.add(Leg(2, mode, 'b', 'a', start_time=mtdt(120), end_time=mtdt(150), purp='home'))
+    person.add(Activity(3, 'home', 'a', start_time=mtdt(150), end_time=mtdt(24 * 60 - 1)))
+    return person
+
+
+def make_household(hid, *persons):
+    household = Household(hid)
+    for person in persons:
+        household.add(person)
+    return household
+
+
+def scan(population, field):
+    counts = {}
+    kind = Activity if field == 'act' else Leg
+    for _, _, person in population.people():
+        for component in person.plan:
+            value = getattr(component, field) if isinstance(component, kind) else None
+            if value is not None:
+                counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+def assert_matches_scan(population):
+    assert population.frequencies.activities == scan(population, 'act')
+    assert population.frequencies.modes == scan(population, 'mode')
+    assert population.frequencies.purposes == scan(population, 'purp')
+
+
+@pytest.fixture
+def population():
+    population = Population()
+    population.add(make_household('1', make_person('a', 'work', 'car'), make_person('b', 'shop', 'walk')))
+    population.add(make_household('2', make_person('c', 'work', 'bus')))
+    return population
+
+
+def test_frequencies_count_selected_plans(population):
+    assert population.frequencies.activities == {'home': 6, 'work': 2, 'shop': 1}
+    assert population.frequencies.modes == {'car': 2, 'walk': 2, 'bus': 2}
+    assert population.frequencies.purposes == {'home': 3, 'work': 2, 'shop': 1}
+    assert population.frequencies.classes('act') == population.activity_classes
+    assert population.frequencies.classes('mode') == population.mode_classes
+
+
+def test_frequencies_codes_are_stable(population):
+    tables = population.frequencies
+    home = tables.code('act', 'home')
+    assert tables.decode('act', home) == 'home'
+    population.add(make_household('2', make_person('d', 'school', 'walk')))
+    assert 'bus' not in tables.modes
+    assert tables.code('act', 'home') == home
+    assert tables.decode('mode', tables.code('mode', 'bus')) == 'bus'
+
+
+def test_frequencies_follow_added_and_replaced_households(population):
+    population.frequencies.activities
+    population.add(make_household('2', make_person('d', 'school', 'walk')))
+    population.add(make_household('3', make_person('e', 'work', 'car')))
+    assert population.frequencies.activities == {'home': 8, 'work': 2, 'shop': 1, 'school': 1}
+    assert_matches_scan(population)
+
+
+def test_frequencies_follow_persons_added_to_households(population):
+    population.frequencies.modes
+    population['2'].add(make_person('d', 'school', 'ferry'))
+    household = population['1']
+    household += make_person('a', 'leisure', 'bike')
+    assert population.frequencies.modes == {'walk': 2, 'bus': 2, 'ferry': 2, 'bike': 2}
+    assert_matches_scan(population)
+
+
+def test_frequencies_follow_added_populations(population):
+    other = Population()
+    other.add(make_household('3', make_person('d', 'school', 'ferry')))
+    population.frequencies.modes
+    population += other
+    assert_matches_scan(population)
+
+
+def test_frequencies_count_plans_filled_after_adding_household():
+    population = Population()
+    person = Person('a')
+    population.add(make_household('1', person))
+    for component in make_person('b', 'work', 'car').plan:
+        person.add(component)
+    assert population.frequencies.modes == {'car': 2}
+
+
+def test_refreshed_frequencies_follow_plans_modified_in_place(population):
+    population.frequencies.activities
+    population['2']['c'].plan[2].act = 'education'
+    assert population.frequencies.activities['work'] == 2
+    population.refresh_frequencies(['2'])
+    assert population.frequencies.activities == {'home': 6, 'work': 1, 'shop': 1, 'education': 1}
+    assert_matches_scan(population)
+
+
+def test_rebuilt_frequencies_follow_households_removed_directly(population):
+    population.frequencies.activities
+    del population.households['2']
+    population.rebuild_frequencies()
+    assert_matches_scan(population)
+
+
+def test_removed_household_is_discounted():
+    tables = FrequencyTables()
+    household = make_household('1', make_person('a', 'work', 'car'))
+    tables.add(household)
+    assert tables.modes == {'car': 2}
+    tables.remove(household)
+    assert tables.modes == {}
+
+
+@pytest.mark.parametrize(
+    "duplicate", [lambda p: pickle.loads(pickle.dumps(p)), copy.deepcopy], ids=["pickle", "deepcopy"]
+)
+def test_frequencies_are_rebuilt_for_copied_population(population, duplicate):
+    population.frequencies.activities
+    population = duplicate(population)
+    assert_matches_scan(population)
+    population['2'].add(make_person('d', 'school', 'ferry'))
+    assert_matches_scan(population)
+
+
+def test_read_matsim_frequencies_match_scan():
+    population = read_matsim(test_plans, version=12)
+    assert population.frequencies.activities
+    assert_matches_scan(population)
+
+
+def test_load_travel_diary_frequencies_match_scan():
+    population = load_travel_diary(pd.read_csv(test_trips))
+    assert population.frequencies.modes
+    assert_matches_scan(population)
+
+
+def test_values_coded_before_counting_are_counted(population):
+    tables = population.frequencies
+    tables.code('mode', 'ferry')
+    tables.code('mode', 'tram')
+    population['2'].add(make_person('d', 'school', 'bike'))
+    assert tables.modes == {'car': 2, 'walk': 2, 'bus': 2, 'bike': 2}
@@ -0,0 +1,160 @@
+import os
+
+import numpy as np
+import pytest
+
+from pam.activity import Plan
+from pam.frame import PopulationFrame
+from pam.plot.stats import extract_activity_log, extract_leg_log
+from pam.read import load_travel_diary, read_matsim
+from pam.report.benchmarks import benchmarks
+from pam.report.summary import count_activites, count_modes
+from pam.write import write_od_matrices
+from .fixtures import population_heh
+
+
+test_tripsv12_path = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "test_data/test_matsim_plansv12.xml")
+)
+LOCATION_COLUMNS = ['hzone', 'oloc', 'dloc', 'ox', 'oy', 'dx', 'dy']
+
+
+@pytest.fixture
+def population():
+    return read_matsim(test_tripsv12_path, version=12)
+
+
+@pytest.fixture(params=["matsim", "heh"])
+def populations(request, population, population_heh):
+    if request.param == "matsim":
+        return population
+    for _, _, person in population_heh.people():
+        person.set_freq(2)
+    return population_heh
+
+
+def assert_same_records(expected, result):
+    assert [c for c in expected.columns if c not in LOCATION_COLUMNS] \
+        == [c for c in result.columns if c not in LOCATION_COLUMNS]
+    assert len(expected) == len(result)
+    for column in expected.columns:
+        if column not in LOCATION_COLUMNS:
+            assert expected[column].astype(str).tolist() == result[column].astype(str).tolist(), column
+
+
+def test_frame_offsets(population):
+    frame = population.to_frame()
+    assert len(frame) == 5
+    assert frame.stats == population.stats
+    for p, (_, _, person) in enumerate(population.people()):
+        acts = frame.activities.iloc[frame.activity_offsets[p]:frame.activity_offsets[p + 1]]
+        assert list(acts.act) == [a.act for a in person.activities]
+        legs = frame.legs.iloc[frame.leg_offsets[p]:frame.leg_offsets[p + 1]]
+        assert list(legs.start_s) == [leg.start_s for leg in person.legs]
+
+
+def test_frame_round_trip(populations):
+    frame = PopulationFrame.from_population(populations)
+    assert frame.to_population() == populations
+    for int_times in [False, True]:
+        population = frame.to_population(int_times=int_times)
+        for (_, _, expected), (_, _, person) in zip(populations.people(), population.people()):
+            assert all(c.int_times == int_times for c in person.plan)
+            assert [(c.start_time, c.end_time) for c in expected.plan] \
+                == [(c.start_time, c.end_time) for c in person.plan]
+            assert expected.attributes == person.attributes
+
+
+def test_frame_round_trip_does_not_share_attributes_or_routes(population):
+    frame = population.to_frame()
+    rebuilt = frame.to_population()
+    for _, _, person in rebuilt.people():
+        person.attributes['new'] = 'value'
+        for leg in person.legs:
+            if leg.attributes:
+                leg.attributes['new'] = 'value'
+            if leg.route.exists:
+                leg.route.start_link = 'new'
+    for household in rebuilt.households.values():
+        household.attributes['new'] = 'value'
+
+    for population in [population, frame.to_population()]:
+        assert not any('new' in household.attributes for household in population.households.values())
+        for _, _, person in population.people():
+            assert 'new' not in person.attributes
+            assert not any('new' in leg.attributes for leg in person.legs)
+            assert not any(leg.route.start_link == 'new' for leg in person.legs)
+
+
+def test_frame_legs_df_matches_population(populations):
+    assert_same_records(populations.legs_df(), populations.to_frame().legs_df())
+
+
+def test_frame_trips_df_matches_population(populations):
+    assert_same_records(populations.trips_df(), populations.to_frame().trips_df())
+
+
+def test_frame_trips_df_modes_use_euclidean_distance_of_nan_legs():
+    population = read_matsim(os.path.join(os.path.dirname(__file__), "test_data/1.plans.xml"))
+    frame = population.to_frame()
+    assert np.isnan(population['hwh_bus']['hwh_bus'].plan[9].distance)
+    trips = frame.trips_df()
+    assert list(trips[trips.pid == 'hwh_bus']['mode']) == ['bus', 'bus']
+    population = frame.to_population()
+    assert list(population.trips_df().query("pid == 'hwh_bus'")['mode']) == ['bus', 'bus']
+
+
+def test_frame_trips_df_locations(population_heh):
+    trips = population_heh.to_frame().trips_df()
+    assert list(trips.ox) == [0, 110]
+    assert list(trips.dy) == [110, 0]
+    assert list(trips.hzone) == ['a', 'a']
+
+
+def test_frame_summary_counts_match_population(populations):
+    frame = populations.to_frame()
+    assert count_activites(frame) == count_activites(populations)
+    assert count_modes(frame) == count_modes(populations)
+    for key, value in [('inc', 'high'), ('subpopulation', 'rich')]:
+        assert count_activites(frame, key, value) == count_activites(populations, key, value)
+        assert count_modes(frame, key, value) == count_modes(populations, key, value)
+
+
+def test_frame_logs_match_population(populations):
+    frame = populations.to_frame()
+    np.testing.assert_array_equal(extract_activity_log(frame).values, extract_activity_log(populations).values)
+    np.testing.assert_array_equal(extract_leg_log(frame).values, extract_leg_log(populations).values)
+
+
+def test_frame_benchmarks_match_population(population):
+    for (name, expected), (other, result) in zip(benchmarks(population), benchmarks(population.to_frame())):
+        assert name == other
+        assert expected.astype(str).equals(result.astype(str))
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"leg_filter": "Mode"}, {"time_minutes_filter": [(0, 600)]}])
+def test_frame_od_matrices_match_population(tmp_path, population_heh, kwargs):
+    write_od_matrices(population_heh, str(tmp_path / "population"), **kwargs)
+    write_od_matrices(population_heh.to_frame(), str(tmp_path / "frame"), **kwargs)
+    names = sorted(os.listdir(tmp_path / "population"))
+    assert names == sorted(os.listdir(tmp_path / "frame"))
+    for name in names:
+        assert (tmp_path / "population" / name).read_text() == (tmp_path / "frame" / name).read_text()
+
+
+def test_frame_infer_activities_from_tour_purpose_matches_plans(monkeypatch):
+    diary = os.path.abspath(os.path.join(os.path.dirname(__file__), "test_data/simple_travel_diaries.csv"))
+    with monkeypatch.context() as patch:  # read plans without inferring activities
+        patch.setattr(Plan, "infer_activities_from_tour_purpose", lambda self: None)
+        patch.setattr(Plan, "set_leg_purposes", lambda self: None)
+        population = load_travel_diary(diary)
+    frame = population.to_frame()
+    assert frame.activities.act.isna().all()
+
+    frame.infer_activities_from_tour_purpose()
+    for _, _, person in population.people():
+        person.plan.infer_activities_from_tour_purpose()
+    assert frame.activities.act.tolist() == [
+        act.act for _, _, person in population.people() for act in person.activities
+    ]
+    assert [act.act for act in population[1][4].activities] == ['home', 'work', 'work', 'work', 'work', 'home']